@@ -26,7 +26,10 @@ from backend.routes.bus_routes import bus_bp
 from backend.routes.chatbot import chatbot_bp
 from backend.routes.auth import auth_bp, setup_oauth  # Import setup_oauth từ auth mới
 from backend.routes.transport_routes import transport_bp
+from backend.routes.jobs import jobs_bp
 from backend.routes.bus_manager import bus_data
+from backend.utils.user_cache import get_user_row
+from backend.utils.job_queue import job_queue
 
 # Import database và models
 from database.supabase_client import supabase
@@ -68,11 +71,13 @@ def load_user(user_id):
     Được gọi mỗi khi cần xác thực user từ session
     """
     try:
-        # Query user từ Supabase
-        result = supabase.table("users").select("*").eq("user_id", user_id).execute()
-        
-        if result.data and len(result.data) > 0:
-            user_row = result.data[0]
+        # Query user từ Supabase (cache ngắn hạn theo user_id -> không query mỗi request)
+        def fetch_user_row():
+            result = supabase.table("users").select("*").eq("user_id", user_id).execute()
+            return result.data[0] if result.data else None
+
+        user_row = get_user_row(user_id, fetch_user_row)
+        if user_row:
             return users(
                 user_id=user_row["user_id"],
                 email=user_row["email"],
@@ -107,8 +112,12 @@ app.register_blueprint(chatbot_bp)       # Chatbot routes
 app.register_blueprint(form_bp)          # Form routes
 app.register_blueprint(bus_bp)           # Bus routes
 app.register_blueprint(transport_bp)     # Transport routes
+app.register_blueprint(jobs_bp)          # Background job status/result (/api/jobs/...)
 app.register_blueprint(create_api_blueprint(None))  # A* routing API
 
+# Task nền đã đăng ký (import blueprint) -> chạy consumer ngay để nhận job còn tồn sau restart
+job_queue.start()
+
 # ========== ROUTES HTML ==========
 
 @app.route('/')
@@ -0,0 +1,198 @@
+"""
+ASGI APP - Chế độ phục vụ async cho các endpoint chủ yếu chờ I/O
+Features:
+  - Chat (/api/chat, /api/chat/stream): await Gemini (send_message_async), không giữ 1 thread / request
+  - Reverse geocode (/api/geocode?lat=&lon=): await Nominatim qua client async dùng chung
+  - Phần tính toán nặng / code sync (chuẩn bị context, tìm bus, geocode xuôi) chạy trong threadpool
+  - Mọi route còn lại: Flask app gốc mount qua a2wsgi (pool ASGI_WSGI_THREADS thread, chạy song song)
+    + auth (sync-session...): ghi session cookie của Flask-Login -> phải chạy trong Flask
+    + feedback, tìm bus, lập lộ trình: chủ yếu là tính toán / truy vấn Supabase sync; lộ trình nhiều
+      điểm đã đi qua job queue (/api/jobs) nên không giữ thread lâu
+
+Chạy:  uvicorn backend.asgi:app --host 0.0.0.0 --port 5000
+Nhiều worker: session chat / job queue mặc định nằm trong bộ nhớ process -> bắt buộc
+  CHAT_SESSION_BACKEND=redis và JOB_QUEUE_BACKEND=redis, số worker đặt bằng
+  WEB_CONCURRENCY=N (uvicorn cũng đọc biến này). --workers / -w trên dòng lệnh cũng được kiểm tra
+  (thiếu Redis -> app từ chối khởi động)
+(Flask thuần vẫn chạy bình thường bằng app.py / gunicorn)
+"""
+
+import os
+import sys
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.app import app as flask_app
+from backend.routes.chatbot import chat_sessions, prepare_chat_turn, sse_event, validate_chat_request
+from backend.routes.routing import GEOCODER
+from backend.utils.http_client import async_http_get, http
+from backend.utils.job_queue import job_queue
+
+# Số thread chạy request Flask (WsgiToAsgi của asgiref dồn mọi request vào 1 thread)
+WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", 16))
+
+
+def _worker_count() -> int:
+    """WEB_CONCURRENCY hoặc --workers N / -w N (uvicorn, gunicorn giữ nguyên argv cho worker con)"""
+    count = int(os.getenv("WEB_CONCURRENCY", 1))
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        value = None
+        if arg in ("--workers", "-w") and i + 1 < len(args):
+            value = args[i + 1]
+        elif arg.startswith("--workers="):
+            value = arg.split("=", 1)[1]
+        if value and value.isdigit():
+            count = max(count, int(value))
+    return count
+
+
+WEB_CONCURRENCY = _worker_count()
+
+if WEB_CONCURRENCY > 1:
+    # Worker khác không thấy session / job trong bộ nhớ của worker này
+    backends = {"CHAT_SESSION_BACKEND": chat_sessions.get_stats()["backend"],
+                "JOB_QUEUE_BACKEND": job_queue.get_stats()["backend"]}
+    missing = [name for name, backend in backends.items() if backend != "redis"]
+    if missing:
+        raise RuntimeError(f"{WEB_CONCURRENCY} worker cần Redis cho: {', '.join(missing)} "
+                           f"(đặt =redis và kiểm tra kết nối, hoặc chạy 1 worker)")
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization",
+}
+
+
+def cors(endpoint):
+    """CORS cho route async (Flask-CORS chỉ áp cho phần Flask)"""
+    async def wrapper(request):
+        if request.method == "OPTIONS":
+            return Response(status_code=204, headers=CORS_HEADERS)
+        response = await endpoint(request)
+        response.headers.update(CORS_HEADERS)
+        return response
+    return wrapper
+
+
+async def _read_json(request):
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+# ==================== CHAT ====================
+
+async def chat(request):
+    # Store Redis đọc bằng I/O blocking -> không chạy trên event loop
+    session_id, session, message, error = await run_in_threadpool(validate_chat_request, await _read_json(request))
+    if error:
+        return JSONResponse(error[0], status_code=error[1])
+
+    try:
+        combined_context, context_key = await run_in_threadpool(prepare_chat_turn, session)
+        response_text = await session["bot"].chat_async(message, context=combined_context, context_key=context_key)
+        await run_in_threadpool(chat_sessions.append_turn, session_id, session, message, response_text)
+        return JSONResponse({"response": response_text, "session_id": session_id})
+    except Exception as e:
+        print(f"Error in async chat endpoint: {str(e)}")
+        return JSONResponse({"error": "Internal server error"}, status_code=500)
+
+
+async def chat_stream(request):
+    # Store Redis đọc bằng I/O blocking -> không chạy trên event loop
+    session_id, session, message, error = await run_in_threadpool(validate_chat_request, await _read_json(request))
+    if error:
+        return JSONResponse(error[0], status_code=error[1])
+
+    try:
+        combined_context, context_key = await run_in_threadpool(prepare_chat_turn, session)
+    except Exception as e:
+        print(f"Error in async chat stream endpoint: {str(e)}")
+        return JSONResponse({"error": "Internal server error"}, status_code=500)
+
+    async def generate():
+        parts = []
+        async for token in session["bot"].chat_stream_async(message, context=combined_context,
+                                                            context_key=context_key):
+            parts.append(token)
+            yield sse_event({"token": token})
+
+        # Chỉ lưu lịch sử khi Gemini giữ lượt này (như routes/chatbot.py)
+        if session["bot"].last_stream_completed:
+            await run_in_threadpool(chat_sessions.append_turn, session_id, session, message, "".join(parts))
+        yield sse_event({"session_id": session_id}, event="done")
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ==================== GEOCODE ====================
+
+async def geocode(request):
+    """Giống /api/geocode của routes/routing.py"""
+    try:
+        q = request.query_params.get('q', '').strip()
+        if q:
+            # Gazetteer / cache thường trúng ngay; miss thì gọi Nominatim có rate-limit (sync)
+            place = await run_in_threadpool(GEOCODER.get_place_by_id, q)
+            if not place:
+                return JSONResponse({'success': False, 'error': 'Không tìm thấy địa điểm'}, status_code=404)
+            return JSONResponse({
+                'success': True,
+                'data': {
+                    'display_name': place.get('full_name') or place.get('name'),
+                    'name': place.get('name'),
+                    'lat': place['lat'],
+                    'lon': place['lon']
+                }
+            })
+
+        lat = request.query_params.get('lat')
+        lon = request.query_params.get('lon')
+        if not lat or not lon:
+            return JSONResponse({'success': False, 'error': 'Thiếu tham số lat hoặc lon'}, status_code=400)
+
+        response = await async_http_get(
+            "https://nominatim.openstreetmap.org/reverse",
+            params={'lat': lat, 'lon': lon, 'format': 'json', 'addressdetails': 1},
+            headers={'User-Agent': 'RouteOptimizer/1.0'},
+            timeout=15
+        )
+        if response.status_code != 200:
+            return JSONResponse({'success': False, 'error': 'Không thể lấy thông tin địa chỉ'}, status_code=500)
+
+        data = response.json()
+        return JSONResponse({
+            'success': True,
+            'data': {
+                'display_name': data.get('display_name'),
+                'address': data.get('address', {})
+            }
+        })
+    except Exception as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+
+# ==================== APP ====================
+
+app = Starlette(on_shutdown=[http.aclose], routes=[
+    Route('/api/chat', cors(chat), methods=['POST', 'OPTIONS']),
+    Route('/api/chat/stream', cors(chat_stream), methods=['POST', 'OPTIONS']),
+    Route('/api/geocode', cors(geocode), methods=['GET', 'OPTIONS']),
+    # Còn lại (auth, bus, routing, trang HTML...) -> Flask
+    Mount('/', app=WSGIMiddleware(flask_app, workers=WSGI_THREADS)),
+])
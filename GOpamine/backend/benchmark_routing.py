@@ -0,0 +1,99 @@
+# File: benchmark_routing.py
+"""
+So sánh thời gian truy vấn tìm đường trên đồ thị local
+
+Cách dùng:
+    python backend/benchmark_routing.py                  # 200 cặp ngẫu nhiên, profile car
+    python backend/benchmark_routing.py --queries 500 --profile moto
+    python backend/benchmark_routing.py --osrm 20        # thêm 20 truy vấn OSRM HTTP để so sánh
+
+Các engine:
+  - dijkstra : one_to_many 1 đích (không heuristic)
+  - astar    : A* heuristic đường chim bay
+  - alt      : A* + landmark (cần build_road_graph.py --landmarks)
+  - osrm     : routing_backend.OSRMBackend (HTTP, tùy chọn)
+"""
+import sys
+import os
+import time
+import random
+import argparse
+import statistics
+# Hack path để import được backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.utils.road_graph import GRAPH_PROFILES, get_road_graph
+
+
+def summarize(name, times_ms, settled=None):
+    times_ms = sorted(times_ms)
+    p95 = times_ms[min(len(times_ms) - 1, int(len(times_ms) * 0.95))]
+    line = (f"{name:<9} n={len(times_ms):<4} mean={statistics.mean(times_ms):8.2f}ms "
+            f"p50={statistics.median(times_ms):8.2f}ms p95={p95:8.2f}ms")
+    if settled:
+        line += f" settled≈{int(statistics.mean(settled))}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark routing local (Dijkstra / A* / ALT / OSRM)")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--profile', default='car', choices=GRAPH_PROFILES)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--osrm', type=int, default=0, help="Số truy vấn OSRM HTTP để so sánh (0 = bỏ qua)")
+    args = parser.parse_args()
+
+    graph = get_road_graph()
+    if graph is None:
+        print("❌ Chưa có đồ thị. Chạy: python backend/build_road_graph.py")
+        return
+
+    rng = random.Random(args.seed)
+    pairs = [(rng.randrange(graph.n_nodes), rng.randrange(graph.n_nodes)) for _ in range(args.queries)]
+    graph.weights(args.profile)  # Tính trọng số trước, không tính vào thời gian truy vấn
+    print(f"🚀 {graph.n_nodes} nodes, {graph.n_edges} edges | profile={args.profile} | {len(pairs)} queries")
+
+    results = {}
+    engines = [('dijkstra', None), ('astar', False)]
+    if graph.has_landmarks(args.profile):
+        engines.append(('alt', True))
+    else:
+        print("⚠️  Chưa có landmark cho profile này -> bỏ qua ALT")
+
+    for name, use_landmarks in engines:
+        times, settled, durations = [], [], []
+        for src, dst in pairs:
+            t0 = time.perf_counter()
+            if use_landmarks is None:
+                dur, _ = graph.one_to_many(src, [dst], args.profile)
+                durations.append(dur[0])
+            else:
+                path = graph.shortest_path(src, dst, args.profile, use_landmarks=use_landmarks)
+                durations.append(path['duration'] if path else float('inf'))
+                if path:
+                    settled.append(path['settled'])
+            times.append((time.perf_counter() - t0) * 1000)
+        results[name] = durations
+        summarize(name, times, settled)
+
+    # Kiểm tra A*/ALT ra cùng kết quả với Dijkstra
+    base = results['dijkstra']
+    for name, durations in results.items():
+        diff = max((abs(a - b) for a, b in zip(base, durations) if a != float('inf')), default=0.0)
+        print(f"   {name:<9} max |Δduration| vs dijkstra = {diff:.4f}s")
+
+    if args.osrm:
+        from backend.utils.routing_backend import OSRMBackend
+        profile = {'car': 'driving', 'moto': 'bike', 'bike': 'bike', 'walk': 'foot'}[args.profile]
+        osrm = OSRMBackend()
+        times = []
+        for src, dst in pairs[:args.osrm]:
+            points = [(float(graph.node_lon[n]), float(graph.node_lat[n])) for n in (src, dst)]
+            t0 = time.perf_counter()
+            osrm.route(points, profile=profile, params={'overview': 'full', 'geometries': 'geojson'})
+            times.append((time.perf_counter() - t0) * 1000)
+        summarize('osrm', times)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# File: build_road_graph.py
+"""
+Build đồ thị đường phố cho routing local (ROUTING_BACKEND=local)
+
+Cách dùng:
+    pip install osmnx
+    python backend/build_road_graph.py --place "Ho Chi Minh City, Vietnam"
+    python backend/build_road_graph.py --bbox 10.95 10.65 106.85 106.55 --out backend/data/road_graph
+    python backend/build_road_graph.py --landmarks-only --landmarks 16   # chỉ tính lại ALT
+
+Kết quả: các file .npy (CSR) + meta.json + landmarks_<profile>.npy, được road_graph.py mở bằng mmap.
+"""
+import sys
+import os
+import json
+import argparse
+from datetime import datetime
+# Hack path để import được backend
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import osmnx as ox
+
+from backend.utils.config import ROUTING_CONFIG
+from backend.utils.road_graph import FLAG_REVERSE_ONLY, GRAPH_ARRAYS, GRAPH_PROFILES, HIGHWAY_CLASSES, RoadGraph
+
+
+def road_class_code(highway):
+    """'primary_link' -> primary; list (OSM gộp cạnh) -> lấy phần tử đầu"""
+    if isinstance(highway, (list, tuple)):
+        highway = highway[0] if highway else 'other'
+    highway = str(highway or 'other').replace('_link', '')
+    return HIGHWAY_CLASSES.index(highway) if highway in HIGHWAY_CLASSES else HIGHWAY_CLASSES.index('other')
+
+
+def download_graph(args):
+    print("🌐 Đang tải dữ liệu OSM (có thể mất vài phút)...")
+    if args.bbox:
+        north, south, east, west = args.bbox
+        try:
+            G = ox.graph_from_bbox(bbox=(west, south, east, north), network_type='all', simplify=True)
+        except TypeError:  # osmnx < 2.0
+            G = ox.graph_from_bbox(north, south, east, west, network_type='all', simplify=True)
+    else:
+        G = ox.graph_from_place(args.place, network_type='all', simplify=True)
+
+    G = ox.add_edge_speeds(G)  # speed_kph (ước lượng theo loại đường nếu thiếu maxspeed)
+    print(f"✅ Đã tải: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
+    return G
+
+
+def build_arrays(G):
+    node_ids = list(G.nodes)
+    index = {nid: i for i, nid in enumerate(node_ids)}
+    node_lat = np.array([G.nodes[n]['y'] for n in node_ids], dtype=np.float64)
+    node_lon = np.array([G.nodes[n]['x'] for n in node_ids], dtype=np.float64)
+
+    # Gom cạnh (u -> v), chỉ giữ cạnh song song ngắn nhất
+    edges = {}
+    for u, v, data in G.edges(data=True):
+        if u == v:
+            continue
+        key = (index[u], index[v])
+        length = float(data.get('length', 0.0))
+        if key in edges and edges[key]['length'] <= length:
+            continue
+
+        inner = []
+        geom = data.get('geometry')
+        if geom is not None:
+            inner = [(lat, lon) for lon, lat in list(geom.coords)[1:-1]]
+
+        edges[key] = {
+            'length': length,
+            'speed': float(data.get('speed_kph') or 30.0),
+            'cls': road_class_code(data.get('highway')),
+            'flags': 0,
+            'inner': inner,
+        }
+
+    # Đường 1 chiều: thêm cạnh ngược (chỉ người đi bộ được dùng)
+    for (u, v), e in list(edges.items()):
+        if (v, u) not in edges:
+            edges[(v, u)] = dict(e, flags=FLAG_REVERSE_ONLY, inner=e['inner'][::-1])
+
+    keys = sorted(edges)
+    m = len(keys)
+    indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    for u, _ in keys:
+        indptr[u + 1] += 1
+    np.cumsum(indptr, out=indptr)
+
+    arrays = {
+        'node_lat': node_lat,
+        'node_lon': node_lon,
+        'indptr': indptr,
+        'indices': np.array([v for _, v in keys], dtype=np.int32),
+        'length_m': np.array([edges[k]['length'] for k in keys], dtype=np.float32),
+        'speed_kph': np.array([edges[k]['speed'] for k in keys], dtype=np.float32),
+        'road_class': np.array([edges[k]['cls'] for k in keys], dtype=np.uint8),
+        'flags': np.array([edges[k]['flags'] for k in keys], dtype=np.uint8),
+    }
+
+    geom_indptr = np.zeros(m + 1, dtype=np.int64)
+    geom_lat, geom_lon = [], []
+    for i, k in enumerate(keys):
+        inner = edges[k]['inner']
+        geom_indptr[i + 1] = geom_indptr[i] + len(inner)
+        geom_lat.extend(p[0] for p in inner)
+        geom_lon.extend(p[1] for p in inner)
+    arrays['geom_indptr'] = geom_indptr
+    arrays['geom_lat'] = np.array(geom_lat, dtype=np.float64)
+    arrays['geom_lon'] = np.array(geom_lon, dtype=np.float64)
+    return arrays
+
+
+def save(arrays, out_dir, source):
+    os.makedirs(out_dir, exist_ok=True)
+    for name in GRAPH_ARRAYS:
+        np.save(os.path.join(out_dir, f"{name}.npy"), arrays[name])
+
+    meta = {
+        'n_nodes': int(len(arrays['node_lat'])),
+        'n_edges': int(len(arrays['indices'])),
+        'center_lat': float(arrays['node_lat'].mean()),
+        'center_lon': float(arrays['node_lon'].mean()),
+        'highway_classes': HIGHWAY_CLASSES,
+        'source': source,
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    with open(os.path.join(out_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"💾 Đã lưu đồ thị: {meta['n_nodes']} nodes, {meta['n_edges']} edges -> {out_dir}")
+
+
+def build_landmarks(out_dir, count):
+    """Tính trước khoảng cách ALT cho từng profile (car / moto / bike / walk)"""
+    graph = RoadGraph(out_dir)
+    for profile in GRAPH_PROFILES:
+        print(f"📍 Landmarks '{profile}' ({count})...")
+        graph.save_landmarks(profile, graph.build_landmarks(profile, count))
+    print("✅ Đã lưu landmarks")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build đồ thị đường phố cho routing local")
+    parser.add_argument('--place', default="Ho Chi Minh City, Vietnam")
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('NORTH', 'SOUTH', 'EAST', 'WEST'))
+    parser.add_argument('--out', default=ROUTING_CONFIG["GRAPH_PATH"])
+    parser.add_argument('--landmarks', type=int, default=ROUTING_CONFIG["ALT_LANDMARKS"],
+                        help="Số landmark ALT mỗi profile (0 = bỏ qua)")
+    parser.add_argument('--landmarks-only', action='store_true', help="Chỉ tính lại landmark trên đồ thị đã có")
+    args = parser.parse_args()
+
+    if not args.landmarks_only:
+        G = download_graph(args)
+        arrays = build_arrays(G)
+        save(arrays, args.out, source=args.place if not args.bbox else f"bbox {args.bbox}")
+
+    if args.landmarks > 0:
+        build_landmarks(args.out, args.landmarks)
+
+
+if __name__ == "__main__":
+    main()
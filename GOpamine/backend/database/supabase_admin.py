@@ -0,0 +1,40 @@
+"""
+SUPABASE ADMIN - Client quyền service_role dùng chung cho mọi thao tác admin (auth.py)
+Features:
+  - Tạo lười lần đầu dùng, thread-safe (double-checked lock), giữ suốt vòng đời process
+  - Dùng lại kết nối HTTP (keep-alive) thay vì create_client mỗi request
+  - Chỉ dùng cho API admin / ghi DB bằng service key; KHÔNG sign_in trên client này
+    (auth của client giữ session -> dùng chung giữa các request sẽ lẫn user)
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+from supabase import create_client, Client
+
+# Load .env (cùng vị trí với supabase_client.py)
+env_path = Path(__file__).resolve().parent.parent / '.env'
+load_dotenv(dotenv_path=env_path)
+
+_admin_client: Optional[Client] = None
+_admin_lock = threading.Lock()
+
+
+def get_supabase_admin() -> Optional[Client]:
+    """Client admin dùng chung; None nếu thiếu SUPABASE_URL / SUPABASE_SERVICE_KEY"""
+    global _admin_client
+    if _admin_client is None:
+        with _admin_lock:
+            if _admin_client is None:
+                sb_url = os.getenv("SUPABASE_URL")
+                sb_service_key = os.getenv("SUPABASE_SERVICE_KEY")
+                if not sb_url or not sb_service_key:
+                    return None
+                _admin_client = create_client(sb_url, sb_service_key)
+    return _admin_client
+
+
+__all__ = ["get_supabase_admin"]
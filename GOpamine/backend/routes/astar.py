@@ -1,13 +1,24 @@
 import requests
 import math
-import itertools
 import os
 import json
 from time import sleep
+from concurrent.futures import ThreadPoolExecutor
 from flask import Blueprint, request, jsonify
 from typing import List, Dict, Tuple, Optional
     #Import để lấy dữ liệu ng dùng nhập
 from .pricing_score import UserRequest, calculate_adaptive_scores # Import class UserRequest
+from backend.utils.tsp import haversine_matrix, solve_route_order
+from backend.utils.cache_layer import cache_get, cache_set, cache_key
+from backend.utils.config import API_CONFIG, CACHE_CONFIG, GEOCODE_CONFIG, ROUTING_CONFIG
+from backend.utils.geocode_cache import geocode_cache, nominatim_limiter
+from backend.utils.place_index import geocode_local, search_places
+from backend.utils.http_client import http_get
+from backend.utils.osrm_client import fetch_osrm_route
+from backend.utils.routing_backend import get_routing_backend
+from backend.utils.road_graph import get_road_graph
+from backend.utils.job_queue import register_task
+from backend.routes.jobs import job_accepted_response
 
 # --- Import module tính tiền ---
 try:
@@ -20,7 +31,8 @@ class AStarRouter:
     Multi-Stop Trip Optimizer
     - Geocoding: Nominatim (OSM)
     - Routing: OSRM (OpenStreetMap Routing Machine)
-    - TSP: Brute Force (Permutations) cho < 7 điểm
+    - TSP: Held-Karp (<= 12 điểm) / NN + 2-opt, Or-opt (nhiều hơn)
+    - A*/ALT in-process trên đồ thị đường (nếu đã build), fallback OSRM
     - Cost: cost_estimation module
     """
     
@@ -29,6 +41,15 @@ class AStarRouter:
         'moto': 'bike',
         'bus': 'driving'
     }
+
+    # vehicle_type -> profile trọng số trên đồ thị local (road_graph.PROFILE_RULES)
+    GRAPH_PROFILE_MAP = {
+        'car': 'car',
+        'moto': 'moto',
+        'bus': 'car',
+        'bike': 'bike',
+        'walk': 'walk'
+    }
     
     # Retry configuration
     MAX_RETRIES = 3
@@ -43,6 +64,8 @@ class AStarRouter:
         self.headers = {
             'User-Agent': 'GOpamine-Student-App/1.0 (student-project)'
         }
+        # Đồ thị đường load 1 lần lúc khởi động (None nếu chưa build)
+        self.graph = get_road_graph()
 
     def _retry_request(self, func, *args, **kwargs):
         """Helper: Thử lại request với exponential backoff"""
@@ -88,27 +111,43 @@ class AStarRouter:
             if len(words) > 10:
                 query_name = ' '.join(words[:6])
 
+            # Gazetteer offline (trạm bus + POI) -> không cần gọi mạng
+            local = geocode_local(query_name)
+            if local:
+                print(f"⚡ Place index hit: '{query_name}' -> {local['name']}")
+                return {'id': place_identifier, 'name': local['name'], 'full_name': local['name'],
+                        'lat': local['lat'], 'lon': local['lon']}
+
             # Tạo query tìm kiếm
             query = f"{query_name}, Ho Chi Minh City" if "Ho Chi Minh" not in str(query_name) else query_name
+
+            # Cache geocode (Memory/Redis -> SQLite) trước khi gọi mạng
+            cached = geocode_cache.get(query)
+            if cached:
+                print(f"⚡ Geocode cache hit: '{query}'")
+                return {'id': place_identifier, **cached}
+
             params = {'q': query, 'format': 'json', 'limit': 1}
             
             print(f"🔍 Đang tìm lại với từ khóa ngắn gọn: '{query}'") # In ra để debug
             
             def make_request():
-                return requests.get(self.nominatim_base, params=params, headers=self.headers, timeout=5)
+                nominatim_limiter.acquire()  # Nominatim rate-limit (chỉ áp cho request thật)
+                return http_get(self.nominatim_base, params=params, headers=self.headers, timeout=5)
             
             resp = self._retry_request(make_request)
             if not resp: return None
             
             data = resp.json()
             if data and len(data) > 0:
-                return {
-                    'id': place_identifier, # Giữ nguyên ID gốc
+                place = {
                     'name': data[0]['display_name'].split(',')[0], # Lấy tên hiển thị ngắn gọn
                     'full_name': data[0]['display_name'],
                     'lat': float(data[0]['lat']),
                     'lon': float(data[0]['lon'])
                 }
+                geocode_cache.set(query, place)
+                return {'id': place_identifier, **place} # Giữ nguyên ID gốc
             
             print(f"⚠️ Vẫn không tìm thấy: {query}")
             return None
@@ -129,34 +168,70 @@ class AStarRouter:
         a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
         return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
 
-    def get_real_route(self, start, end, waypoints=None, profile='driving'):
+    def astar_route(self, start, end, waypoints=None, vehicle_type='car'):
+        """
+        A* (ALT nếu có landmark) trên đồ thị đường trong process, không gọi mạng
+        Output: giống get_real_route {coordinates, distance, duration, legs} hoặc None
         """
-        Lấy đường đi thực tế từ OSRM
+        if self.graph is None:
+            return None
+
+        profile = self.GRAPH_PROFILE_MAP.get(vehicle_type, 'car')
+        points = [start] + list(waypoints or []) + [end]
+        nodes = []
+        for p in points:
+            node, snap_m = self.graph.nearest_node(float(p['lat']), float(p['lon']), profile)
+            if snap_m > ROUTING_CONFIG["MAX_SNAP_DISTANCE_M"]:
+                return None
+            nodes.append(node)
+
+        coordinates, legs = [], []
+        for src, dst in zip(nodes, nodes[1:]):
+            path = self.graph.shortest_path(src, dst, profile)
+            if path is None:
+                return None
+            leg_coords = self.graph.path_coordinates(path['nodes'], path['edges'])
+            coordinates.extend(leg_coords[1:] if coordinates else leg_coords)
+            legs.append({
+                'distance': path['distance'],
+                'duration': path['duration'],
+                'steps': [{'geometry': {'type': 'LineString', 'coordinates': leg_coords}}]
+            })
+
+        return {
+            'coordinates': coordinates,
+            'distance': sum(l['distance'] for l in legs) / 1000,  # km
+            'duration': sum(l['duration'] for l in legs) / 60,    # phút
+            'legs': legs
+        }
+
+    def get_real_route(self, start, end, waypoints=None, profile='driving', vehicle_type=None):
+        """
+        Lấy đường đi thực tế: A* in-process (nếu có đồ thị + vehicle_type), fallback OSRM
         start, end: {lat, lon, name}
         waypoints: list các điểm trung gian
         Output: {coordinates, distance, duration, legs}
         """
+        if vehicle_type and self.graph is not None:
+            local = self.astar_route(start, end, waypoints=waypoints, vehicle_type=vehicle_type)
+            if local:
+                return local
+
         try:
-            coords = [f"{start['lon']},{start['lat']}"]
-            if waypoints:
-                for wp in waypoints:
-                    coords.append(f"{wp['lon']},{wp['lat']}")
-            coords.append(f"{end['lon']},{end['lat']}")
+            points = [(start['lon'], start['lat'])]
+            for wp in waypoints or []:
+                points.append((wp['lon'], wp['lat']))
+            points.append((end['lon'], end['lat']))
             
-            url = f"{self.osrm_base}/{profile}/{';'.join(coords)}"
             params = {'overview': 'full', 'geometries': 'geojson', 'steps': 'true'}
             
-            def make_request():
-                return requests.get(url, params=params, timeout=10)
-            
-            resp = self._retry_request(make_request)
-            if not resp:
-                return None
-            
-            data = resp.json()
-            
-            if data['code'] != 'Ok':
-                print(f"⚠️  OSRM returned code: {data['code']}")
+            # Cache theo tọa độ làm tròn + profile (lỗi cũng được cache ngắn)
+            data, error = fetch_osrm_route(
+                points, profile=profile, params=params, timeout=10,
+                retries=self.MAX_RETRIES
+            )
+            if not data:
+                print(f"⚠️  OSRM returned: {error}")
                 return None
             
             route = data['routes'][0]
@@ -170,44 +245,125 @@ class AStarRouter:
             print(f"❌ OSRM Error: {e}")
             return None
 
+    def get_distance_matrix(self, places, profile='driving', vehicle_type=None):
+        """
+        Ma trận khoảng cách / thời gian đường thực tế từ OSRM /table
+        (1 request cho toàn bộ N x N cặp, cache theo bộ tọa độ)
+        Có đồ thị local + vehicle_type -> Dijkstra in-process theo profile của phương tiện
+        places: [{lat, lon}, ...]
+        Output: {'distances': km [[...]], 'durations': phút [[...]]} hoặc None
+                (cặp không có đường -> inf)
+        """
+        if not places or len(places) < 2:
+            return None
+
+        if vehicle_type and self.graph is not None:
+            graph_profile = self.GRAPH_PROFILE_MAP.get(vehicle_type, 'car')
+            snapped = [self.graph.nearest_node(float(p['lat']), float(p['lon']), graph_profile) for p in places]
+            if all(d <= ROUTING_CONFIG["MAX_SNAP_DISTANCE_M"] for _, d in snapped):
+                nodes = [n for n, _ in snapped]
+                durations, distances = [], []
+                for i, src in enumerate(nodes):
+                    dur, dist = self.graph.one_to_many(src, nodes, graph_profile)
+                    # Đồ thị thiếu đường giữa 2 điểm -> không tin, hỏi OSRM /table bên dưới
+                    if any(not math.isfinite(v) for j, v in enumerate(dur) if j != i):
+                        break
+                    durations.append([v / 60 for v in dur])
+                    distances.append([v / 1000 for v in dist])
+                else:
+                    return {'distances': distances, 'durations': durations}
+        if len(places) > API_CONFIG["OSRM_TABLE_MAX_COORDS"]:
+            print(f"⚠️  OSRM table: {len(places)} điểm vượt giới hạn, dùng haversine")
+            return None
+
+        precision = API_CONFIG["OSRM_KEY_PRECISION"]
+        coords = [f"{round(float(p['lon']), precision)},{round(float(p['lat']), precision)}" for p in places]
+        backend = get_routing_backend()
+        key = cache_key("osrm_table", backend.name, profile, ";".join(coords))
+
+        table = cache_get(key)
+        if table is None:
+            # OSRM HTTP hoặc engine local (ROUTING_BACKEND), cùng định dạng /table
+            data = backend.table(
+                [(p['lon'], p['lat']) for p in places], profile=profile,
+                timeout=10, retries=self.MAX_RETRIES
+            )
+            if data.get('_negative'):
+                print(f"⚠️  OSRM table returned: {data.get('error')}")
+                return None
+
+            # Giữ nguyên null của OSRM khi cache (JSON-safe), đổi sang inf lúc trả về
+            table = {'distances': data['distances'], 'durations': data.get('durations')}
+            cache_set(key, table, CACHE_CONFIG["TTL"]["osrm_table"])
+            print(f"🗺️  OSRM table: {len(places)}x{len(places)} (1 request)")
+
+        def convert(matrix, factor):
+            if not matrix:
+                return None
+            return [[v / factor if v is not None else math.inf for v in row] for row in matrix]
+
+        return {
+            'distances': convert(table['distances'], 1000),   # m -> km
+            'durations': convert(table.get('durations'), 60), # s -> phút
+        }
+
+    def split_route_legs(self, route_data):
+        """
+        Tách kết quả get_real_route (nhiều waypoint) thành từng chặng
+        Output: [{'distance': km, 'duration': phút, 'coordinates': [[lon, lat], ...]}, ...]
+        """
+        legs = []
+        for leg in route_data.get('legs') or []:
+            coords = []
+            for step in leg.get('steps') or []:
+                step_coords = (step.get('geometry') or {}).get('coordinates') or []
+                # Điểm đầu step trùng điểm cuối step trước
+                if coords and step_coords and coords[-1] == step_coords[0]:
+                    step_coords = step_coords[1:]
+                coords.extend(step_coords)
+            legs.append({
+                'distance': leg.get('distance', 0) / 1000,
+                'duration': leg.get('duration', 0) / 60,
+                'coordinates': coords
+            })
+        return legs
+
     # ==============================================================================
-    # CORE: TSP BRUTE FORCE
+    # CORE: TSP
     # ==============================================================================
 
-    def optimize_stop_order(self, start_place, destinations):
+    def optimize_stop_order(self, start_place, destinations, end_place=None, round_trip=False, matrix=None):
         """
-        TSP Brute Force: Tìm thứ tự tối ưu (ngắn nhất)
-        Dùng itertools.permutations để duyệt tất cả hoán vị
+        TSP: Tìm thứ tự tối ưu (ngắn nhất) qua solver ở utils/tsp.py
+          - <= 12 điểm: Held-Karp (chính xác)
+          - nhiều hơn: Nearest Neighbour + 2-opt / Or-opt
         
         Input:
           - start_place: {lat, lon, name}
           - destinations: [{lat, lon, name}, ...]
-        Output: Danh sách destinations đã sắp xếp lại
+          - end_place: điểm kết thúc cố định (None = kết thúc tự do)
+          - round_trip: True = quay về start_place
+          - matrix: ma trận chi phí dựng sẵn theo thứ tự [start] + destinations (+ [end_place]);
+                    mặc định dùng haversine
+        Output: Danh sách destinations đã sắp xếp lại (không gồm start / end)
         """
         if not destinations:
             return []
         if len(destinations) <= 1:
-            return destinations
-
-        best_order = destinations
-        min_dist = float('inf')
-
-        # Duyệt tất cả hoán vị
-        for perm in itertools.permutations(destinations):
-            d = 0
-            # Khoảng cách Start -> điểm 1
-            d += self.haversine_distance(start_place['lat'], start_place['lon'], 
-                                       perm[0]['lat'], perm[0]['lon'])
-            # Khoảng cách các điểm tiếp theo
-            for i in range(len(perm) - 1):
-                d += self.haversine_distance(perm[i]['lat'], perm[i]['lon'], 
-                                           perm[i+1]['lat'], perm[i+1]['lon'])
-            
-            if d < min_dist:
-                min_dist = d
-                best_order = list(perm)
-        
-        return best_order
+            return list(destinations)
+
+        points = [start_place] + list(destinations)
+        end_index = None
+        if end_place and not round_trip:
+            points.append(end_place)
+            end_index = len(points) - 1
+
+        if matrix is None:
+            matrix = haversine_matrix(points)
+
+        order, cost = solve_route_order(matrix, start=0, end=end_index, return_to_start=round_trip)
+        print(f"🧭 TSP: {len(destinations)} điểm -> {cost:.2f} (thứ tự {order})")
+        return [points[i] for i in order if i != 0 and i != end_index]
 
     def find_optimal_route(self, start_id, end_id, vehicle_type='car', vehicle_speed=None):
         """
@@ -221,7 +377,7 @@ class AStarRouter:
             return {'success': False, 'error': 'Không tìm thấy địa điểm (Geocoding fail)'}
 
         profile = self.PROFILE_MAP.get(vehicle_type, 'driving')
-        real_route = self.get_real_route(start, end, profile=profile)
+        real_route = self.get_real_route(start, end, profile=profile, vehicle_type=vehicle_type)
         
         if not real_route:
             # Fallback Haversine
@@ -253,7 +409,7 @@ class AStarRouter:
     # MAIN: MULTI-STOP TRIP PLANNING
     # ==============================================================================
 
-    def plan_multi_stop_trip(self, start_id, destination_ids, vehicle_type='car'):
+    def plan_multi_stop_trip(self, start_id, destination_ids, vehicle_type='car', end_id=None, return_to_start=False):
         """
         Hàm chính: Lập kế hoạch lộ trình đa điểm
         
@@ -261,6 +417,8 @@ class AStarRouter:
           - start_id: Tên/ID điểm xuất phát (String)
           - destination_ids: Danh sách tên điểm đến (List[String])
           - vehicle_type: 'car', 'moto', 'bus'
+          - end_id: Điểm kết thúc cố định (tùy chọn)
+          - return_to_start: True = quay về điểm xuất phát
         
         Output:
           {
@@ -289,29 +447,48 @@ class AStarRouter:
             
             print(f"📍 Bắt đầu plan trip: Start={start_id}, Destinations={destination_ids}")
             
-            # 1. GEOCODING - Lấy tọa độ từ tên địa điểm
-            start_place = self.get_place_by_id(start_id)
+            # 1. GEOCODING - Lấy tọa độ từ tên địa điểm (song song; cache + token bucket lo rate-limit)
+            end_lookup = end_id if end_id and not return_to_start else None
+            lookups = [start_id] + list(destination_ids) + ([end_lookup] if end_lookup else [])
+            workers = max(1, min(GEOCODE_CONFIG["MAX_WORKERS"], len(lookups)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                places = list(pool.map(self.get_place_by_id, lookups))
+
+            start_place = places[0]
             if not start_place:
                 return {'success': False, 'error': f'Không tìm thấy điểm đi: {start_id}'}
 
             dest_places = []
-            for dest in destination_ids:
-                p = self.get_place_by_id(dest)
+            for dest, p in zip(destination_ids, places[1:1 + len(destination_ids)]):
                 if p: 
                     dest_places.append(p)
                     print(f"✅ Geocoded: {dest} -> {p['name']}")
                 else:
                     print(f"⚠️  Geocoding fail: {dest}")
-                sleep(1)  # Nominatim rate-limit
 
             if not dest_places:
                 return {'success': False, 'error': 'Không tìm thấy địa điểm đến nào hợp lệ'}
             
             print(f"📍 Total destinations geocoded: {len(dest_places)}")
 
-            # 2. TSP - Tối ưu thứ tự
-            ordered_destinations = self.optimize_stop_order(start_place, dest_places)
+            end_place = places[-1] if end_lookup else None
+            if end_lookup and not end_place:
+                return {'success': False, 'error': f'Không tìm thấy điểm kết thúc: {end_id}'}
+
+            profile = self.PROFILE_MAP.get(vehicle_type, 'driving')
+
+            # 2. TSP - Tối ưu thứ tự theo khoảng cách đường thực tế (OSRM table)
+            matrix_points = [start_place] + dest_places + ([end_place] if end_place else [])
+            table = self.get_distance_matrix(matrix_points, profile=profile, vehicle_type=vehicle_type)
+            ordered_destinations = self.optimize_stop_order(
+                start_place, dest_places, end_place=end_place, round_trip=return_to_start,
+                matrix=table['distances'] if table else None
+            )
             full_route = [start_place] + ordered_destinations
+            if end_place:
+                full_route.append(end_place)
+            elif return_to_start:
+                full_route.append(start_place)
 
             # 3. Danh sách hãng xe để so sánh
             comparison_options = [
@@ -328,16 +505,23 @@ class AStarRouter:
             segments = []
 
             # 4. TÍNH TOÁN TỪNG CHẶNG (IMPORTANT: Phải lặp hết tất cả)
+            # 1 request OSRM đi qua tất cả điểm, rồi tách theo leg
+            full_trip = self.get_real_route(
+                full_route[0], full_route[-1], waypoints=full_route[1:-1], profile=profile,
+                vehicle_type=vehicle_type
+            )
+            trip_legs = self.split_route_legs(full_trip) if full_trip else []
+            if len(trip_legs) != len(full_route) - 1:
+                trip_legs = []
+
             for i in range(len(full_route) - 1):
                 curr = full_route[i]
                 nxt = full_route[i+1]
                 
                 print(f"🚗 Chặng {i + 1}: {curr['name']} -> {nxt['name']}")
                 
-                sleep(0.1)  # OSRM rate-limit
-                
-                # Lấy đường thực tế
-                route_data = self.get_real_route(curr, nxt, profile=self.PROFILE_MAP.get(vehicle_type, 'driving'))
+                # Lấy đường thực tế (fallback gọi riêng chặng nếu request gộp lỗi)
+                route_data = trip_legs[i] if trip_legs else self.get_real_route(curr, nxt, profile=profile, vehicle_type=vehicle_type)
                 
                 if route_data:
                     dist_km = route_data['distance']
@@ -419,11 +603,19 @@ def create_api_blueprint(db_path=None):
     """
     router = AStarRouter(db_path=db_path)
     api_bp = Blueprint('astar_api', __name__, url_prefix='/api')
+    register_task('plan_trip', lambda params: router.plan_multi_stop_trip(**params))
 
     @api_bp.route('/places', methods=['GET'])
     def get_places():
-        """Deprecated - Dùng Nominatim thay SQLite"""
-        return jsonify({'success': True, 'data': [], 'message': 'Deprecated: Use search by name'})
+        """Autocomplete địa điểm từ gazetteer offline: /api/places?q=ben tha&limit=10"""
+        q = request.args.get('q', '').strip()
+        if not q:
+            return jsonify({'success': True, 'data': []})
+        try:
+            limit = max(1, min(int(request.args.get('limit', 10)), 50))
+        except ValueError:
+            limit = 10
+        return jsonify({'success': True, 'data': search_places(q, limit=limit)})
 
     @api_bp.route('/find-route', methods=['POST'])
     def find_route():
@@ -443,11 +635,19 @@ def create_api_blueprint(db_path=None):
         # [SỬA LẠI] Ưu tiên lấy object 'start' chứa tọa độ
         start_input = data.get('start') or data.get('start_id') or data.get('start_name')
         
-        res = router.plan_multi_stop_trip(
+        params = dict(
             start_id=start_input, # Truyền start_input (có thể là dict hoặc string)
             destination_ids=data.get('destinations') or data.get('stops', []),
-            vehicle_type=data.get('vehicle_type', 'car')
+            vehicle_type=data.get('vehicle_type', 'car'),
+            end_id=data.get('end') or data.get('end_id'),
+            return_to_start=bool(data.get('return_to_start', False))
         )
+
+        # async=true: chạy nền, trả job_id ngay -> poll /api/jobs/<job_id>/result
+        if data.get('async'):
+            return job_accepted_response('plan_trip', params)
+
+        res = router.plan_multi_stop_trip(**params)
         return jsonify(res)
 
     return api_bp
\ No newline at end of file
@@ -20,6 +20,9 @@ parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
 sys.path.insert(0, parent_dir)
 
 from database.supabase_client import supabase
+from database.supabase_admin import get_supabase_admin
+from backend.utils.supabase_jwt import INVALID, VERIFIED, verify_access_token
+from backend.utils.user_cache import invalidate_user, peek_user_row, set_user_row
 
 load_dotenv()
 
@@ -60,6 +63,7 @@ def get_or_create_user_profile(user_id):
         }
         
         insert_result = supabase.table("users").upsert(profile_data).execute()
+        invalidate_user(user_id)
         return insert_result.data[0] if insert_result.data else None
         
     except Exception as e:
@@ -107,6 +111,7 @@ def register():
             }
             
             supabase.table("users").upsert(user_data).execute()
+            invalidate_user(user_id)
             
             # Tạo UserProfile
             profile_data = {
@@ -118,6 +123,7 @@ def register():
             try:
                 # Cố gắng cập nhật (nếu chưa có thì tạo, có rồi thì update)
                 supabase.table("users").upsert(user_data).execute()
+                invalidate_user(user_id)
                 
                 # Quan trọng: Thêm on_conflict='user_id' để tránh lỗi ở bảng Profile
                 supabase.table("UserProfile").upsert(profile_data, on_conflict='user_id').execute()
@@ -194,6 +200,7 @@ def login():
                 }
                 # SỬA: Dùng upsert để nếu có rồi thì cập nhật, chưa có thì tạo mới -> Không bao giờ lỗi
                 supabase.table("users").upsert(user_data).execute()
+                invalidate_user(user_id)
             
             # Tạo User object cho Flask-Login
             user_obj = User(
@@ -249,6 +256,7 @@ def login_guest():
         }
         
         supabase.table("users").upsert(user_data).execute()
+        invalidate_user(guest_id)
         
         # Tạo UserProfile
         profile_data = {
@@ -387,13 +395,10 @@ def login_guest_v2():
     try:
         print("👤 [GUEST V2] Đang khởi tạo khách (Fix Check Constraint)...")
         
-        # 1. Setup Admin Client
-        sb_url = os.getenv("SUPABASE_URL")
-        sb_service_key = os.getenv("SUPABASE_SERVICE_KEY")
-        if not sb_service_key:
+        # 1. Admin Client (dùng chung, tạo 1 lần)
+        supabase_admin = get_supabase_admin()
+        if supabase_admin is None:
             return jsonify({'success': False, 'message': 'Thiếu Service Key'}), 500
-            
-        supabase_admin = create_client(sb_url, sb_service_key)
         
         # 2. Tạo User thật bằng quyền Admin
         guest_id = str(uuid.uuid4())
@@ -425,6 +430,7 @@ def login_guest_v2():
         
         print(f"⚡ [ADMIN] Ghi Guest vào DB: {user.id} | Type: email")
         supabase_admin.table("users").upsert(user_data).execute()
+        invalidate_user(user.id)
         
         # Tạo Profile phụ
         try:
@@ -470,9 +476,9 @@ def register_v2_admin():
         
         print(f"📝 [REGISTER V2 ADMIN]: {email}")
         
-        sb_url = os.getenv("SUPABASE_URL")
-        sb_service_key = os.getenv("SUPABASE_SERVICE_KEY")
-        supabase_admin = create_client(sb_url, sb_service_key)
+        supabase_admin = get_supabase_admin()
+        if supabase_admin is None:
+            return jsonify({'success': False, 'message': 'Thiếu Service Key'}), 500
 
         auth_res = supabase.auth.sign_up({
             "email": email,
@@ -497,6 +503,7 @@ def register_v2_admin():
         
         print("⚡ [ADMIN] Ghi User Đăng ký vào DB...")
         supabase_admin.table("users").upsert(user_data).execute()
+        invalidate_user(user.id)
         
         try:
             supabase_admin.table("UserProfile").upsert({
@@ -518,8 +525,6 @@ def register_v2_admin():
 # ==============================================================================
 @auth_bp.route('/api/auth/sync-session', methods=['POST'])
 def sync_session():
-    import os
-
     try:
         data = request.json or {}
         access_token = data.get('access_token')
@@ -527,46 +532,63 @@ def sync_session():
         if not access_token:
             return jsonify({'success': False, 'message': 'Thiếu access_token'}), 400
 
-        sb_url = os.getenv("SUPABASE_URL")
-        sb_service_key = os.getenv("SUPABASE_SERVICE_KEY")
-
-        if not sb_service_key:
-            return jsonify({'success': False, 'message': 'Server misconfig'}), 500
+        # Ưu tiên verify JWT tại chỗ (chỉ tốn CPU); không verify được mới hỏi Supabase
+        status, claims = verify_access_token(access_token)
+        if status == INVALID:
+            return jsonify({'success': False, 'message': 'Token không hợp lệ'}), 401
 
-        supabase_admin = create_client(sb_url, sb_service_key)
+        supabase_admin = get_supabase_admin()
+        if status == VERIFIED:
+            user_id = claims['sub']
+            email = claims.get('email')
+            meta = claims.get('user_metadata') or {}
+        else:
+            if supabase_admin is None:
+                return jsonify({'success': False, 'message': 'Server misconfig'}), 500
 
-        user_response = supabase_admin.auth.get_user(access_token)
-        if not user_response or not user_response.user:
-            return jsonify({'success': False, 'message': 'Token không hợp lệ'}), 401
+            user_response = supabase_admin.auth.get_user(access_token)
+            if not user_response or not user_response.user:
+                return jsonify({'success': False, 'message': 'Token không hợp lệ'}), 401
 
-        user = user_response.user
-        meta = user.user_metadata or {}
+            user_id = user_response.user.id
+            email = user_response.user.email
+            meta = user_response.user.user_metadata or {}
 
-        full_name = meta.get('full_name') or meta.get('name') or user.email.split('@')[0]
-        safe_email = user.email or f"{user.id}@no-email.provider"
+        safe_email = email or f"{user_id}@no-email.provider"
+        full_name = meta.get('full_name') or meta.get('name') or safe_email.split('@')[0]
 
         user_data = {
-            "user_id": user.id,
+            "user_id": user_id,
             "email": safe_email,
             "username": full_name,
             "auth_type": "email",
-            "social_id": user.id,
+            "social_id": user_id,
             "is_guest": False,
         }
 
-        supabase_admin.table("users").upsert(user_data).execute()
+        # Cache đã có đúng dòng này -> users/UserProfile đã được sync, bỏ qua upsert
+        cached = peek_user_row(user_id)
+        if not cached or any(cached.get(k) != v for k, v in user_data.items()):
+            if supabase_admin is None:
+                return jsonify({'success': False, 'message': 'Server misconfig'}), 500
 
-        try:
-            supabase_admin.table("UserProfile").upsert({
-                "user_id": user.id,
-                "default_mode": 0,
-                "age_group": "balanced"
-            }, on_conflict="user_id").execute()
-        except Exception:
-            pass
+            result = supabase_admin.table("users").upsert(user_data).execute()
+            if result.data:
+                set_user_row(user_id, result.data[0])
+            else:
+                invalidate_user(user_id)
+
+            try:
+                supabase_admin.table("UserProfile").upsert({
+                    "user_id": user_id,
+                    "default_mode": 0,
+                    "age_group": "balanced"
+                }, on_conflict="user_id").execute()
+            except Exception:
+                pass
 
         local_user = User(
-            user.id,
+            user_id,
             safe_email,
             full_name,
             "email",
@@ -12,10 +12,18 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 # ---------------------------------------------
 
-from ..utils.bus_routing import find_smart_bus_route, plan_multi_stop_bus_trip
+from ..utils.bus_routing import find_smart_bus_route, plan_multi_stop_bus_trip, get_path_by_handle
+from ..utils.job_queue import register_task
+from .jobs import job_accepted_response
+from ..utils.geometry import POLYLINE_FORMAT, compact_bus_result, encode_polyline, resolve_tolerance, wants_polyline
 
 bus_bp = Blueprint('bus_api', __name__, url_prefix='/api/bus')
 
+register_task(
+    'bus_plan_multi_trip',
+    lambda params: plan_multi_stop_bus_trip(params['waypoints'], optimize_order=params.get('optimize_order', False))
+)
+
 @bus_bp.route('/find', methods=['POST'])
 def find_route():
     print("\n-------------------------------------------------")
@@ -36,12 +44,21 @@ def find_route():
         print(f"📍 Start: {start}")
         print(f"📍 End: {end}")
 
+        # lazy_geometry=true: trả tóm tắt + geometry handle, đường vẽ lấy sau qua /api/bus/geometry
+        lazy_geometry = bool(data.get('lazy_geometry', False))
+        # tolerance_m hoặc zoom: đơn giản hóa path cho vừa độ chi tiết bản đồ
+        tolerance_m = resolve_tolerance(data)
+
         # 2. Gọi thuật toán
         print("⚙️ Đang gọi hàm find_smart_bus_route...")
-        result = find_smart_bus_route(start, end)
+        result = find_smart_bus_route(start, end, lazy_geometry=lazy_geometry, tolerance_m=tolerance_m)
         
         print("✅ Kết quả trả về từ thuật toán:")
         print(result) # In kết quả ra xem có bị None không
+
+        # geometry_format=polyline: nén path thành encoded polyline + bảng geometry dùng chung
+        if wants_polyline(data):
+            result = compact_bus_result(result)
         
         return jsonify(result)
 
@@ -63,13 +80,61 @@ def plan_multi_trip():
 
         print(f"📍 Nhận được {len(waypoints)} điểm dừng.")
         
-        # Gọi hàm xử lý đa điểm
-        result = plan_multi_stop_bus_trip(waypoints)
+        # Gọi hàm xử lý đa điểm (optimize_order: sắp lại các điểm giữa)
+        optimize_order = bool(data.get('optimize_order', False))
+
+        # async=true: chạy nền, trả job_id ngay -> poll /api/jobs/<job_id>/result
+        if data.get('async'):
+            return job_accepted_response('bus_plan_multi_trip', {'waypoints': waypoints, 'optimize_order': optimize_order})
+
+        result = plan_multi_stop_bus_trip(waypoints, optimize_order=optimize_order)
         return jsonify(result)
     except Exception as e:
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)})
 
+@bus_bp.route('/geometry', methods=['GET', 'POST'])
+def get_geometry():
+    """
+    Lấy đường vẽ theo geometry handle (dùng với /find?lazy_geometry=true)
+    - GET  /api/bus/geometry?handle=path:...
+    - POST /api/bus/geometry  {"handles": ["path:...", ...]}
+    Thêm geometry_format=polyline để nhận encoded polyline thay vì mảng tọa độ,
+    tolerance_m (mét) hoặc zoom để nhận path đã đơn giản hóa
+    """
+    try:
+        if request.method == 'GET':
+            data = request.args
+            handles = request.args.getlist('handle')
+        else:
+            data = request.get_json() or {}
+            handles = data.get('handles') or ([data['handle']] if data.get('handle') else [])
+        use_polyline = wants_polyline(data)
+        tolerance_m = resolve_tolerance(data)
+
+        if not handles or not isinstance(handles, list):
+            return jsonify({'success': False, 'error': 'Thiếu geometry handle'}), 400
+
+        paths = {}
+        invalid = []
+        for handle in handles:
+            path = get_path_by_handle(handle, tolerance_m=tolerance_m)
+            if path is None:
+                invalid.append(handle)
+            else:
+                paths[handle] = encode_polyline(path) if use_polyline else path
+
+        if invalid and not paths:
+            return jsonify({'success': False, 'error': 'Geometry handle không hợp lệ', 'invalid': invalid}), 400
+
+        result = {'success': True, 'paths': paths, 'invalid': invalid}
+        if use_polyline:
+            result['geometry_format'] = POLYLINE_FORMAT
+        return jsonify(result)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ========== THÊM ENDPOINT MỚI ==========
 @bus_bp.route('/validate-routes', methods=['GET'])
 def validate_all_routes():
@@ -1,14 +1,21 @@
+import hashlib
+import json
 import math
 import os
-from importlib import util as importlib_util
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from backend.routes.gemini_handler import GeminiBot
 import uuid
 
 from .pricing_score import UserRequest, WeatherContext, calculate_adaptive_scores
 
 from backend.routes.astar import AStarRouter
+from backend.utils.realtime_context import get_realtime_snapshot
+from backend.utils.session_store import create_session_store
+from backend.utils.cache_layer import cache_key, cache_single_flight
+from backend.utils.config import CACHE_CONFIG, CHAT_SESSION_CONFIG
 
 # [THÊM] Import logic tìm xe buýt (Bộ não của hệ thống Bus)
 try:
@@ -21,31 +28,15 @@ except ImportError:
 
 ROUTER = AStarRouter()
 
-def _load_realtime_module():
-    """
-    File real-times.py có dấu gạch ngang nên không import trực tiếp được.
-    Hàm này giúp load module đó để tái sử dụng hàm build_realtime_snapshot.
-    """
-    module_path = os.path.join(os.path.dirname(__file__), "real_times.py")
-    if not os.path.exists(module_path):
-        return None
-
-    spec = importlib_util.spec_from_file_location("routes.real_times_module", module_path)
-    if spec and spec.loader:
-        module = importlib_util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-        return module
-    return None
-
-
-REALTIME_MODULE = _load_realtime_module()
-BUILD_REALTIME_SNAPSHOT = getattr(REALTIME_MODULE, "build_realtime_snapshot", None)
-
 # Tạo Blueprint cho chatbot
 chatbot_bp = Blueprint('chatbot', __name__)
 
 # Lưu session chat - mỗi session có 1 GeminiBot riêng
-chat_sessions = {}
+# (LRU + hết hạn khi không hoạt động; CHAT_SESSION_BACKEND=redis để dùng chung giữa worker)
+chat_sessions = create_session_store(GeminiBot)
+
+# Pool tính trước lộ trình + giá khi form được gửi (không chặn request /api/form)
+TRIP_PLAN_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="trip-plan")
 
 @chatbot_bp.route('/api/health', methods=['GET'])
 def health_check():
@@ -58,82 +49,176 @@ def create_session():
     session_id = str(uuid.uuid4())
     
     # Tạo GeminiBot instance riêng cho mỗi session
-    chat_sessions[session_id] = {
-        "bot": GeminiBot(),
-        "history": [],
-        "form_data": None,
-        "session_started": False
-    }
+    chat_sessions.create(session_id)
     
     return jsonify({"session_id": session_id})
 
+def _fingerprint(*parts):
+    """Hash ngắn, ổn định của dữ liệu đầu vào (dict/list/số...)"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def _realtime_fingerprint(weather, traffic):
+    """
+    Chỉ đổi khi tình hình thực sự đổi (mưa/nắng, kẹt xe...) hoặc sang khung 15 phút mới
+    (context có giờ hiện tại để AI gợi ý "giờ vàng").
+    """
+    weather = weather or {}
+    traffic = traffic or {}
+    now = datetime.now()
+    return _fingerprint(
+        [weather.get("success"), weather.get("mo_ta"), weather.get("dang_mua"), round(weather.get("nhiet_do") or 0)],
+        [traffic.get("success"), traffic.get("trang_thai"), traffic.get("co_ket_xe")],
+        now.strftime('%Y%m%d%H'), now.minute // 15
+    )
+
+
+def _cached_block(session, name, key, build):
+    """Context block của session: chỉ build lại khi key (fingerprint đầu vào) đổi"""
+    cache = session.setdefault("context_cache", {})
+    entry = cache.get(name)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+    value = build()
+    cache[name] = (key, value)
+    return value
+
+
+def _compute_trip_plan(form_data, form_key):
+    """Context lộ trình + giá, dùng chung giữa session/worker có cùng form (CacheLayer)"""
+    return cache_single_flight(
+        cache_key("trip_plan", form_key),
+        lambda: build_advanced_pricing_context(form_data),
+        ttl=CACHE_CONFIG["TTL"]["trip_plan"]
+    )
+
+
+def _schedule_trip_plan(session, form_data):
+    """
+    Bắt đầu tính trip plan trong nền (nếu form đổi / chưa tính).
+    session["trip_plan"] = (form_key, Future) - chỉ sống trong process.
+    """
+    form_key = _fingerprint(form_data)
+    current = session.get("trip_plan")
+    if current is not None and current[0] == form_key:
+        return current[1]
+    future = TRIP_PLAN_EXECUTOR.submit(_compute_trip_plan, form_data, form_key)
+    session["trip_plan"] = (form_key, future)
+    return future
+
+
+def _get_trip_plan_context(session, form_data):
+    """
+    Lượt chat dùng lại kết quả đã tính (hoặc chờ lần tính đang chạy tối đa TRIP_PLAN_WAIT giây).
+    Quá hạn -> lượt này bỏ block lộ trình, lần tính vẫn chạy tiếp cho lượt sau;
+    lỗi / None (geocode, OSRM hỏng) -> bỏ future để lượt sau tính lại.
+    """
+    try:
+        result = _schedule_trip_plan(session, form_data).result(timeout=CHAT_SESSION_CONFIG["TRIP_PLAN_WAIT"])
+    except FutureTimeoutError:
+        print(f"[Pricing] Trip plan chưa xong sau {CHAT_SESSION_CONFIG['TRIP_PLAN_WAIT']}s, bỏ qua lượt này")
+        return None
+    except Exception as exc:
+        print(f"[Pricing] Lỗi tính trip plan: {exc}")
+        session.pop("trip_plan", None)
+        return None
+    if result is None:
+        session.pop("trip_plan", None)
+    return result
+
+
+def prepare_chat_turn(session):
+    """
+    Chuẩn bị 1 lượt chat: start session Gemini (nếu có form) + ghép context
+    realtime & pricing. Trả về (combined_context, context_key):
+      - block pricing được cache theo form + realtime
+      - block lộ trình tính 1 lần / form (thường đã tính sẵn từ lúc /api/form)
+      - context_key đổi khi đầu vào đổi -> bot chỉ gửi lại context khi cần
+    """
+    bot = session["bot"]
+
+    # Nếu chưa start session và có form_data (hoặc lịch sử cũ cần dựng lại), start với context
+    if not session["session_started"] and (
+            session.get("form_data") or (session["history"] and bot.chat_session is None)):
+        form_data = session.get("form_data")
+        context = format_form_context(form_data) if form_data else None
+        bot.start_session(context, past_turns=session["history"])
+        session["session_started"] = True
+
+    context_blocks = []
+    realtime_weather = None
+    realtime_traffic = None
+    realtime_key = None
+
+    try:
+        # Đọc từ cache realtime (làm mới nền), không gọi API mỗi tin nhắn
+        realtime_snapshot = get_realtime_snapshot()
+        context_blocks.append(realtime_snapshot.get("context"))
+        realtime_weather = realtime_snapshot.get("weather")
+        realtime_traffic = realtime_snapshot.get("traffic")
+        realtime_key = _realtime_fingerprint(realtime_weather, realtime_traffic)
+    except Exception as realtime_err:
+        print(f"[Realtime] Lỗi khi lấy dữ liệu: {realtime_err}")
+
+    form_key = None
+    advanced_context = None
+    form_data = session.get("form_data")
+    if form_data:
+        form_key = _fingerprint(form_data)
+        pricing_context = _cached_block(
+            session, "pricing", (form_key, realtime_key),
+            lambda: build_pricing_context(form_data, realtime_weather, realtime_traffic)
+        )
+        if pricing_context:
+            context_blocks.append(pricing_context)
+            
+        advanced_context = _get_trip_plan_context(session, form_data)
+        if advanced_context:
+            context_blocks.append(advanced_context)
+
+    combined_context = "\n\n".join([c for c in context_blocks if c]) or None
+    # Block lộ trình có thể tới muộn (lượt trước chờ quá hạn) -> key đổi để gửi lại context
+    return combined_context, _fingerprint(form_key, realtime_key, bool(advanced_context))
+
+
+def validate_chat_request(data):
+    """
+    Trả về (session_id, session, message, None) hoặc (None, None, None, (error_dict, status)).
+    Không phụ thuộc Flask -> dùng chung cho backend/asgi.py.
+    """
+    if not data:
+        return None, None, None, ({"error": "No data provided"}, 400)
+
+    session_id = data.get('session_id')
+    message = data.get('message')
+
+    # Validate
+    if not session_id or not message:
+        return None, None, None, ({"error": "Missing session_id or message"}, 400)
+
+    session = chat_sessions.get(session_id)
+    if session is None:
+        return None, None, None, ({"error": "Invalid session"}, 400)
+
+    return session_id, session, message, None
+
+
 @chatbot_bp.route('/api/chat', methods=['POST'])
 def chat():
     """Endpoint xử lý chat"""
     try:
-        data = request.json
-        
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
+        session_id, session, message, error = validate_chat_request(request.json)
+        if error:
+            return jsonify(error[0]), error[1]
         
-        session_id = data.get('session_id')
-        message = data.get('message')
-        
-        # Validate
-        if not session_id or not message:
-            return jsonify({"error": "Missing session_id or message"}), 400
-        
-        if session_id not in chat_sessions:
-            return jsonify({"error": "Invalid session"}), 400
-        
-        session = chat_sessions[session_id]
-        bot = session["bot"]
-        
-        # Nếu chưa start session và có form_data, start với context
-        if not session["session_started"] and session.get("form_data"):
-            form_data = session["form_data"]
-            context = format_form_context(form_data)
-            bot.start_session(context)
-            session["session_started"] = True
-        
-        # Gọi Gemini chat
-        context_blocks = []
-        realtime_weather = None
-        realtime_traffic = None
-
-        if BUILD_REALTIME_SNAPSHOT:
-            try:
-                realtime_snapshot = BUILD_REALTIME_SNAPSHOT()
-                context_blocks.append(realtime_snapshot.get("context"))
-                realtime_weather = realtime_snapshot.get("weather")
-                realtime_traffic = realtime_snapshot.get("traffic")
-            except Exception as realtime_err:
-                print(f"[Realtime] Lỗi khi lấy dữ liệu: {realtime_err}")
-        else:
-            print("[Realtime] Không thể load module real-times.py")
-
-        if session.get("form_data"):
-            pricing_context = build_pricing_context(
-                session["form_data"],
-                realtime_weather,
-                realtime_traffic
-            )
-            if pricing_context:
-                context_blocks.append(pricing_context)
-                
-            advanced_context = build_advanced_pricing_context(session["form_data"])
-            if advanced_context:
-                context_blocks.append(advanced_context)
-
-        combined_context = "\n\n".join([c for c in context_blocks if c]) or None
+        combined_context, context_key = prepare_chat_turn(session)
 
-        response_text = bot.chat(message, context=combined_context)
+        # Gọi Gemini chat
+        response_text = session["bot"].chat(message, context=combined_context, context_key=context_key)
         
         # Lưu lịch sử
-        session["history"].append({
-            "user": message,
-            "bot": response_text
-        })
+        chat_sessions.append_turn(session_id, session, message, response_text)
         
         return jsonify({
             "response": response_text,
@@ -144,6 +229,52 @@ def chat():
         print(f"Error in chat endpoint: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+
+def sse_event(data, event=None):
+    """Đóng gói 1 sự kiện Server-Sent Events"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n" if event else f"data: {payload}\n\n"
+
+
+@chatbot_bp.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Chat dạng stream (SSE): gửi từng đoạn text ngay khi Gemini sinh ra.
+      data: {"token": "..."}                      - mỗi đoạn text
+      event: done / data: {"session_id": "..."}   - kết thúc, lịch sử đã được lưu
+    """
+    try:
+        session_id, session, message, error = validate_chat_request(request.json)
+        if error:
+            return jsonify(error[0]), error[1]
+
+        combined_context, context_key = prepare_chat_turn(session)
+    except Exception as e:
+        print(f"Error in chat stream endpoint: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+    def generate():
+        parts = []
+        for token in session["bot"].chat_stream(message, context=combined_context,
+                                                  context_key=context_key):
+            parts.append(token)
+            yield sse_event({"token": token})
+
+        # Chỉ lưu lịch sử khi Gemini giữ lượt này (stream lỗi / bị chặn / client ngắt thì bỏ,
+        # giống lịch sử của bot -> dựng lại session từ history không sinh lượt hỏng)
+        if session["bot"].last_stream_completed:
+            chat_sessions.append_turn(session_id, session, message, "".join(parts))
+        yield sse_event({"session_id": session_id}, event="done")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Tắt buffer của nginx để token tới ngay
+        }
+    )
+
 @chatbot_bp.route('/api/form', methods=['POST'])
 def submit_form():
     """Nhận dữ liệu từ form"""
@@ -156,16 +287,15 @@ def submit_form():
             return jsonify({"error": "Missing session_id"}), 400
         
         # Tạo session mới nếu chưa có
-        if session_id not in chat_sessions:
-            chat_sessions[session_id] = {
-                "bot": GeminiBot(),
-                "history": [],
-                "form_data": None,
-                "session_started": False
-            }
+        session = chat_sessions.get_or_create(session_id)
         
         # Lưu form data
-        chat_sessions[session_id]["form_data"] = form_data
+        session["form_data"] = form_data
+        chat_sessions.save(session_id, session)
+
+        # Tính trước lộ trình + giá trong nền -> tin nhắn đầu tiên không phải chờ
+        if form_data:
+            _schedule_trip_plan(session, form_data)
         
         return jsonify({"status": "success"})
         
@@ -180,10 +310,11 @@ def reset_session():
         data = request.json
         session_id = data.get('session_id')
         
-        if session_id in chat_sessions:
-            chat_sessions[session_id]["bot"].reset_session()
-            chat_sessions[session_id]["history"] = []
-            chat_sessions[session_id]["session_started"] = False
+        session = chat_sessions.get(session_id) if session_id else None
+        if session is not None:
+            session["bot"].reset_session()
+            session["session_started"] = False
+            chat_sessions.clear_history(session_id, session)
             
         return jsonify({"status": "success"})
         
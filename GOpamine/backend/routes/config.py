@@ -12,6 +12,10 @@ load_dotenv(env_path)
 class Config:
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     WEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
+
+    # Ngân sách token cho lịch sử chat gửi lên Gemini (ước lượng ~4 ký tự / token)
+    CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', 8000))
+    CHAT_KEEP_RECENT_TURNS = int(os.getenv('CHAT_KEEP_RECENT_TURNS', 4))  # Số lượt gần nhất luôn giữ nguyên
     
     # Cấu hình Database mới (PostgreSQL)
     # Thay thế cho DATABASE_PATH = 'data/transport.db' cũ
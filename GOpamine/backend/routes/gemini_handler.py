@@ -1,12 +1,12 @@
+import threading
+
 import google.generativeai as genai
 from backend.routes.config import Config 
 
-class GeminiBot:
-    def __init__(self):
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        
-        # System prompt - Định nghĩa vai trò và nhiệm vụ của bot
-        self.system_instruction = """
+MODEL_NAME = 'gemini-2.0-flash-exp'
+
+# System prompt - Định nghĩa vai trò và nhiệm vụ của bot
+SYSTEM_INSTRUCTION = """
 Bạn là trợ lý AI chuyên về lập kế hoạch di chuyển và giao thông tại Thành phố Hồ Chí Minh, Việt Nam. Tên bạn là "GOpamine Assistant".
 
 **QUY TẮC NGÔN NGỮ (QUAN TRỌNG NHẤT):**
@@ -107,49 +107,201 @@ LƯU Ý QUAN TRỌNG:
 - Nếu người dùng hỏi bằng tiếng anh, hoặc nhận dữ liệu bằng tiếng anh thì bạn cũng phải trả lại lại bằng tiếng anh cũng với format như tiếng việt.
 """
 
-        # Khởi tạo model với system instruction
-        self.model = genai.GenerativeModel(
-            'gemini-2.0-flash-exp',
-            system_instruction=self.system_instruction
-        )
+# Context (realtime, giá...) được ghép trước tin nhắn người dùng bằng dấu phân cách này
+CONTEXT_SEPARATOR = "\n\nNgười dùng: "
+FORM_INFO_PREFIX = "Thông tin của tôi: "
+SUMMARY_HEADER = "[TÓM TẮT CÁC CÂU HỎI TRƯỚC ĐÓ]"
+CHARS_PER_TOKEN = 4           # Ước lượng token nhanh, không cần gọi count_tokens
+SUMMARY_MAX_LINES = 10
+SUMMARY_LINE_CHARS = 160
+
+
+def estimate_tokens(text):
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def strip_context(text):
+    """'<context>\n\nNgười dùng: câu hỏi' -> 'câu hỏi'"""
+    if CONTEXT_SEPARATOR in text:
+        return text.rsplit(CONTEXT_SEPARATOR, 1)[1]
+    return text
+
+
+def trim_chat_history(messages, token_budget, keep_recent_turns):
+    """
+    messages: [(role, text), ...] theo cặp user/model.
+    1. Bỏ context cũ khỏi mọi tin nhắn user, trừ tin gần nhất còn mang context
+    2. Vượt ngân sách token -> gộp các lượt cũ thành 1 cặp tóm tắt (giữ cặp thông tin form
+       ở đầu và keep_recent_turns lượt cuối nguyên vẹn)
+    Trả về list mới (hoặc chính messages nếu không đổi).
+    """
+    messages = list(messages)
+    changed = False
+
+    last_ctx = max((i for i, (role, text) in enumerate(messages)
+                    if role == "user" and CONTEXT_SEPARATOR in text), default=None)
+    for i, (role, text) in enumerate(messages):
+        if role == "user" and i != last_ctx and CONTEXT_SEPARATOR in text:
+            messages[i] = (role, strip_context(text))
+            changed = True
+
+    total = sum(estimate_tokens(text) for _, text in messages)
+    if total <= token_budget:
+        return messages if changed else None
+
+    # Cặp cố định ở đầu: thông tin form / tóm tắt cũ
+    head, summary_lines = [], []
+    start = 0
+    while start + 1 < len(messages) and messages[start][0] == "user":
+        text = messages[start][1]
+        if text.startswith(FORM_INFO_PREFIX):
+            head.extend(messages[start:start + 2])
+        elif text.startswith(SUMMARY_HEADER):
+            summary_lines.extend(text.split("\n")[1:])
+        else:
+            break
+        start += 2
+
+    recent_start = max(start, len(messages) - keep_recent_turns * 2)
+    body = messages[start:recent_start]
+    recent = messages[recent_start:]
+
+    # Bỏ dần cặp cũ nhất cho tới khi vừa ngân sách
+    while body and total > token_budget:
+        (_, user_text), (_, model_text) = body[0], body[1]
+        total -= estimate_tokens(user_text) + estimate_tokens(model_text)
+        question = " ".join(strip_context(user_text).split())
+        summary_lines.append(f"- {question[:SUMMARY_LINE_CHARS]}")
+        body = body[2:]
+
+    summary_lines = summary_lines[-SUMMARY_MAX_LINES:]
+    summary = []
+    if summary_lines:
+        summary = [
+            ("user", "\n".join([SUMMARY_HEADER] + summary_lines)),
+            ("model", "Tôi đã nắm các câu hỏi trước đó của bạn."),
+        ]
+    return head + summary + body + recent
+
+
+# Model dùng chung cho mọi session (cấu hình genai + dựng model chỉ 1 lần / process).
+# GenerativeModel không giữ trạng thái hội thoại; mỗi session có ChatSession riêng.
+_shared_model = None
+_model_lock = threading.Lock()
+
+
+def get_shared_model():
+    """Trả về GenerativeModel dùng chung, tạo lười lần đầu (thread-safe)"""
+    global _shared_model
+    if _shared_model is None:
+        with _model_lock:
+            if _shared_model is None:
+                genai.configure(api_key=Config.GEMINI_API_KEY)
+                _shared_model = genai.GenerativeModel(
+                    MODEL_NAME,
+                    system_instruction=SYSTEM_INSTRUCTION
+                )
+    return _shared_model
+
+
+class GeminiBot:
+    def __init__(self):
+        # Tạo bot rẻ: chỉ giữ ChatSession riêng, model lấy từ bản dùng chung
+        self.system_instruction = SYSTEM_INSTRUCTION
+        self.model = get_shared_model()
         
         # Khởi tạo chat session
         self.chat_session = None
+        # Fingerprint của context đã gửi gần nhất (trùng thì không gửi lại)
+        self._sent_context_key = None
+        # Lượt stream gần nhất có được Gemini giữ trong lịch sử không (route dựa vào để lưu history)
+        self.last_stream_completed = False
     
-    def start_session(self, context=None):
-        """Bắt đầu session chat mới"""
+    def start_session(self, context=None, past_turns=None):
+        """
+        Bắt đầu session chat mới
+        - past_turns: [{"user", "bot"}, ...] lịch sử cũ (dựng lại session sau restart / worker khác)
+        """
         history = []
         
         if context:
             # Thêm context từ form vào history
             history.append({
                 "role": "user",
-                "parts": [f"Thông tin của tôi: {context}"]
+                "parts": [f"{FORM_INFO_PREFIX}{context}"]
             })
             history.append({
                 "role": "model",
                 "parts": ["Tôi đã ghi nhận thông tin của bạn. Tôi sẵn sàng hỗ trợ bạn lên kế hoạch di chuyển! 🚗"]
             })
+
+        for turn in past_turns or []:
+            history.append({"role": "user", "parts": [turn["user"]]})
+            history.append({"role": "model", "parts": [turn["bot"]]})
         
         self.chat_session = self.model.start_chat(history=history)
+        self._sent_context_key = None
         return self.chat_session
+
+    @staticmethod
+    def _content_text(content):
+        parts = content["parts"] if isinstance(content, dict) else content.parts
+        return "".join(p if isinstance(p, str) else getattr(p, "text", "") for p in parts)
+
+    def trim_history(self):
+        """Giữ lịch sử gửi lên Gemini trong ngân sách token (Config.CHAT_HISTORY_TOKEN_BUDGET)"""
+        if not self.chat_session:
+            return
+        messages = [
+            (c["role"] if isinstance(c, dict) else c.role, self._content_text(c))
+            for c in self.chat_session.history
+        ]
+        trimmed = trim_chat_history(messages, Config.CHAT_HISTORY_TOKEN_BUDGET, Config.CHAT_KEEP_RECENT_TURNS)
+        if trimmed is None:
+            return
+
+        self.chat_session.history = [{"role": role, "parts": [text]} for role, text in trimmed]
+        # Tin mang context đã bị gộp vào tóm tắt -> lượt sau phải gửi lại context
+        if not any(role == "user" and CONTEXT_SEPARATOR in text for role, text in trimmed):
+            self._sent_context_key = None
     
-    def chat(self, message, context=None, history=None):
+    def _prepare_message(self, message, context=None, context_key=None):
+        """
+        Tạo session nếu chưa có + cắt lịch sử + ghép context vào tin nhắn.
+        context_key trùng lần gửi trước -> context đã nằm trong lịch sử, không gửi lại.
+        """
+        if not self.chat_session:
+            self.start_session(context)
+        self.trim_history()
+
+        if context and (context_key is None or context_key != self._sent_context_key):
+            self._sent_context_key = context_key
+            return f"{context}{CONTEXT_SEPARATOR}{message}"
+        return message
+
+    @staticmethod
+    def _error_message(e):
+        """Đổi exception của Gemini thành câu trả lời thân thiện"""
+        print(f"Gemini error: {str(e)}")
+
+        # Xử lý lỗi cụ thể
+        if "quota" in str(e).lower():
+            return "⚠️ Hệ thống đang quá tải. Vui lòng thử lại sau vài giây."
+        elif "safety" in str(e).lower():
+            return "⚠️ Tin nhắn của bạn vi phạm chính sách an toàn. Vui lòng diễn đạt khác đi."
+        else:
+            return f"❌ Đã xảy ra lỗi: {str(e)}"
+
+    def chat(self, message, context=None, history=None, context_key=None):
         """
         Chat với Gemini
         - message: tin nhắn từ user
         - context: thông tin từ form (nếu có)
         - history: lịch sử chat (để duy trì ngữ cảnh)
+        - context_key: fingerprint của context (giống lần trước -> không gửi lại)
         """
         try:
-            # Nếu chưa có session, tạo mới
-            if not self.chat_session:
-                self.start_session(context)
-            
-            final_message = message
-            if context:
-                final_message = f"{context}\n\nNgười dùng: {message}"
-
+            final_message = self._prepare_message(message, context, context_key)
             response = self.chat_session.send_message(final_message)
             
             if response and hasattr(response, 'text'):
@@ -158,16 +310,114 @@ LƯU Ý QUAN TRỌNG:
                 return "Xin lỗi, tôi không thể tạo phản hồi. Bạn có thể hỏi lại không? 😊"
                 
         except Exception as e:
-            print(f"Gemini error: {str(e)}")
-            
-            # Xử lý lỗi cụ thể
-            if "quota" in str(e).lower():
-                return "⚠️ Hệ thống đang quá tải. Vui lòng thử lại sau vài giây."
-            elif "safety" in str(e).lower():
-                return "⚠️ Tin nhắn của bạn vi phạm chính sách an toàn. Vui lòng diễn đạt khác đi."
-            else:
-                return f"❌ Đã xảy ra lỗi: {str(e)}"
+            self._sent_context_key = None
+            return self._error_message(e)
+
+    @staticmethod
+    def _chunk_text(chunk):
+        """chunk.text raise ValueError khi chunk không có phần text (VD: chunk cuối chỉ có finish_reason)"""
+        try:
+            return chunk.text
+        except (AttributeError, ValueError):
+            return None
+
+    def _commit_turn(self):
+        """Đọc history để Gemini chốt lượt vừa stream; finish_reason xấu (SAFETY...) -> False"""
+        try:
+            self.chat_session.history
+            return True
+        except Exception:
+            return False
+
+    def _discard_turn(self, response):
+        """
+        Lượt stream không chạy hết (lỗi, SAFETY, client ngắt) -> bỏ khỏi lịch sử Gemini.
+        Chỉ rewind khi response của CHÍNH lượt này đã được gắn vào session (last is response);
+        send_message lỗi trước đó thì last vẫn là lượt tốt trước, không được đụng vào.
+        """
+        self._sent_context_key = None
+        if response is None or self.chat_session is None:
+            return
+        try:
+            if self.chat_session.last is response:
+                self.chat_session.rewind()
+        except Exception:
+            # Không rewind được -> bỏ session, lượt sau dựng lại
+            self.chat_session = None
+
+    def chat_stream(self, message, context=None, context_key=None):
+        """
+        Giống chat() nhưng trả về generator từng đoạn text ngay khi Gemini sinh ra
+        (send_message stream=True). Lỗi -> yield câu báo lỗi rồi dừng.
+        Lượt chỉ được giữ trong lịch sử Gemini khi stream chạy hết và có nội dung.
+        """
+        response = None
+        completed = False
+        try:
+            final_message = self._prepare_message(message, context, context_key)
+            response = self.chat_session.send_message(final_message, stream=True)
+
+            emitted = False
+            for chunk in response:
+                text = self._chunk_text(chunk)
+                if text:
+                    emitted = True
+                    yield text
+
+            completed = emitted and self._commit_turn()
+            if not completed:
+                yield "Xin lỗi, tôi không thể tạo phản hồi. Bạn có thể hỏi lại không? 😊"
+
+        except Exception as e:
+            yield self._error_message(e)
+        finally:
+            self.last_stream_completed = completed
+            if not completed:
+                self._discard_turn(response)
+    
+    # ==================== ASYNC (dùng cho backend/asgi.py) ====================
+
+    async def chat_async(self, message, context=None, context_key=None):
+        """Như chat() nhưng await Gemini (send_message_async), không giữ thread khi chờ"""
+        try:
+            final_message = self._prepare_message(message, context, context_key)
+            response = await self.chat_session.send_message_async(final_message)
+
+            if response and hasattr(response, 'text'):
+                return response.text
+            return "Xin lỗi, tôi không thể tạo phản hồi. Bạn có thể hỏi lại không? 😊"
+
+        except Exception as e:
+            self._sent_context_key = None
+            return self._error_message(e)
+
+    async def chat_stream_async(self, message, context=None, context_key=None):
+        """Như chat_stream() nhưng là async generator"""
+        response = None
+        completed = False
+        try:
+            final_message = self._prepare_message(message, context, context_key)
+            response = await self.chat_session.send_message_async(final_message, stream=True)
+
+            emitted = False
+            async for chunk in response:
+                text = self._chunk_text(chunk)
+                if text:
+                    emitted = True
+                    yield text
+
+            completed = emitted and self._commit_turn()
+            if not completed:
+                yield "Xin lỗi, tôi không thể tạo phản hồi. Bạn có thể hỏi lại không? 😊"
+
+        except Exception as e:
+            yield self._error_message(e)
+        finally:
+            self.last_stream_completed = completed
+            if not completed:
+                self._discard_turn(response)
     
     def reset_session(self):
         """Reset chat session"""
-        self.chat_session = None
\ No newline at end of file
+        self.chat_session = None
+        self._sent_context_key = None
\ No newline at end of file
@@ -0,0 +1,46 @@
+"""
+JOB ROUTES - Trạng thái & kết quả các job chạy nền (backend/utils/job_queue.py)
+  - GET /api/jobs/<job_id>         : trạng thái (queued | running | done | failed)
+  - GET /api/jobs/<job_id>/result  : 200 + kết quả khi xong, 202 khi còn chạy
+"""
+
+from flask import Blueprint, jsonify, url_for
+
+from backend.utils.job_queue import get_job, submit_job
+
+jobs_bp = Blueprint('jobs_api', __name__, url_prefix='/api/jobs')
+
+
+def job_accepted_response(task, payload):
+    """Dùng cho endpoint có cờ async: đẩy job vào hàng đợi, trả 202 + link poll"""
+    job_id, deduplicated = submit_job(task, payload)
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'deduplicated': deduplicated,
+        'status_url': url_for('jobs_api.job_status', job_id=job_id),
+        'result_url': url_for('jobs_api.job_result', job_id=job_id)
+    }), 202
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Không tìm thấy job (sai id hoặc đã hết hạn)'}), 404
+
+    job.pop('result', None)
+    return jsonify({'success': True, 'data': job})
+
+
+@jobs_bp.route('/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Không tìm thấy job (sai id hoặc đã hết hạn)'}), 404
+
+    if job['status'] == 'done':
+        return jsonify(job['result'])
+    if job['status'] == 'failed':
+        return jsonify({'success': False, 'status': 'failed', 'error': job['error']}), 500
+    return jsonify({'success': True, 'status': job['status'], 'job_id': job_id}), 202
@@ -1,5 +1,4 @@
 import os  # Thư viện tương tác với hệ điều hành (lấy biến môi trường, đường dẫn...)
-import sys  # Thư viện tương tác với hệ thống Python (kiểm tra modules đã load...)
 import math  # Thư viện toán học (làm tròn...)
 from datetime import datetime  # Thư viện xử lý ngày giờ (để check giờ cao điểm)
 
@@ -17,6 +16,12 @@ except ImportError:  # Nếu lỗi (do chạy từ thư mục khác cấu trúc)
         cost_estimation = None  # Gán None để code không bị crash, chỉ tắt tính năng này
         real_times = None
 
+try:
+    # Thời tiết đọc từ cache realtime dùng chung (làm mới nền), không gọi API mỗi request
+    from backend.utils.realtime_context import get_realtime_weather
+except ImportError:  # Chạy file lẻ ngoài project -> gọi API trực tiếp như cũ
+    get_realtime_weather = None
+
 # ==============================================================================
 # 2. CẤU HÌNH (CONSTANTS)
 # ==============================================================================
@@ -65,10 +70,15 @@ def is_rush_hour():  # Hàm kiểm tra giờ cao điểm
 
 def get_real_weather_context():  # Hàm lấy dữ liệu thời tiết thực tế từ API
     ctx = WeatherContext()  # Tạo object mặc định (không mưa, không nóng)
-    if 'real_times' in sys.modules and real_times:  # Kiểm tra module real_times có tồn tại không
-        api_key = os.getenv("OPENWEATHER_API_KEY")   # Lấy API Key từ biến môi trường
+    if get_realtime_weather or real_times:  # Kiểm tra có nguồn dữ liệu thời tiết không
         try:
-            data = real_times.fetch_weather_realtime(api_key)  # Gọi hàm fetch thời tiết
+            if get_realtime_weather and real_times:
+                # Lấy từ cache (đã làm mới nền); lần đầu chưa có cache thì chờ tối đa SNAPSHOT_DEADLINE
+                data = real_times.run_with_deadline({"weather": get_realtime_weather})["weather"]
+            elif get_realtime_weather:
+                data = get_realtime_weather()
+            else:
+                data = real_times.fetch_weather_realtime(os.getenv("OPENWEATHER_API_KEY"))  # Gọi API trực tiếp
             if data.get("success"):  # Nếu gọi API thành công
                 ctx.is_raining = data.get("dang_mua", False)  # Cập nhật trạng thái mưa
                 ctx.is_hot = data.get("nhiet_do", 30) > 35    # Nếu > 35 độ thì coi là nóng
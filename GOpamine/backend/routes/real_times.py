@@ -1,8 +1,11 @@
 import os
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 from dotenv import load_dotenv
 
+from backend.utils.http_client import http_get
+
 # Load biến môi trường từ file .env
 load_dotenv()
 
@@ -17,6 +20,12 @@ TRAFFIC_KEY = os.getenv("TOMTOM_API_KEY")
 if not WEATHER_KEY or not TRAFFIC_KEY:
     print("⚠️ CẢNH BÁO: Chưa tìm thấy API Key trong file .env!")
 
+# Hạn chót chung cho 1 snapshot (giây): gọi song song, nguồn nào chậm hơn thì bỏ qua
+SNAPSHOT_DEADLINE = float(os.getenv("REALTIME_SNAPSHOT_DEADLINE", 5))
+
+# Pool dùng chung cho các lần gọi song song (request quá hạn vẫn chạy nốt trong pool)
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="realtime")
+
 # ... (Phần code bên dưới giữ nguyên) ...
 # ==============================================================================
 # 1. HÀM GỌI API THỜI TIẾT (OPENWEATHERMAP)
@@ -39,7 +48,7 @@ def fetch_weather_realtime(api_key, city="Ho Chi Minh City"):
     print(f"☁️ Đang gọi API thời tiết cho {city}...")
     
     try:
-        response = requests.get(url, params=params, timeout=5)
+        response = http_get(url, params=params, timeout=5)
         
         if response.status_code == 200:
             data = response.json()
@@ -75,7 +84,7 @@ def fetch_traffic_realtime(api_key, lat=10.7769, lon=106.7009):
     print("🚦 Đang gọi API giao thông TomTom...")
 
     try:
-        response = requests.get(url, params=params, timeout=5)
+        response = http_get(url, params=params, timeout=5)
         
         if response.status_code == 200:
             data = response.json()
@@ -104,22 +113,64 @@ def fetch_traffic_realtime(api_key, lat=10.7769, lon=106.7009):
         return {"success": False, "error": str(e)}
 
 # ==============================================================================
-# 3. THUẬT TOÁN TƯ VẤN (CORE ALGORITHM)
+# 3. GỌI SONG SONG CÓ HẠN CHÓT
+# ==============================================================================
+def run_with_deadline(tasks, deadline=None):
+    """
+    tasks: {tên: hàm không tham số} -> chạy song song, chờ tối đa `deadline` giây cho TẤT CẢ.
+    Trả về {tên: kết quả}; task chưa xong / lỗi -> {"success": False, "error": ...}
+    """
+    deadline = SNAPSHOT_DEADLINE if deadline is None else deadline
+    futures = {name: _EXECUTOR.submit(func) for name, func in tasks.items()}
+    end_at = time.monotonic() + deadline
+
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0.0, end_at - time.monotonic()))
+        except FutureTimeoutError:
+            print(f"⏱️ {name}: quá hạn {deadline}s, bỏ qua")
+            results[name] = {"success": False, "error": f"Hết thời gian chờ ({deadline}s)"}
+        except Exception as e:
+            results[name] = {"success": False, "error": str(e)}
+    return results
+
+
+# ==============================================================================
+# 4. THUẬT TOÁN TƯ VẤN (CORE ALGORITHM)
 # ==============================================================================
-def build_realtime_snapshot(city="Ho Chi Minh City", lat=10.7769, lon=106.7009):
+def build_realtime_snapshot(city="Ho Chi Minh City", lat=10.7769, lon=106.7009, deadline=None):
     """
     Trả về dict chứa dữ liệu thời gian thực + context string.
+    Thời tiết & giao thông gọi song song, chờ chung tối đa `deadline` giây;
+    nguồn nào trễ thì context chỉ có phần còn lại.
+    (Gọi API trực tiếp - code phục vụ request nên dùng backend.utils.realtime_context)
     """
     print("\n>>> BẮT ĐẦU CHẠY THUẬT TOÁN REAL-TIME <<<\n")
 
-    weather_data = fetch_weather_realtime(WEATHER_KEY, city=city)
-    traffic_data = fetch_traffic_realtime(TRAFFIC_KEY, lat=lat, lon=lon)
+    results = run_with_deadline({
+        "weather": lambda: fetch_weather_realtime(WEATHER_KEY, city=city),
+        "traffic": lambda: fetch_traffic_realtime(TRAFFIC_KEY, lat=lat, lon=lon),
+    }, deadline)
+    return compose_realtime_snapshot(results["weather"], results["traffic"])
+
+
+def _stale_note(data):
+    """Dữ liệu cũ (API đang lỗi, dùng bản trước đó) -> ghi rõ giờ cập nhật"""
+    if not data.get('stale'):
+        return ""
+    return f" (cập nhật lúc {datetime.fromtimestamp(data['fetched_at']).strftime('%H:%M')}, có thể đã cũ)"
 
+
+def compose_realtime_snapshot(weather_data, traffic_data):
+    """
+    Ghép dữ liệu thời tiết + giao thông (đã có sẵn) thành snapshot + context string.
+    """
     advices = []
     info_lines = []
 
     if weather_data.get("success"):
-        info_lines.append(f"- Thời tiết: {weather_data['mo_ta']}, {weather_data['nhiet_do']}°C.")
+        info_lines.append(f"- Thời tiết: {weather_data['mo_ta']}, {weather_data['nhiet_do']}°C.{_stale_note(weather_data)}")
 
         if weather_data.get('dang_mua'):
             advices.append("🌧️ [LUẬT MƯA]: Trời đang mưa. Ưu tiên gợi ý Taxi/Grab/Bus. Cảnh báo khách sẽ bị ướt nếu đi xe máy.")
@@ -129,7 +180,7 @@ def build_realtime_snapshot(city="Ho Chi Minh City", lat=10.7769, lon=106.7009):
         info_lines.append(f"- Thời tiết: Không lấy được dữ liệu ({weather_data.get('error')}).")
 
     if traffic_data.get("success"):
-        info_lines.append(f"- Giao thông: {traffic_data['trang_thai']} (Tốc độ: {traffic_data['toc_do']} km/h).")
+        info_lines.append(f"- Giao thông: {traffic_data['trang_thai']} (Tốc độ: {traffic_data['toc_do']} km/h).{_stale_note(traffic_data)}")
 
         if traffic_data.get('co_ket_xe'):
             advices.append("🚗 [LUẬT KẸT XE]: Đang kẹt xe. Khuyên khách dự trù thêm thời gian hoặc đi xe máy để linh hoạt hơn ô tô.")
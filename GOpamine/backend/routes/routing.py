@@ -1,7 +1,19 @@
 from flask import Blueprint, request, jsonify
 import requests
+from backend.routes.astar import AStarRouter
 from backend.routes.bus_manager import find_nearby_stations
 from backend.utils.bus_routing import find_smart_bus_route
+from backend.utils.http_client import http_get
+from backend.utils.osrm_client import fetch_osrm_route
+from backend.utils.geometry import (
+    POLYLINE_FORMAT,
+    compact_bus_result,
+    encode_polyline,
+    lonlat_to_latlng,
+    resolve_tolerance,
+    simplify_lonlat_path,
+    wants_polyline,
+)
 
 # Blueprint chỉ chứa logic/API của form để app.py phụ trách render template
 form_bp = Blueprint('form_api', __name__)
@@ -9,6 +21,9 @@ form_bp = Blueprint('form_api', __name__)
 # OSRM API (Open Source Routing Machine)
 OSRM_BASE_URL = "http://router.project-osrm.org/route/v1"
 
+# Geocode xuôi (tên -> tọa độ): place index -> cache -> Nominatim
+GEOCODER = AStarRouter()
+
 
 @form_bp.route('/api/find-route-osm', methods=['POST'])
 def find_route_osm():
@@ -29,26 +44,31 @@ def find_route_osm():
             }), 400
 
         profile = get_osrm_profile(vehicle_type)
-        coordinates = f"{start['lon']},{start['lat']};{end['lon']},{end['lat']}"
-
-        osrm_url = f"{OSRM_BASE_URL}/{profile}/{coordinates}"
         params = {
             'overview': 'full',
             'geometries': 'geojson',
             'steps': 'true'
         }
 
-        response = requests.get(osrm_url, params=params, timeout=10)
+        # Cache OSRM (tọa độ làm tròn + profile + options), có negative cache
+        osrm_data, error = fetch_osrm_route(
+            [(start['lon'], start['lat']), (end['lon'], end['lat'])],
+            profile=profile, params=params, timeout=10
+        )
 
-        if response.status_code != 200:
+        if error == 'timeout':
+            return jsonify({
+                'success': False,
+                'error': 'Timeout khi gọi OSRM API'
+            }), 504
+
+        if error and (error == 'unavailable' or error.startswith('http_')):
             return jsonify({
                 'success': False,
                 'error': 'Không thể tìm đường đi từ OSRM'
             }), 500
 
-        osrm_data = response.json()
-
-        if not osrm_data.get('routes'):
+        if not osrm_data or not osrm_data.get('routes'):
             return jsonify({
                 'success': False,
                 'error': 'Không tìm thấy tuyến đường phù hợp'
@@ -59,8 +79,12 @@ def find_route_osm():
         distance_m = route['distance']
         duration_s = route['duration']
 
+        # tolerance_m hoặc zoom: bỏ bớt điểm thừa (overview=full rất dày)
+        tolerance_m = resolve_tolerance(data)
+        if tolerance_m:
+            geometry = simplify_lonlat_path(geometry, tolerance_m)
+
         result = {
-            'route_coordinates': geometry,  # [[lon, lat], ...]
             'waypoints': [
                 {
                     'lat': start['lat'],
@@ -78,6 +102,13 @@ def find_route_osm():
             'total_waypoints': len(geometry)
         }
 
+        if wants_polyline(data):
+            # Encoded polyline theo thứ tự [lat, lng] chuẩn Google
+            result['route_polyline'] = encode_polyline(lonlat_to_latlng(geometry))
+            result['geometry_format'] = POLYLINE_FORMAT
+        else:
+            result['route_coordinates'] = geometry  # [[lon, lat], ...]
+
         return jsonify({
             'success': True,
             'data': result
@@ -108,6 +139,8 @@ def find_bus_route():
         start = data.get('start')
         end = data.get('end')
         limit = data.get('limit', 3)
+        lazy_geometry = bool(data.get('lazy_geometry', False))
+        tolerance_m = resolve_tolerance(data)
         
         if not start or not end:
             return jsonify({
@@ -119,7 +152,9 @@ def find_bus_route():
         end_coords = {'lat': end['lat'], 'lon': end['lon']}
         
         # Gọi hàm bus routing
-        result = find_smart_bus_route(start_coords, end_coords, skip_validation=True, limit=limit)
+        result = find_smart_bus_route(start_coords, end_coords, skip_validation=True, limit=limit, lazy_geometry=lazy_geometry, tolerance_m=tolerance_m)
+        if wants_polyline(data):
+            result = compact_bus_result(result)
         
         return jsonify(result), 200
         
@@ -133,8 +168,27 @@ def find_bus_route():
 def geocode_place():
     """
     Reverse geocoding: Từ tọa độ -> địa chỉ bằng Nominatim.
+    Forward geocoding: ?q=<tên địa điểm> -> tọa độ (gazetteer offline trước, Nominatim khi miss).
     """
     try:
+        q = request.args.get('q', '').strip()
+        if q:
+            place = GEOCODER.get_place_by_id(q)
+            if not place:
+                return jsonify({
+                    'success': False,
+                    'error': 'Không tìm thấy địa điểm'
+                }), 404
+            return jsonify({
+                'success': True,
+                'data': {
+                    'display_name': place.get('full_name') or place.get('name'),
+                    'name': place.get('name'),
+                    'lat': place['lat'],
+                    'lon': place['lon']
+                }
+            })
+
         lat = request.args.get('lat')
         lon = request.args.get('lon')
 
@@ -155,7 +209,7 @@ def geocode_place():
             'User-Agent': 'RouteOptimizer/1.0'
         }
 
-        response = requests.get(nominatim_url, params=params, headers=headers, timeout=15)
+        response = http_get(nominatim_url, params=params, headers=headers, timeout=15)
 
         if response.status_code != 200:
             return jsonify({
@@ -1,6 +1,8 @@
 import math
 import os
-import requests 
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 import logging  
 from datetime import datetime 
 from backend.database.supabase_client import supabase
@@ -15,6 +17,10 @@ from backend.utils.cache_layer import (
     cache_set,
     cache_key,
 )
+from backend.utils.config import API_CONFIG, BUS_SEARCH_CONFIG, CACHE_CONFIG
+from backend.utils.geometry import simplify_path, tolerance_bucket
+from backend.utils.osrm_client import fetch_osrm_route
+from backend.utils.tsp import solve_route_order
 
 # ========== THÊM SETUP LOGGING ==========
 def setup_route_logger():
@@ -71,68 +77,56 @@ def parse_path_string(path_str):
     except: pass
     return points
 
-def fetch_road_geometry_osrm(stops_list):
+def fetch_road_geometry_osrm(stops_list, with_status=False):
     """
     Gọi OSRM API để lấy đường đi thực tế
     IMPROVED: Retry logic, better timeout, error handling
+    with_status=True: trả (geometry, complete); complete=False nếu có chunk phải nối đường thẳng
     """
     if not stops_list or len(stops_list) < 2:
-        return stops_list
+        return (stops_list, True) if with_status else stops_list
     
     final_geometry = []
-    CHUNK_SIZE = 25
-    MAX_RETRIES = 2
+    complete = True
+    CHUNK_SIZE = API_CONFIG["OSRM_CHUNK_SIZE"]
+    MAX_RETRIES = API_CONFIG["OSRM_RETRIES"]
     
     for i in range(0, len(stops_list) - 1, CHUNK_SIZE - 1):
         chunk = stops_list[i : i + CHUNK_SIZE]
         if len(chunk) < 2:
             continue
         
-        coords_str = ";".join([f"{lon},{lat}" for lat, lon in chunk])
-        url = f"http://router.project-osrm.org/route/v1/driving/{coords_str}?overview=full&geometries=geojson"
+        # Routing backend (OSRM / local) + cache + retry nằm trong fetch_osrm_route
+        data, error = fetch_osrm_route(
+            [(lon, lat) for lat, lon in chunk],
+            params={'overview': 'full', 'geometries': 'geojson'},
+            timeout=3.0, retries=MAX_RETRIES
+        )
         
         success = False
-        
-        for attempt in range(MAX_RETRIES):
-            try:
-                resp = requests.get(url, timeout=3.0)  # Tăng timeout
-                
-                if resp.status_code == 200:
-                    data = resp.json()
-                    
-                    if data.get('code') == 'Ok':
-                        geo = data['routes'][0]['geometry']['coordinates']
-                        converted = [[p[1], p[0]] for p in geo]  # Swap lon/lat → lat/lon
-                        
-                        # Nối segment (tránh duplicate điểm)
-                        if len(final_geometry) > 0:
-                            final_geometry.extend(converted[1:])
-                        else:
-                            final_geometry.extend(converted)
-                        
-                        success = True
-                        break
-                    else:
-                        route_logger.warning(f"OSRM_CODE_ERROR | Code={data.get('code')} | Attempt={attempt+1}")
-                        
-            except requests.Timeout:
-                route_logger.warning(f"OSRM_TIMEOUT | Attempt={attempt+1}/{MAX_RETRIES}")
-                if attempt < MAX_RETRIES - 1:
-                    import time
-                    time.sleep(0.5)
-                    
-            except Exception as e:
-                route_logger.warning(f"OSRM_ERROR | Error={str(e)} | Attempt={attempt+1}")
-                break
+        if data:
+            geo = data['routes'][0]['geometry']['coordinates']
+            converted = [[p[1], p[0]] for p in geo]  # Swap lon/lat → lat/lon
+            
+            # Nối segment (tránh duplicate điểm)
+            if len(final_geometry) > 0:
+                final_geometry.extend(converted[1:])
+            else:
+                final_geometry.extend(converted)
+            
+            success = True
+        else:
+            route_logger.warning(f"OSRM_ERROR | Error={error} | Chunk={i//CHUNK_SIZE}")
         
         # Nếu tất cả retry đều fail → dùng đường thẳng
         if not success:
             route_logger.error(f"OSRM_FALLBACK_STRAIGHT | Chunk={i//CHUNK_SIZE}")
             final_geometry.extend(chunk)
+            complete = False
     
-    return final_geometry
+    return (final_geometry, complete) if with_status else final_geometry
 
-def get_official_path_from_db(route_id, direction, start_order, end_order):
+def get_official_path_from_db(route_id, direction, start_order, end_order, with_status=False):
     """
     FIX CUỐI CÙNG: Nối segment ĐÚNG, không vẽ chồng
     
@@ -140,13 +134,19 @@ def get_official_path_from_db(route_id, direction, start_order, end_order):
       - Không thêm trạm giữa 2 segment
       - Thay vào đó: Nối thẳng từ điểm cuối path A → điểm đầu path B
       - Nếu có gap → thêm điểm trạm làm điểm trung gian
+
+    with_status=True: trả (path, cacheable). Path dựng tạm khi OSRM lỗi (đường thẳng nối trạm)
+    KHÔNG được cache -> lần sau OSRM ổn lại thì có đường thật, không bị ghim đường thẳng.
     """
+    def result(path, cacheable):
+        return (path, cacheable) if with_status else path
+
     # Check cache trước
     cache_key_str = cache_key("path", route_id, direction, start_order, end_order)
     cached_path = cache_get(cache_key_str)
     if cached_path:
         route_logger.info(f"PATH_HIT | Cache hit for {cache_key_str}")
-        return cached_path
+        return result(cached_path, True)
     
     try:
         # Lấy tất cả trạm của tuyến từ cache (instant!)
@@ -160,11 +160,11 @@ def get_official_path_from_db(route_id, direction, start_order, end_order):
         
         if not stations:
             route_logger.error(f"NO_DATA | RouteID={route_id}")
-            return []
+            return result([], False)
         
     except Exception as e:
         route_logger.error(f"CACHE_ERROR | RouteID={route_id} | {str(e)}")
-        return []
+        return result([], False)
     
     # ========== KHỞI TẠO ==========
     first_station = stations[0]
@@ -255,7 +255,8 @@ def get_official_path_from_db(route_id, direction, start_order, end_order):
             f"PATH_SUCCESS | Route={route_id} | Points={len(full_path)} | "
             f"Stations={len(stations)} | Gaps={total_gaps} | Source=DATABASE"
         )
-        return full_path
+        cache_set(cache_key_str, full_path, ttl=CACHE_CONFIG["TTL"]["route_geometry"])
+        return result(full_path, True)
     
     # FALLBACK OSRM
     route_logger.info(
@@ -264,19 +265,23 @@ def get_official_path_from_db(route_id, direction, start_order, end_order):
     
     try:
         station_coords = [[s['Lat'], s['Lng']] for s in stations]
-        osrm_path = fetch_road_geometry_osrm(station_coords)
+        osrm_path, complete = fetch_road_geometry_osrm(station_coords, with_status=True)
         
         if osrm_path and len(osrm_path) > 0:
+            if not complete:
+                route_logger.warning(f"OSRM_PARTIAL | Route={route_id} | Straight-line fallback, not cached")
+                return result(osrm_path, False)
             route_logger.info(
                 f"OSRM_SUCCESS | Route={route_id} | Points={len(osrm_path)} | Source=OSRM"
             )
-            return osrm_path
+            cache_set(cache_key_str, osrm_path, ttl=CACHE_CONFIG["TTL"]["route_geometry"])
+            return result(osrm_path, True)
         else:
-            return full_path
+            return result(full_path, False)
             
     except Exception as e:
         route_logger.error(f"OSRM_FAIL | Route={route_id} | {str(e)}")
-        return full_path
+        return result(full_path, False)
 
 
 # =========================================================
@@ -403,31 +408,31 @@ def validate_route_quality(route_id, direction):
 # =========================================================
 # 3. THUẬT TOÁN TÌM ĐƯỜNG (REALISTIC SCORING)
 # =========================================================
-def find_smart_bus_route(start_coords, end_coords, skip_validation=False, **kwargs):
+# DANH SÁCH TUYẾN XƯƠNG SỐNG (Ưu tiên)
+BACKBONE_ROUTES = ['19', '53', '150', '8', '6', '56', '10', '30', '104', '33', '99', '152']
+
+
+def is_backbone(rid, route_no_cache=None):
+    if route_no_cache is None:
+        return get_route_no(rid) in BACKBONE_ROUTES
+    if rid not in route_no_cache:
+        route_no_cache[rid] = get_route_no(rid)
+    return route_no_cache[rid] in BACKBONE_ROUTES
+
+
+def get_nearby_routes(coords, radius_km, route_quality_cache=None):
     """
-    skip_validation=True: Bỏ qua validate, chỉ tìm bus có trạm gần, 
-                          dùng OSRM vẽ đường, giữ tên bus
+    Các tuyến (RouteId, Direction) có trạm trong bán kính radius_km quanh coords,
+    mỗi tuyến giữ trạm gần nhất.
+    route_quality_cache: dict dùng chung để không validate 1 tuyến nhiều lần
     """
-    print(f"\n🔍 [REALISTIC MODE] Tìm từ {start_coords} -> {end_coords}")
-
-    all_stops = bus_data.stations  # list of dict 
+    if route_quality_cache is None:
+        route_quality_cache = {}
 
     # 🔥 [THÊM MỚI] Lấy danh sách ID tuyến sạch về 1 lần duy nhất
     active_route_ids = bus_data.active_route_ids
-    print(f"ℹ️ Đã tải {len(active_route_ids)} tuyến đang hoạt động.")
-    print(f"ℹ️ Tổng {len(all_stops)} trạm được cache.")
-    
-    # DANH SÁCH TUYẾN XƯƠNG SỐNG (Ưu tiên)
-    BACKBONE_ROUTES = ['19', '53', '150', '8', '6', '56', '10', '30', '104', '33', '99', '152']
-    
-    route_no_cache = {}
-    def is_backbone(rid):
-        if rid not in route_no_cache:
-            route_no_cache[rid] = get_route_no(rid)
-        return route_no_cache[rid] in BACKBONE_ROUTES
 
      # ========== THÊM CACHE VALIDATION ==========
-    route_quality_cache = {}
     def is_valid_route(rid, direction):
         """Kiểm tra tuyến có đủ tiêu chuẩn không"""
         key = (rid, direction)
@@ -438,95 +443,66 @@ def find_smart_bus_route(start_coords, end_coords, skip_validation=False, **kwar
                 print(f"❌ {error}")
         return route_quality_cache[key]
     # ==========================================
+
+    nearby_stations = bus_data.find_nearby_stations(coords['lat'], coords['lon'], radius_km)
     
-    def get_nearby_routes(coords, radius_km):
-        nearby_stations = bus_data.find_nearby_stations(coords['lat'], coords['lon'], radius_km)
+    routes = {}
+    for stop in nearby_stations:
         
-        routes = {}
-        for stop in nearby_stations:
-            
-            # --- [FIX START] Ép kiểu RouteId về string để so sánh ---
-            raw_id = stop.get('RouteId')
-            if raw_id is None: continue # Bỏ qua nếu dữ liệu lỗi
-            r_id = str(raw_id) 
-            # --- [FIX END] ---
+        # --- [FIX START] Ép kiểu RouteId về string để so sánh ---
+        raw_id = stop.get('RouteId')
+        if raw_id is None: continue # Bỏ qua nếu dữ liệu lỗi
+        r_id = str(raw_id) 
+        # --- [FIX END] ---
 
-            direction = str(stop.get('StationDirection'))
+        direction = str(stop.get('StationDirection'))
+        
+        # Bây giờ so sánh String với Set of Strings mới đúng
+        if r_id not in active_route_ids:
+            # Debug log: in ra để biết tại sao bị loại (chỉ dùng khi test)
+            # print(f"DEBUG: Loại Route {r_id} vì không active") 
+            continue
+        
+        s_lat = stop.get('Lat')
+        s_lng = stop.get('Lng')
+        
+        # Bỏ qua nếu dữ liệu lỗi
+        if s_lat is None or s_lng is None: continue
             
-            # Bây giờ so sánh String với Set of Strings mới đúng
-            if r_id not in active_route_ids:
-                # Debug log: in ra để biết tại sao bị loại (chỉ dùng khi test)
-                # print(f"DEBUG: Loại Route {r_id} vì không active") 
-                continue
+        dist = haversine(coords['lat'], coords['lon'], s_lat, s_lng)
+       
+        if dist <= radius_km:
+            direction = stop.get('StationDirection')
+            key = (r_id, direction)
             
-            s_lat = stop.get('Lat')
-            s_lng = stop.get('Lng')
+            # ========== THÊM CHECK Ở ĐÂY ==========
+            if not is_valid_route(r_id, direction):
+                continue  # Bỏ qua tuyến không hợp lệ
+            # ==========================================
             
-            # Bỏ qua nếu dữ liệu lỗi
-            if s_lat is None or s_lng is None: continue
-                
-            dist = haversine(coords['lat'], coords['lon'], s_lat, s_lng)
-           
-            if dist <= radius_km:
-                direction = stop.get('StationDirection')
-                key = (r_id, direction)
-                
-                # ========== THÊM CHECK Ở ĐÂY ==========
-                if not is_valid_route(r_id, direction):
-                    continue  # Bỏ qua tuyến không hợp lệ
-                # ==========================================
-                
-                # Logic cũ giữ nguyên, chỉ đổi cách lấy dữ liệu
-                if key not in routes or dist < routes[key]['dist']:
-                    routes[key] = {
-                        'StationId': stop.get('StationId'), 
-                        'StationName': stop.get('StationName'), 
-                        'Lat': s_lat, 
-                        'Lng': s_lng,
-                        'RouteId': r_id, 
-                        'StationOrder': stop.get('StationOrder'), 
-                        'StationDirection': direction,
-                        'dist': dist
-                    }
-        return routes
-
-    # 1. Tìm trạm (Quét rộng để bắt tuyến xương sống)
-    s_close = get_nearby_routes(start_coords, 5.0)
-    e_close = get_nearby_routes(end_coords, 5.0)
+            # Logic cũ giữ nguyên, chỉ đổi cách lấy dữ liệu
+            if key not in routes or dist < routes[key]['dist']:
+                routes[key] = {
+                    'StationId': stop.get('StationId'), 
+                    'StationName': stop.get('StationName'), 
+                    'Lat': s_lat, 
+                    'Lng': s_lng,
+                    'RouteId': r_id, 
+                    'StationOrder': stop.get('StationOrder'), 
+                    'StationDirection': direction,
+                    'dist': dist
+                }
+    return routes
 
-    if not e_close: e_close = get_nearby_routes(end_coords, 6.0)
 
-    if not s_close or not e_close:
-        # Nếu skip_validation → return OSRM + bus name
-        if skip_validation:
-            # Tìm bus nào có trạm gần nhất
-            best_route = find_best_route_for_osrm(s_close, e_close)
-            
-            if best_route:
-                return {
-                    'success': True,
-                    'count': 1,
-                    'routes': [{
-                        'route_name': f"Xe {get_route_name(best_route)}",
-                        'description': f"Tuyến {get_route_name(best_route)} (vẽ OSRM)",
-                        'type': 'bus_osrm',
-                        'osrm_needed': True,  # Signal: cần gọi OSRM
-                        'route_id': best_route,
-                        'start_coords': start_coords,
-                        'end_coords': end_coords
-                    }]
-                }
-        return {
-            'success': False, 
-            'error': 'Không tìm thấy tuyến xe bus phù hợp (chỉ hiển thị tuyến thỏa yêu cầu). Vui lòng thử điểm khác hoặc mở rộng bán kính tìm kiếm.',
-            'fallback': 'osrm',  # ← Signal cho frontend
-            'start_coords': start_coords,
-            'end_coords': end_coords
-        }
-        # =================================
+def rank_bus_options(s_close, e_close, limit=3):
+    """
+    Chấm điểm & chọn tối đa `limit` phương án (direct / transfer) từ 2 tập tuyến gần.
+    Trả về list phương án đã lọc (rỗng nếu không có), phần tử đầu là tốt nhất.
+    Không vẽ đường -> đủ rẻ để dùng làm ma trận chi phí cho hành trình nhiều điểm.
+    """
+    route_no_cache = {}
 
-    potential_solutions = []
-    
     # --- CẤU HÌNH TRỌNG SỐ THỰC TẾ ---
     WEIGHT_WALK = 100.0     # Đi bộ 1km = 100 điểm phạt (Rất nặng)
     WEIGHT_STOP = 0.5       # 1 trạm = 0.5 điểm
@@ -536,8 +512,14 @@ def find_smart_bus_route(start_coords, end_coords, skip_validation=False, **kwar
     BASE_DIRECT_BONUS = -200.0
     BACKBONE_BONUS = -100.0
 
-    # A. DIRECT
+    # Ngưỡng của bộ lọc thông minh (dùng chung cho cắt tỉa bên dưới)
+    MAX_WALK_KM = 1.5       # Tổng đi bộ > 1.5km -> loại (trừ Top 1)
+    MAX_WALK_GAP_KM = 0.8   # Đi bộ nhiều hơn Top 1 quá 800m -> loại
+    MAX_SCORE_GAP = 200     # Điểm chênh Top 1 quá 200 -> loại
+
+    # A. DIRECT (chỉ tra dict -> tính điểm chính xác luôn)
     print("   🚀 Quét Direct...")
+    direct_solutions = []
     for key, s in s_close.items():
         if key in e_close:
             e = e_close[key]
@@ -551,119 +533,212 @@ def find_smart_bus_route(start_coords, end_coords, skip_validation=False, **kwar
                 if walk_total > 2.0: direct_bonus = 200 # Phạt ngược lại nếu đi bộ quá 2km
 
                 # Thưởng thêm cho tuyến xương sống
-                bb_bonus = BACKBONE_BONUS if is_backbone(key[0]) else 0
+                bb_bonus = BACKBONE_BONUS if is_backbone(key[0], route_no_cache) else 0
 
                 score = (walk_total * WEIGHT_WALK) + (stops * WEIGHT_STOP) + direct_bonus + bb_bonus
                 
-                potential_solutions.append({'type': 'direct', 'score': score, 'walk': walk_total, 'stops': stops, 'data': (s, e)})
+                direct_solutions.append({'type': 'direct', 'score': score, 'walk': walk_total, 'stops': stops, 'data': (s, e)})
+
+    def score_transfer(s, e):
+        """Tính điểm thật cho cặp (s, e) - phần tốn kém nhất (tìm trạm giao nhau)"""
+        trans_row = find_transfer_point(
+            s["RouteId"], 
+            s["StationDirection"], 
+            e["RouteId"], 
+            e["StationDirection"], 
+            s["StationOrder"], 
+            e["StationOrder"]
+        )
+        if not trans_row:
+            return None
+
+        trans = {
+            'StationName': trans_row["StationName"],
+            'Lat': trans_row["Lat"],
+            'Lng': trans_row["Lng"],
+            'Order1': trans_row["Order1"],
+            'Order2': trans_row["Order2"]
+        }
+        walk_total = s['dist'] + e['dist']
+
+        stops_total = (
+            (trans['Order1'] - s['StationOrder']) +
+            (e['StationOrder'] - trans['Order2'])
+        )
+        # Phạt nặng nếu tổng trạm > 70
+        penalty = 0
+        if stops_total > 70: penalty = 500
+
+        score = (
+            walk_total * WEIGHT_WALK +
+            stops_total * WEIGHT_STOP +
+            TRANSFER_PENALTY +
+            penalty
+        )
+
+        return {
+            'type': 'transfer',
+            'score': score,
+            'walk': walk_total,
+            'stops': stops_total,
+            'data': (s, e, trans)
+        }
+
+    # B. HÀNG ĐỢI ƯU TIÊN (BRANCH & BOUND)
+    # Mỗi phần tử: (cận dưới, thứ tự sinh, ứng viên)
+    #   - Direct: đã có điểm thật -> cận dưới = điểm
+    #   - Transfer: cận dưới = walk * WEIGHT_WALK + TRANSFER_PENALTY
+    #     (số trạm và phạt > 70 trạm luôn >= 0 nên cận dưới không bao giờ vượt điểm thật)
+    # Thứ tự sinh giữ đúng thứ tự sort ổn định cũ khi 2 phương án bằng điểm.
+    seq = itertools.count()
+    frontier = [(sol['score'], next(seq), sol) for sol in direct_solutions]
 
-    # B. TRANSFER
     check_transfer = True
-    if potential_solutions:
-        best_direct = min(potential_solutions, key=lambda x: x['score'])
+    if direct_solutions:
+        best_direct = min(direct_solutions, key=lambda x: x['score'])
         # Chỉ bỏ qua Transfer nếu có Direct CỰC NGON (đi bộ < 500m)
         if best_direct['walk'] < 0.5: check_transfer = False
 
     if check_transfer:
         print("   🔄 Quét Transfer...")
-        top_s = sorted(s_close.values(), key=lambda x: x['dist'])[:20]
-        top_e = sorted(e_close.values(), key=lambda x: x['dist'])[:20]
+        max_candidates = BUS_SEARCH_CONFIG["TRANSFER_CANDIDATES"]
+        top_s = sorted(s_close.values(), key=lambda x: x['dist'])[:max_candidates]
+        top_e = sorted(e_close.values(), key=lambda x: x['dist'])[:max_candidates]
 
         for s in top_s:
             for e in top_e:
                 if s['RouteId'] == e['RouteId']: continue
-                
-                trans_row = find_transfer_point(
-                    s["RouteId"], 
-                    s["StationDirection"], 
-                    e["RouteId"], 
-                    e["StationDirection"], 
-                    s["StationOrder"], 
-                    e["StationOrder"]
-                )
+                walk_total = s['dist'] + e['dist']
+                lower_bound = walk_total * WEIGHT_WALK + TRANSFER_PENALTY
+                frontier.append((lower_bound, next(seq), {'type': 'transfer_pending', 'data': (s, e)}))
 
-                if trans_row:
-                    trans = {
-                        'StationName': trans_row["StationName"],
-                        'Lat': trans_row["Lat"],
-                        'Lng': trans_row["Lng"],
-                        'Order1': trans_row["Order1"],
-                        'Order2': trans_row["Order2"]
-                    }
-                    walk_total = s['dist'] + e['dist']
-
-                    stops_total = (
-                        (trans['Order1'] - s['StationOrder']) +
-                        (e['StationOrder'] - trans['Order2'])
-                    )
-                    # Phạt nặng nếu tổng trạm > 70
-                    penalty = 0
-                    if stops_total > 70: penalty = 500
-
-                    score = (
-                        walk_total * WEIGHT_WALK +
-                        stops_total * WEIGHT_STOP +
-                        TRANSFER_PENALTY +
-                        penalty
-                    )
+    heapq.heapify(frontier)
+    total_candidates = len(frontier)
 
-                    potential_solutions.append({
-                        'type': 'transfer',
-                        'score': score,
-                        'walk': walk_total,
-                        'stops': stops_total,
-                        'data': (s, e, trans)
-                    })
-    # --- KẾT QUẢ ---
-    if not potential_solutions:
-        return {'success': False, 'error': 'Không tìm thấy.'}
-
-    # Sắp xếp theo điểm
-    potential_solutions.sort(key=lambda x: x['score'])
-    
-    # [NEW] LOGIC LỌC THÔNG MINH (SMART FILTERING)
-    # Thay vì lấy ngu ngơ top 3, ta sẽ chọn lọc kỹ càng
-    
+    # --- DUYỆT BEST-FIRST + LỌC THÔNG MINH (SMART FILTERING) ---
+    # Chỉ "chốt" 1 phương án khi điểm thật của nó <= cận dưới nhỏ nhất còn lại,
+    # nên thứ tự chốt đúng bằng thứ tự sort toàn bộ danh sách như trước.
+    evaluated = []      # heap (điểm thật, thứ tự sinh, phương án)
     final_picks = []
- 
-    # AN TOÀN: Kiểm tra rỗng trước khi truy cập phần tử [0]
-    if potential_solutions:
-        # Luôn chọn phương án tốt nhất (Top 1)
-        best_option = potential_solutions[0]
-        final_picks.append(best_option)
-        
-        limit = kwargs.get('limit', 3)
-        # Duyệt qua các phương án còn lại để xem có nên lấy không
-        for sol in potential_solutions[1:]:
-            # Đã đủ số lượng cần tìm thì dừng
-            if len(final_picks) >= limit: 
-                break
-                
+    best_option = None
+    evaluated_count = 0
+    pruned_count = 0
+
+    while len(final_picks) < limit:
+        # CẮT TỈA: điểm Top 1 chỉ có thể giảm -> ứng viên có cận dưới > Top 1 + 200
+        # không bao giờ qua được bộ lọc điểm số, bỏ luôn phần còn lại của hàng đợi
+        if best_option and frontier and frontier[0][0] > best_option['score'] + MAX_SCORE_GAP:
+            pruned_count += len(frontier)
+            frontier = []
+
+        if evaluated and (not frontier or evaluated[0][:2] < frontier[0][:2]):
+            _, _, sol = heapq.heappop(evaluated)
+
+            # Luôn chọn phương án tốt nhất (Top 1)
+            if best_option is None:
+                best_option = sol
+                final_picks.append(sol)
+                continue
+
             # 1. BỘ LỌC ĐI BỘ QUÁ XA (HARD LIMIT)
             # Nếu tổng đi bộ > 1.5km -> Loại ngay lập tức (Tuyến 27 đi bộ 1.7km sẽ chết ở đây)
-            if sol['walk'] > 1.5:
+            if sol['walk'] > MAX_WALK_KM:
                 continue
 
             # 2. BỘ LỌC SO SÁNH (RELATIVE CHECK)
             # Nếu phương án này phải đi bộ nhiều hơn phương án nhất quá 800m -> Loại
             # Ví dụ: Tuyến 69 đi bộ 200m. Tuyến 27 đi bộ 1.1km (chênh 900m) -> Loại
-            if sol['walk'] > (best_option['walk'] + 0.8):
+            if sol['walk'] > (best_option['walk'] + MAX_WALK_GAP_KM):
                 continue
                 
             # 3. BỘ LỌC ĐIỂM SỐ (SCORE GAP)
             # Nếu điểm số chênh lệch quá lớn so với top 1 (quá 200 điểm) -> Loại
-            if sol['score'] > (best_option['score'] + 200):
+            if sol['score'] > (best_option['score'] + MAX_SCORE_GAP):
                 continue
                 
             # Nếu vượt qua mọi bài test thì mới nhận
             final_picks.append(sol)
-        # Gán lại vào top_solutions để code phía dưới xử lý tiếp
-        top_solutions = final_picks
-    else:
-        # Trường hợp không tìm thấy gì
-        top_solutions = []
+
+        elif frontier:
+            _, order, cand = heapq.heappop(frontier)
+            if cand['type'] == 'transfer_pending':
+                evaluated_count += 1
+                cand = score_transfer(*cand['data'])
+                if cand is None:
+                    continue
+            heapq.heappush(evaluated, (cand['score'], order, cand))
+
+        else:
+            break
+
+    route_logger.info(
+        f"SEARCH_STATS | Candidates={total_candidates} | TransferEvaluated={evaluated_count} | "
+        f"Pruned={pruned_count} | Picks={len(final_picks)}"
+    )
+
+    return final_picks
+
+
+def find_smart_bus_route(start_coords, end_coords, skip_validation=False, **kwargs):
+    """
+    skip_validation=True: Bỏ qua validate, chỉ tìm bus có trạm gần, 
+                          dùng OSRM vẽ đường, giữ tên bus
+    start_routes / end_routes (kwargs): tập tuyến gần đã tính sẵn (get_nearby_routes),
+                          dùng cho hành trình nhiều điểm để không quét lại trạm
+    """
+    print(f"\n🔍 [REALISTIC MODE] Tìm từ {start_coords} -> {end_coords}")
+
+    all_stops = bus_data.stations  # list of dict 
+
+    active_route_ids = bus_data.active_route_ids
+    print(f"ℹ️ Đã tải {len(active_route_ids)} tuyến đang hoạt động.")
+    print(f"ℹ️ Tổng {len(all_stops)} trạm được cache.")
     
-    # --- KẾT THÚC ĐOẠN LỌC ---
+    # 1. Tìm trạm (Quét rộng để bắt tuyến xương sống)
+    route_quality_cache = {}
+    s_close = kwargs.get('start_routes')
+    if s_close is None:
+        s_close = get_nearby_routes(start_coords, BUS_SEARCH_CONFIG["SEARCH_RADIUS_KM"], route_quality_cache)
+
+    e_close = kwargs.get('end_routes')
+    if e_close is None:
+        e_close = get_nearby_routes(end_coords, BUS_SEARCH_CONFIG["SEARCH_RADIUS_KM"], route_quality_cache)
+        if not e_close: e_close = get_nearby_routes(end_coords, BUS_SEARCH_CONFIG["FALLBACK_RADIUS_KM"], route_quality_cache)
+
+    if not s_close or not e_close:
+        # Nếu skip_validation → return OSRM + bus name
+        if skip_validation:
+            # Tìm bus nào có trạm gần nhất
+            best_route = find_best_route_for_osrm(s_close, e_close)
+            
+            if best_route:
+                return {
+                    'success': True,
+                    'count': 1,
+                    'routes': [{
+                        'route_name': f"Xe {get_route_name(best_route)}",
+                        'description': f"Tuyến {get_route_name(best_route)} (vẽ OSRM)",
+                        'type': 'bus_osrm',
+                        'osrm_needed': True,  # Signal: cần gọi OSRM
+                        'route_id': best_route,
+                        'start_coords': start_coords,
+                        'end_coords': end_coords
+                    }]
+                }
+        return {
+            'success': False, 
+            'error': 'Không tìm thấy tuyến xe bus phù hợp (chỉ hiển thị tuyến thỏa yêu cầu). Vui lòng thử điểm khác hoặc mở rộng bán kính tìm kiếm.',
+            'fallback': 'osrm',  # ← Signal cho frontend
+            'start_coords': start_coords,
+            'end_coords': end_coords
+        }
+        # =================================
+
+    top_solutions = rank_bus_options(s_close, e_close, limit=kwargs.get('limit', 3))
+
+    # --- KẾT QUẢ ---
+    if not top_solutions:
+        return {'success': False, 'error': 'Không tìm thấy.'}
     
     # Log lựa chọn tốt nhất
     best = top_solutions[0]
@@ -676,12 +751,20 @@ def find_smart_bus_route(start_coords, end_coords, skip_validation=False, **kwar
     )
     
     # Build response cho từng option
+    # lazy_geometry=True: chỉ trả tóm tắt + geometry handle, FE gọi /api/bus/geometry khi user chọn
+    lazy_geometry = kwargs.get('lazy_geometry', False)
+    tolerance_m = kwargs.get('tolerance_m')
     final_results = []
     for sol in top_solutions:
-        if sol['type'] == 'direct':
-            res = build_response( sol['data'][0], sol['data'][1], 'direct')
-        else:
-            res = build_response( sol['data'][0], sol['data'][1], 'transfer', sol['data'][2])
+        try:
+            if sol['type'] == 'direct':
+                res = build_response( sol['data'][0], sol['data'][1], 'direct', lazy_geometry=lazy_geometry, tolerance_m=tolerance_m)
+            else:
+                res = build_response( sol['data'][0], sol['data'][1], 'transfer', sol['data'][2], lazy_geometry=lazy_geometry, tolerance_m=tolerance_m)
+        except ValueError as err:
+            # Thứ tự trạm sai (handle không vẽ được) -> bỏ phương án, không trả cho FE
+            route_logger.warning(f"BAD_OPTION | {err}")
+            continue
         
         if res['success']:
             final_results.append(res['data'])
@@ -742,8 +825,10 @@ def find_transfer_point(routeA, dirA, routeB, dirB, start_order, end_order):
         # Lấy transfer point đầu tiên (đã match điều kiện)
         transfer = transfers[0]
         
-        # Filter theo order nếu cần
-        if start_order <= transfer.get('Order1', 0) <= end_order:
+        # Filter theo order nếu cần; Order2 > trạm xuống thì chặng 2 đi ngược chiều tuyến
+        # (số trạm âm -> điểm sai, geometry handle không hợp lệ) -> không nhận
+        order2 = transfer.get('Order2')
+        if start_order <= transfer.get('Order1', 0) <= end_order and order2 is not None and order2 <= end_order:
             return {
                 "StationName": transfer["StationName"],
                 "Lat": transfer["Lat"],
@@ -758,41 +843,144 @@ def find_transfer_point(routeA, dirA, routeB, dirB, start_order, end_order):
         route_logger.error(f"TRANSFER_ERROR | {str(e)}")
         return None
 
-def build_response( s, e, type, trans=None):
+# =========================================================
+# GEOMETRY HANDLE (LAZY GEOMETRY)
+# =========================================================
+# Handle trùng format với cache key của get_official_path_from_db
+# -> "path:<RouteId>:<Direction>:<StartOrder>:<EndOrder>"
+# Không phát handle mà parse_geometry_handle sẽ từ chối (start > end, order không phải số)
+def make_geometry_handle(route_id, direction, start_order, end_order):
+    if int(start_order) > int(end_order):
+        raise ValueError(f"Invalid geometry handle order: {start_order} > {end_order} (route {route_id})")
+    return cache_key("path", route_id, direction, int(start_order), int(end_order))
+
+
+def parse_geometry_handle(handle):
+    """
+    Tách handle thành (route_id, direction, start_order, end_order).
+    Trả về None nếu handle sai format.
+    """
+    parts = str(handle or '').split(':')
+    if len(parts) != 5 or parts[0] != 'path':
+        return None
+
+    _, route_id, direction, start_order, end_order = parts
+    try:
+        start_order = int(start_order)
+        end_order = int(end_order)
+    except ValueError:
+        return None
+
+    if not route_id or not direction or start_order > end_order:
+        return None
+    return route_id, direction, start_order, end_order
+
+
+def simplify_path_cached(handle, path, tolerance_m=None, cacheable=True):
+    """
+    Đơn giản hóa path (Douglas-Peucker) theo tolerance, cache theo bucket
+    -> mỗi (path, bucket) chỉ tính 1 lần
+    cacheable=False (path dựng tạm khi OSRM lỗi): chỉ tính, không cache
+    """
+    bucket = tolerance_bucket(tolerance_m)
+    if not bucket or not path:
+        return path
+    if not cacheable:
+        return simplify_path(path, bucket)
+
+    key = cache_key("path_simplified", handle, bucket)
+    cached = cache_get(key)
+    if cached:
+        return cached
+
+    simplified = simplify_path(path, bucket)
+    cache_set(key, simplified, ttl=CACHE_CONFIG["TTL"]["route_geometry"])
+    route_logger.info(f"PATH_SIMPLIFIED | {handle} | Tol={bucket}m | Points={len(path)}->{len(simplified)}")
+    return simplified
+
+
+def get_path_by_handle(handle, tolerance_m=None):
+    """Vẽ đường cho 1 handle (chỉ gọi khi user thực sự chọn phương án)"""
+    parsed = parse_geometry_handle(handle)
+    if not parsed:
+        return None
+    path, cacheable = get_official_path_from_db(*parsed, with_status=True)
+    return simplify_path_cached(handle, path, tolerance_m, cacheable)
+
+
+def estimate_bus_minutes(route_id, direction, start_order, end_order):
+    """
+    Ước lượng thời gian đi bus (phút) khi CHƯA có path:
+    cộng dồn khoảng cách chim bay giữa các trạm liên tiếp, tốc độ bus ~20km/h
+    """
+    stations = [
+        s for s in get_stations_by_route(route_id, direction)
+        if start_order <= s.get('StationOrder', 0) <= end_order
+    ]
+    dist_km = 0.0
+    for a, b in zip(stations, stations[1:]):
+        try:
+            dist_km += haversine(float(a['Lat']), float(a['Lng']), float(b['Lat']), float(b['Lng']))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return dist_km / 20.0 * 60
+
+
+def build_response( s, e, type, trans=None, lazy_geometry=False, tolerance_m=None):
     """
     Xây dựng object JSON trả về cho Frontend.
     [CHANGE]: Không đóng connection ở đây để dùng cho vòng lặp.
+    lazy_geometry=True: không vẽ đường (không đụng DB path / OSRM), thay 'route_coordinates'
+                        và 'segments[].path' bằng 'geometry_handle' để FE lấy sau.
+    tolerance_m: đơn giản hóa path trả về
+    duration luôn ước lượng theo khoảng cách giữa các trạm (estimate_bus_minutes), lazy hay không
+    đều ra cùng một con số
     """
     if type == 'direct':
         name = get_route_name( s['RouteId'])
-        path = get_official_path_from_db( s['RouteId'], s['StationDirection'], s['StationOrder'], e['StationOrder'])
+        handle = make_geometry_handle(s['RouteId'], s['StationDirection'], s['StationOrder'], e['StationOrder'])
+
+        duration = round(estimate_bus_minutes(s['RouteId'], s['StationDirection'], s['StationOrder'], e['StationOrder']) + 10)
+        if lazy_geometry:
+            path = None
+        else:
+            path, cacheable = get_official_path_from_db( s['RouteId'], s['StationDirection'], s['StationOrder'], e['StationOrder'], with_status=True)
+            path = simplify_path_cached(handle, path, tolerance_m, cacheable)
+
+        data = {
+            'route_name': f"Xe {name}",
+            'description': f"Đi thẳng tuyến {name}",
+            # [NEW] Thêm ID để frontend phân biệt các option
+            'option_id': f"direct_{s['RouteId']}_{s['StationId']}",
+            
+            'walk_to_start': [s['Lat'], s['Lng']], 
+            'walk_from_end': [e['Lat'], e['Lng']], 
+            
+            'start_stop': s['StationName'], 
+            'end_stop': e['StationName'], 
+            
+            'station_start_coords': {'lat': s['Lat'], 'lng': s['Lng']},
+            'station_end_coords': {'lat': e['Lat'], 'lng': e['Lng']},
+           
+            'walk_distance': round((s.get('dist', 0) + e.get('dist', 0)) * 1000), 
+            'duration': duration,
+            
+            'score': 8.5,
+            'labels': ["Tiết kiệm", "Đi thẳng"],
+        }
+
+        if lazy_geometry:
+            data['geometry'] = 'lazy'
+            data['geometry_handles'] = [handle]
+            data['segments'] = [{'type': 'bus', 'geometry_handle': handle, 'name': name, 'color': '#FF9800'}]
+        else:
+            data['route_coordinates'] = path
+            data['segments'] = [{'type': 'bus', 'path': path, 'name': name, 'color': '#FF9800'}]
 
         return {
             'success': True, 
             'type': 'direct', 
-            'data': {
-                'route_name': f"Xe {name}",
-                'description': f"Đi thẳng tuyến {name}",
-                # [NEW] Thêm ID để frontend phân biệt các option
-                'option_id': f"direct_{s['RouteId']}_{s['StationId']}",
-                
-                'walk_to_start': [s['Lat'], s['Lng']], 
-                'walk_from_end': [e['Lat'], e['Lng']], 
-                
-                'start_stop': s['StationName'], 
-                'end_stop': e['StationName'], 
-                
-                'station_start_coords': {'lat': s['Lat'], 'lng': s['Lng']},
-                'station_end_coords': {'lat': e['Lat'], 'lng': e['Lng']},
-               
-                'walk_distance': round((s.get('dist', 0) + e.get('dist', 0)) * 1000), 
-                'duration': round((len(path) * 0.1) + 10), # Ước lượng
-                
-                'score': 8.5,
-                'labels': ["Tiết kiệm", "Đi thẳng"],
-                'route_coordinates': path,
-                'segments': [{'type': 'bus', 'path': path, 'name': name, 'color': '#FF9800'}]
-            }
+            'data': data
         }
     else:
         no1 = get_route_no(s['RouteId'])
@@ -802,57 +990,162 @@ def build_response( s, e, type, trans=None):
         name1 = get_route_name(s['RouteId'])
         name2 = get_route_name(e['RouteId'])
         
-        path1 = get_official_path_from_db(s['RouteId'], s['StationDirection'], s['StationOrder'], trans['Order1'])
-        path2 = get_official_path_from_db(e['RouteId'], e['StationDirection'], trans['Order2'], e['StationOrder'])
+        handle1 = make_geometry_handle(s['RouteId'], s['StationDirection'], s['StationOrder'], trans['Order1'])
+        handle2 = make_geometry_handle(e['RouteId'], e['StationDirection'], trans['Order2'], e['StationOrder'])
+
+        duration = round(
+            estimate_bus_minutes(s['RouteId'], s['StationDirection'], s['StationOrder'], trans['Order1']) +
+            estimate_bus_minutes(e['RouteId'], e['StationDirection'], trans['Order2'], e['StationOrder']) + 20
+        )
+        if lazy_geometry:
+            path1 = path2 = None
+        else:
+            path1, cacheable1 = get_official_path_from_db(s['RouteId'], s['StationDirection'], s['StationOrder'], trans['Order1'], with_status=True)
+            path2, cacheable2 = get_official_path_from_db(e['RouteId'], e['StationDirection'], trans['Order2'], e['StationOrder'], with_status=True)
+            path1 = simplify_path_cached(handle1, path1, tolerance_m, cacheable1)
+            path2 = simplify_path_cached(handle2, path2, tolerance_m, cacheable2)
         
+        data = {
+            # [QUAN TRỌNG] Sửa route_name để hiển thị trên Header của Card
+            'route_name': f"Xe {no1} ➝ Xe {no2}", 
+            
+            # [QUAN TRỌNG] Sửa description để hiển thị dòng chữ nhỏ bên dưới
+            'description': f"Tuyến {no1} & {no2} - Đổi xe tại {trans['StationName']}", 
+            
+            'option_id': f"trans_{s['RouteId']}_{e['RouteId']}",
+            'walk_to_start': [s['Lat'], s['Lng']],
+            'walk_from_end': [e['Lat'], e['Lng']], 
+            'start_stop': s['StationName'], 
+            'end_stop': e['StationName'], 
+            
+            'transfer_stop': trans['StationName'],
+            'station_start_coords': {'lat': s['Lat'], 'lng': s['Lng']},
+            'station_end_coords': {'lat': e['Lat'], 'lng': e['Lng']},
+            
+            'walk_distance': round((s.get('dist', 0) + e.get('dist', 0)) * 1000), 
+            'duration': duration,
+            'display_price': "14,000đ",
+            'score': 6.5,
+            'labels': ["Phổ biến", "2 chuyến"],
+        }
+
+        transfer_segment = {'type': 'transfer', 'lat': trans['Lat'], 'lng': trans['Lng'], 'name': trans['StationName']}
+        if lazy_geometry:
+            data['geometry'] = 'lazy'
+            data['geometry_handles'] = [handle1, handle2]
+            data['segments'] = [
+                {'type': 'bus', 'geometry_handle': handle1, 'name': name1, 'color': '#4285F4'}, 
+                transfer_segment,
+                {'type': 'bus', 'geometry_handle': handle2, 'name': name2, 'color': '#EA4335'}
+            ]
+        else:
+            data['route_coordinates'] = path1 + path2
+            data['segments'] = [
+                {'type': 'bus', 'path': path1, 'name': name1, 'color': '#4285F4'}, 
+                transfer_segment,
+                {'type': 'bus', 'path': path2, 'name': name2, 'color': '#EA4335'}
+            ]
+
         return {
             'success': True,
             'type': 'transfer', 
-            'data': {
-                # [QUAN TRỌNG] Sửa route_name để hiển thị trên Header của Card
-                'route_name': f"Xe {no1} ➝ Xe {no2}", 
-                
-                # [QUAN TRỌNG] Sửa description để hiển thị dòng chữ nhỏ bên dưới
-                'description': f"Tuyến {no1} & {no2} - Đổi xe tại {trans['StationName']}", 
-                
-                'option_id': f"trans_{s['RouteId']}_{e['RouteId']}",
-                'walk_to_start': [s['Lat'], s['Lng']],
-                'walk_from_end': [e['Lat'], e['Lng']], 
-                'start_stop': s['StationName'], 
-                'end_stop': e['StationName'], 
-                
-                'transfer_stop': trans['StationName'],
-                'station_start_coords': {'lat': s['Lat'], 'lng': s['Lng']},
-                'station_end_coords': {'lat': e['Lat'], 'lng': e['Lng']},
-                
-                'walk_distance': round((s.get('dist', 0) + e.get('dist', 0)) * 1000), 
-                'duration': round((len(path1) + len(path2)) * 0.1 + 20),
-                'display_price': "14,000đ",
-                'score': 6.5,
-                'labels': ["Phổ biến", "2 chuyến"],
-                'route_coordinates': path1 + path2,
-                
-                'segments': [
-                    {'type': 'bus', 'path': path1, 'name': name1, 'color': '#4285F4'}, 
-                    {'type': 'transfer', 'lat': trans['Lat'], 'lng': trans['Lng'], 'name': trans['StationName']},
-                    {'type': 'bus', 'path': path2, 'name': name2, 'color': '#EA4335'}
-                ]
-            }
+            'data': data
         }
 
-def plan_multi_stop_bus_trip(waypoints):
+# =========================================================
+# 4. HÀNH TRÌNH NHIỀU ĐIỂM
+# =========================================================
+def _to_bus_coords(point):
+    return {'lat': float(point['lat']), 'lon': float(point.get('lon', point.get('lng')))}
+
+
+def resolve_waypoint_routes(coords_list, route_quality_cache=None, max_workers=None):
+    """
+    Quét tuyến gần cho MỖI waypoint đúng 1 lần (song song).
+    Trả về list {'start': tuyến khi làm điểm đi, 'end': tuyến khi làm điểm đến}
+    (điểm đến được nới bán kính fallback giống find_smart_bus_route).
+    """
+    if route_quality_cache is None:
+        route_quality_cache = {}
+
+    def resolve(coords):
+        start_routes = get_nearby_routes(coords, BUS_SEARCH_CONFIG["SEARCH_RADIUS_KM"], route_quality_cache)
+        end_routes = start_routes or get_nearby_routes(coords, BUS_SEARCH_CONFIG["FALLBACK_RADIUS_KM"], route_quality_cache)
+        return {'start': start_routes, 'end': end_routes}
+
+    workers = max_workers or BUS_SEARCH_CONFIG["MAX_PARALLEL_LEGS"]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(coords_list)))) as pool:
+        return list(pool.map(resolve, coords_list))
+
+
+def build_bus_cost_matrix(waypoint_routes, max_workers=None):
+    """
+    Ma trận chi phí bus giữa các waypoint = điểm của phương án tốt nhất (rank_bus_options).
+    Cặp không có xe bus -> inf.
+    """
+    n = len(waypoint_routes)
+    matrix = [[0.0] * n for _ in range(n)]
+    pairs = [(i, j) for i in range(n) for j in range(n) if i != j]
+
+    def cost(pair):
+        i, j = pair
+        s_close = waypoint_routes[i]['start']
+        e_close = waypoint_routes[j]['end']
+        if not s_close or not e_close:
+            return math.inf
+        picks = rank_bus_options(s_close, e_close, limit=1)
+        return picks[0]['score'] if picks else math.inf
+
+    workers = max_workers or BUS_SEARCH_CONFIG["MAX_PARALLEL_LEGS"]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pairs) or 1))) as pool:
+        for (i, j), value in zip(pairs, pool.map(cost, pairs)):
+            matrix[i][j] = value
+    return matrix
+
+
+def plan_multi_stop_bus_trip(waypoints, optimize_order=False, max_workers=None, **kwargs):
+    """
+    Tìm bus cho hành trình nhiều điểm.
+    - Quét tuyến gần của mỗi waypoint 1 lần, dùng chung cho 2 chặng kề nhau
+    - Các chặng độc lập -> chạy song song (ThreadPool)
+    - optimize_order=True: sắp lại các điểm giữa theo ma trận chi phí bus
+    kwargs còn lại được chuyển thẳng cho find_smart_bus_route
+    """
     if len(waypoints) < 2: return {'success': False, 'error': 'Cần >2 điểm'}
+
+    coords_list = [_to_bus_coords(wp) for wp in waypoints]
+    route_quality_cache = {}
+    waypoint_routes = resolve_waypoint_routes(coords_list, route_quality_cache, max_workers)
+
+    order = list(range(len(waypoints)))
+    if optimize_order and len(waypoints) > 3:
+        # Giữ cố định điểm đầu / cuối, sắp lại các điểm giữa (Held-Karp / heuristic)
+        matrix = build_bus_cost_matrix(waypoint_routes, max_workers)
+        order, _ = solve_route_order(matrix, start=0, end=len(waypoints) - 1)
+        print(f"🔀 Thứ tự bus tối ưu: {order}")
+
+    kwargs.setdefault('limit', 1)
+
+    def solve_leg(step):
+        a, b = order[step], order[step + 1]
+        return find_smart_bus_route(
+            coords_list[a],
+            coords_list[b],
+            start_routes=waypoint_routes[a]['start'],
+            end_routes=waypoint_routes[b]['end'],
+            **kwargs
+        )
+
+    steps = list(range(len(order) - 1))
+    workers = max_workers or BUS_SEARCH_CONFIG["MAX_PARALLEL_LEGS"]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(steps)))) as pool:
+        results = list(pool.map(solve_leg, steps))
+
     legs = []
     total_price = 0
     full_route_coords = []
     
-    for i in range(len(waypoints)-1):
-        res = find_smart_bus_route(
-            {'lat': float(waypoints[i]['lat']), 'lon': float(waypoints[i].get('lon', waypoints[i].get('lng')))}, 
-            {'lat': float(waypoints[i+1]['lat']), 'lon': float(waypoints[i+1].get('lon', waypoints[i+1].get('lng')))},
-            limit=1
-        )
-        
+    for i, res in enumerate(results):
         if res['success'] and len(res['routes']) > 0: 
             # Lấy option đầu tiên (tốt nhất)
             best_leg = res['routes'][0]
@@ -860,7 +1153,7 @@ def plan_multi_stop_bus_trip(waypoints):
             legs.append(best_leg)
             
             # Cộng dồn
-            full_route_coords.extend(best_leg['route_coordinates'])
+            full_route_coords.extend(best_leg.get('route_coordinates') or [])
             try: total_price += int(str(best_leg['display_price']).replace('đ','').replace(',',''))
             except: pass
             
@@ -874,7 +1167,7 @@ def plan_multi_stop_bus_trip(waypoints):
             'route_coordinates': full_route_coords,
             'display_price': f"{total_price:,}đ",
             'duration': sum(l['duration'] for l in legs),
-            'segments': legs[0]['segments'] # Fallback
+            'segments': legs[0]['segments'], # Fallback
+            'waypoint_order': order
         }
     }
-    
\ No newline at end of file
@@ -14,6 +14,7 @@ import logging
 from typing import Any, Dict, List, Optional
 from datetime import datetime, timedelta
 import threading
+from collections import OrderedDict
 
 try:
     import redis
@@ -51,16 +52,30 @@ class CacheMetadata:
 
 
 class MemoryCache:
-    """In-memory cache (fallback hoặc primary nếu không dùng Redis)"""
-    def __init__(self):
-        self.storage = {}
+    """
+    In-memory cache (fallback hoặc primary nếu không dùng Redis)
+    LRU: vượt MAX_MEMORY_ENTRIES key hoặc MAX_MEMORY_USAGE_MB -> xóa key ít dùng nhất
+    (kích thước ước lượng một lần lúc set, không quét lại toàn bộ)
+    """
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.storage = OrderedDict()
         self.ttl = {}
+        self.sizes = {}
+        self.total_bytes = 0
+        self.evictions = 0
+        self.max_entries = max_entries or CACHE_CONFIG["MAX_MEMORY_ENTRIES"]
+        self.max_bytes = max_bytes or CACHE_CONFIG["MAX_MEMORY_USAGE_MB"] * 1024 * 1024
         self.lock = threading.RLock()
     
     def set(self, key: str, value: Any, ttl: int = 3600):
+        size = len(str(value).encode())
         with self.lock:
+            self._remove(key)
             self.storage[key] = value
             self.ttl[key] = time.time() + ttl
+            self.sizes[key] = size
+            self.total_bytes += size
+            self._evict()
     
     def get(self, key: str) -> Optional[Any]:
         with self.lock:
@@ -69,17 +84,15 @@ class MemoryCache:
             
             # Check TTL
             if time.time() > self.ttl.get(key, 0):
-                del self.storage[key]
-                if key in self.ttl:
-                    del self.ttl[key]
+                self._remove(key)
                 return None
             
+            self.storage.move_to_end(key)
             return self.storage[key]
     
     def delete(self, key: str):
         with self.lock:
-            self.storage.pop(key, None)
-            self.ttl.pop(key, None)
+            self._remove(key)
     
     def exists(self, key: str) -> bool:
         return self.get(key) is not None
@@ -88,9 +101,22 @@ class MemoryCache:
         with self.lock:
             self.storage.clear()
             self.ttl.clear()
+            self.sizes.clear()
+            self.total_bytes = 0
     
     def size_mb(self) -> float:
-        return sum(len(str(v).encode()) for v in self.storage.values()) / 1024 / 1024
+        return self.total_bytes / 1024 / 1024
+
+    def _remove(self, key: str):
+        self.storage.pop(key, None)
+        self.ttl.pop(key, None)
+        self.total_bytes -= self.sizes.pop(key, 0)
+
+    def _evict(self):
+        """Vượt giới hạn -> xóa theo LRU (key hết hạn mà không ai đọc cũng trôi về đầu), giữ key vừa set"""
+        while len(self.storage) > 1 and (len(self.storage) > self.max_entries or self.total_bytes > self.max_bytes):
+            self._remove(next(iter(self.storage)))
+            self.evictions += 1
 
 
 class CacheLayer:
@@ -221,6 +247,8 @@ class CacheLayer:
         return {
             "redis_connected": self.redis_client is not None,
             "memory_usage_mb": self.memory_cache.size_mb(),
+            "memory_entries": len(self.memory_cache.storage),
+            "memory_evictions": self.memory_cache.evictions,
             "metadata": self.metadata.get_stats()
         }
     
@@ -306,6 +334,40 @@ def cache_get_stats() -> Dict:
     return cache.get_stats()
 
 
+# ==================== SINGLE-FLIGHT ====================
+_inflight_locks: Dict[str, threading.Lock] = {}
+_inflight_guard = threading.Lock()
+
+
+def cache_single_flight(key: str, fetch_func, ttl=None) -> Any:
+    """
+    Như get_or_set nhưng cùng 1 key chỉ có 1 thread gọi fetch_func,
+    các thread khác chờ rồi đọc lại cache (tránh dồn request khi cache miss).
+    ttl: số giây hoặc hàm ttl(value) -> số giây (VD: kết quả lỗi cache ngắn hơn)
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    with _inflight_guard:
+        lock = _inflight_locks.setdefault(key, threading.Lock())
+
+    with lock:
+        try:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+            data = fetch_func()
+            if data is not None:
+                cache.set(key, data, ttl(data) if callable(ttl) else ttl)
+            return data
+        finally:
+            with _inflight_guard:
+                if _inflight_locks.get(key) is lock:
+                    del _inflight_locks[key]
+
+
 if __name__ == "__main__":
     # Test cache layer
     logging.basicConfig(level=logging.INFO)
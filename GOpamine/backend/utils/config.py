@@ -23,6 +23,15 @@ CACHE_CONFIG = {
         "transfer_points": 12 * 3600,    # 12 giờ
         "route_geometry": 12 * 3600,     # 12 giờ
         "nearby_stations": 1 * 3600,     # 1 giờ
+        "osrm_table": 24 * 3600,         # 24 giờ (ma trận khoảng cách OSRM)
+        "geocode": 30 * 24 * 3600,       # 30 ngày (tên địa điểm -> tọa độ)
+        "osrm_route": 24 * 3600,         # 24 giờ (kết quả OSRM /route)
+        "osrm_negative": 60,             # 1 phút (OSRM lỗi / không có đường)
+        "realtime_weather": 15 * 60,     # 15 phút (thời tiết theo thành phố)
+        "realtime_traffic": 5 * 60,      # 5 phút (giao thông theo ô khu vực)
+        "realtime_error": 60,            # 1 phút (API thời tiết/giao thông lỗi)
+        "trip_plan": 30 * 60,            # 30 phút (context lộ trình + giá theo form chat)
+        "user_profile": 60,              # 1 phút (dòng bảng users cho Flask-Login load_user)
     },
     
     # 📦 BATCH SIZE - Kích thước tối đa của batch khi load từ DB
@@ -35,7 +44,8 @@ CACHE_CONFIG = {
     
     # 📊 MEMORY LIMITS
     "MAX_MEMORY_USAGE_MB": 500,      # Tối đa 500MB RAM cho cache
-    "EVICTION_POLICY": "lru",        # Xóa LRU khi vượt quá RAM
+    "MAX_MEMORY_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", 20000)),  # Tối đa số key trong memory cache
+    "EVICTION_POLICY": "lru",        # Xóa LRU khi vượt quá RAM / số key
 }
 
 # ==================== DATABASE CONFIG ====================
@@ -67,11 +77,146 @@ DATA_CONFIG = {
     "MAX_SEARCH_RADIUS": 5.0,
 }
 
+# ==================== BUS SEARCH CONFIG ====================
+BUS_SEARCH_CONFIG = {
+    # Bán kính quét trạm quanh điểm đi/đến (km)
+    "SEARCH_RADIUS_KM": float(os.getenv("BUS_SEARCH_RADIUS_KM", 5.0)),
+    "FALLBACK_RADIUS_KM": float(os.getenv("BUS_FALLBACK_RADIUS_KM", 6.0)),
+
+    # Số trạm gần nhất mỗi đầu đưa vào ghép Transfer
+    # (nhờ cắt tỉa branch & bound, chỉ cặp nào có thể lọt top mới bị tính thật)
+    "TRANSFER_CANDIDATES": int(os.getenv("BUS_TRANSFER_CANDIDATES", 20)),
+
+    # Số chặng / waypoint xử lý song song trong hành trình nhiều điểm
+    "MAX_PARALLEL_LEGS": int(os.getenv("BUS_MAX_PARALLEL_LEGS", 4)),
+}
+
+# ==================== TSP CONFIG ====================
+TSP_CONFIG = {
+    # <= số điểm này: Held-Karp (chính xác, O(2^n * n^2)); lớn hơn: heuristic
+    "HELD_KARP_MAX_STOPS": int(os.getenv("TSP_HELD_KARP_MAX_STOPS", 12)),
+    # Số vòng 2-opt / Or-opt tối đa
+    "LOCAL_SEARCH_ROUNDS": int(os.getenv("TSP_LOCAL_SEARCH_ROUNDS", 20)),
+}
+
+# ==================== GEOCODE CONFIG ====================
+GEOCODE_CONFIG = {
+    # SQLite lưu cache geocode (backend/data đã nằm trong .gitignore)
+    "DB_PATH": os.getenv(
+        "GEOCODE_CACHE_PATH",
+        os.path.join(os.path.dirname(__file__), '../data/geocode_cache.sqlite')
+    ),
+    # Nominatim cho phép tối đa 1 request/giây (tính chung mọi worker khi CacheLayer có Redis;
+    # không có Redis thì là giới hạn / worker -> chia RATE_PER_SEC cho số worker)
+    "RATE_PER_SEC": float(os.getenv("GEOCODE_RATE_PER_SEC", 1.0)),
+    "BURST": int(os.getenv("GEOCODE_BURST", 1)),
+    # Số địa điểm geocode song song trong 1 hành trình
+    "MAX_WORKERS": int(os.getenv("GEOCODE_MAX_WORKERS", 4)),
+}
+
+# ==================== PLACE INDEX CONFIG ====================
+PLACE_INDEX_CONFIG = {
+    # File POI bổ sung (JSON hoặc CSV: name, lat, lon)
+    "POI_PATH": os.getenv(
+        "PLACE_INDEX_POI_PATH",
+        os.path.join(os.path.dirname(__file__), '../data/poi.json')
+    ),
+    "POI_WEIGHT": 5.0,           # POI được ưu tiên hơn 1 trạm bus trùng tên
+    "MAX_PREFIX": 6,             # Độ dài tiền tố tối đa được index cho mỗi từ
+    "MIN_GEOCODE_CHARS": 4,      # Query quá ngắn -> không geocode offline
+    "MIN_GEOCODE_COVERAGE": 0.8, # Query phải chiếm >= 80% số từ trong tên mới nhận kết quả offline
+}
+
+# ==================== HTTP CLIENT CONFIG ====================
+HTTP_CLIENT_CONFIG = {
+    "POOL_SIZE": int(os.getenv("HTTP_POOL_SIZE", 10)),                  # Kết nối keep-alive mỗi host
+    "MAX_CONCURRENCY_PER_HOST": int(os.getenv("HTTP_MAX_PER_HOST", 8)),  # Request đồng thời mỗi host
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 10,
+    # Circuit breaker: N lỗi liên tiếp -> ngắt host trong RESET_SECONDS
+    "BREAKER_FAILURE_THRESHOLD": int(os.getenv("HTTP_BREAKER_THRESHOLD", 5)),
+    "BREAKER_RESET_SECONDS": float(os.getenv("HTTP_BREAKER_RESET_SECONDS", 30)),
+}
+
+# ==================== ROUTING ENGINE CONFIG ====================
+ROUTING_CONFIG = {
+    # "osrm": gọi router.project-osrm.org | "local": đồ thị trong process (fallback OSRM)
+    "BACKEND": os.getenv("ROUTING_BACKEND", "osrm").lower(),
+    # Thư mục đồ thị build bằng backend/build_road_graph.py
+    "GRAPH_PATH": os.getenv(
+        "ROAD_GRAPH_PATH",
+        os.path.join(os.path.dirname(__file__), '../data/road_graph')
+    ),
+    # Điểm cách mạng đường xa hơn -> coi như ngoài vùng đồ thị
+    "MAX_SNAP_DISTANCE_M": float(os.getenv("ROAD_GRAPH_MAX_SNAP_M", 1000)),
+    # Số landmark ALT cho mỗi profile (build_road_graph.py --landmarks)
+    "ALT_LANDMARKS": int(os.getenv("ROAD_GRAPH_LANDMARKS", 8)),
+}
+
+# ==================== REALTIME CONTEXT CONFIG ====================
+REALTIME_CONFIG = {
+    # Làm tròn lat/lon thành ô khu vực (2 chữ số ~ 1.1km) -> dùng chung dữ liệu giao thông
+    "CELL_PRECISION": int(os.getenv("REALTIME_CELL_PRECISION", 2)),
+    "DEFAULT_CITY": "Ho Chi Minh City",
+    "DEFAULT_LAT": 10.7769,
+    "DEFAULT_LON": 106.7009,
+    # Làm mới nền: chu kỳ quét + tuổi tối đa trước khi gọi lại API
+    "AUTO_REFRESH": os.getenv("REALTIME_AUTO_REFRESH", "true").lower() == "true",
+    "TICK_SECONDS": 30,
+    "WEATHER_REFRESH_SECONDS": int(os.getenv("REALTIME_WEATHER_REFRESH", 10 * 60)),
+    "TRAFFIC_REFRESH_SECONDS": int(os.getenv("REALTIME_TRAFFIC_REFRESH", 3 * 60)),
+    # Làm mới sớm khi đạt tỉ lệ này của tuổi tối đa (TICK_SECONDS phải nhỏ hơn phần còn lại)
+    "REFRESH_AHEAD_RATIO": float(os.getenv("REALTIME_REFRESH_AHEAD", 0.8)),
+    # Ô không ai hỏi tới trong khoảng này -> ngừng làm mới
+    "CELL_IDLE_SECONDS": 30 * 60,
+    "MAX_CELLS": 64,
+    # API lỗi kéo dài: dữ liệu tốt cũ hơn mức này không trả nữa (coi như không có)
+    "MAX_STALE_SECONDS": int(os.getenv("REALTIME_MAX_STALE", 3600)),
+}
+
+# ==================== CHAT SESSION CONFIG ====================
+CHAT_SESSION_CONFIG = {
+    # "memory": dict LRU trong process | "redis": lưu Redis (sống qua restart, dùng chung giữa worker)
+    "BACKEND": os.getenv("CHAT_SESSION_BACKEND", "memory").lower(),
+    "REDIS_URL": os.getenv("CHAT_SESSION_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0")),
+    "IDLE_TTL": int(os.getenv("CHAT_SESSION_IDLE_TTL", 2 * 3600)),     # Không hoạt động quá lâu -> xóa
+    "MAX_SESSIONS": int(os.getenv("CHAT_SESSION_MAX", 1000)),          # Quá số này -> bỏ session ít dùng nhất
+    "HISTORY_LIMIT": int(os.getenv("CHAT_SESSION_HISTORY_LIMIT", 50)),  # Số lượt chat giữ lại mỗi session
+    "TRIP_PLAN_WAIT": float(os.getenv("CHAT_TRIP_PLAN_WAIT", 8)),       # Chờ trip plan tối đa / lượt (giây)
+}
+
+# ==================== JOB QUEUE CONFIG ====================
+JOB_QUEUE_CONFIG = {
+    # "memory": pool thread trong process | "redis": hàng đợi Redis (worker nào cũng nhận/trả job được)
+    "BACKEND": os.getenv("JOB_QUEUE_BACKEND", "memory").lower(),
+    "REDIS_URL": os.getenv("JOB_QUEUE_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0")),
+    "WORKERS": int(os.getenv("JOB_QUEUE_WORKERS", 4)),          # Số thread xử lý job mỗi process
+    "RESULT_TTL": int(os.getenv("JOB_RESULT_TTL", 10 * 60)),    # Giữ kết quả job sau khi xong (giây)
+    # Redis: lease của worker đang chạy job (gia hạn mỗi 1/3 thời gian); worker chết -> lease hết hạn
+    # -> job được đưa lại vào hàng đợi
+    "LEASE_SECONDS": int(os.getenv("JOB_LEASE_SECONDS", 90)),
+    "RECOVER_INTERVAL": 60,                                     # Chu kỳ quét job bị bỏ dở (giây)
+}
+
+# ==================== AUTH CONFIG ====================
+AUTH_CONFIG = {
+    # Secret HS256 của project (Dashboard -> API -> JWT Secret); trống -> thử JWKS (khóa bất đối xứng)
+    "JWT_SECRET": os.getenv("SUPABASE_JWT_SECRET", ""),
+    "JWT_AUDIENCE": os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated"),
+    "JWT_LEEWAY": 30,                                         # Cho phép lệch đồng hồ (giây)
+    "JWKS_TTL": int(os.getenv("SUPABASE_JWKS_TTL", 3600)),    # Giữ bộ khóa JWKS trong process (giây)
+    "JWKS_TIMEOUT": 5,
+}
+
 # ==================== API CONFIG ====================
 API_CONFIG = {
     "OSRM_TIMEOUT": 5,
     "OSRM_RETRIES": 2,
     "OSRM_CHUNK_SIZE": 25,
+    # Số tọa độ tối đa cho 1 request /table (server public giới hạn 100)
+    "OSRM_TABLE_MAX_COORDS": int(os.getenv("OSRM_TABLE_MAX_COORDS", 100)),
+    # Làm tròn tọa độ khi tạo cache key OSRM (5 chữ số ~ 1m)
+    "OSRM_KEY_PRECISION": 5,
 }
 
 print("✅ Cache config loaded successfully")
\ No newline at end of file
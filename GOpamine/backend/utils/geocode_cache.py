@@ -0,0 +1,178 @@
+"""
+GEOCODE CACHE - Cache kết quả geocoding (tên địa điểm -> tọa độ)
+Features:
+  - Chuẩn hóa query (chữ thường, gộp khoảng trắng, bỏ dấu câu thừa)
+  - 2 tầng: CacheLayer (Memory/Redis) + SQLite bền vững (dùng chung giữa các worker)
+  - Token bucket: chỉ giới hạn request THẬT ra Nominatim, cache hit không phải chờ
+  - Có Redis (CacheLayer): thêm giới hạn chung mọi worker (INCR theo khung 1/RATE_PER_SEC giây),
+    N worker vẫn chỉ gửi RATE_PER_SEC req/s; Redis lỗi -> chỉ còn giới hạn trong process
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+import unicodedata
+from typing import Dict, Optional
+
+from backend.utils.cache_layer import cache, cache_get, cache_set, cache_key
+from backend.utils.config import CACHE_CONFIG, GEOCODE_CONFIG
+
+logger = logging.getLogger('geocode_cache')
+
+
+def normalize_query(query) -> str:
+    """'  Đại học  Bách Khoa, ' -> 'đại học bách khoa'"""
+    text = unicodedata.normalize('NFC', str(query or '')).lower()
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip(' ,.;-')
+
+
+# ==================== TOKEN BUCKET ====================
+
+class TokenBucket:
+    """
+    Rate limiter dạng token bucket (thread-safe).
+    rate: số token nạp lại mỗi giây, capacity: số request được "burst"
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(capacity))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Chờ tới khi lấy được 1 token"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedRateLimiter:
+    """
+    Giới hạn dùng chung giữa các worker qua Redis của CacheLayer:
+    mỗi khung dài 1/rate giây cho tối đa `capacity` request (INCR + PEXPIRE trên key của khung).
+    Luôn qua TokenBucket trong process trước -> các thread cùng worker không dội Redis.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: int = 1):
+        self.name = name
+        self.capacity = max(1, int(capacity))
+        self.window_ms = max(1, int(1000 / float(rate)))
+        self.local = TokenBucket(rate, capacity)
+
+    def _acquire_shared(self, redis_client) -> bool:
+        """False nếu Redis lỗi (caller coi như đã có giới hạn trong process)"""
+        while True:
+            now_ms = int(time.time() * 1000)
+            window = now_ms // self.window_ms
+            key = cache_key("ratelimit", self.name, window)
+            try:
+                pipe = redis_client.pipeline()
+                pipe.incr(key)
+                pipe.pexpire(key, self.window_ms * 2)
+                count = pipe.execute()[0]
+            except Exception as e:
+                logger.warning(f"⚠️ Shared rate limit unavailable ({self.name}): {e}")
+                return False
+            if count <= self.capacity:
+                return True
+            time.sleep(((window + 1) * self.window_ms - now_ms) / 1000)
+
+    def acquire(self):
+        """Chờ tới khi được gửi 1 request"""
+        self.local.acquire()
+        if cache.redis_client is not None:
+            self._acquire_shared(cache.redis_client)
+
+
+# ==================== GEOCODE CACHE ====================
+
+class GeocodeCache:
+    """Cache geocode: CacheLayer (nhanh) -> SQLite (bền vững)"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or GEOCODE_CONFIG["DB_PATH"]
+        self.lock = threading.Lock()
+        self.conn = None
+        self._init_db()
+
+    def _init_db(self):
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " query TEXT PRIMARY KEY,"
+                " result TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self.conn.commit()
+            logger.info(f"✅ Geocode cache: {self.db_path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Geocode SQLite unavailable: {e}. Chỉ dùng CacheLayer.")
+            self.conn = None
+
+    def get(self, query) -> Optional[Dict]:
+        norm = normalize_query(query)
+        if not norm:
+            return None
+
+        key = cache_key("geocode", norm)
+        result = cache_get(key)
+        if result:
+            return result
+
+        if self.conn is None:
+            return None
+        try:
+            with self.lock:
+                row = self.conn.execute(
+                    "SELECT result FROM geocode WHERE query = ?", (norm,)
+                ).fetchone()
+        except Exception as e:
+            logger.warning(f"⚠️ Geocode cache read error: {e}")
+            return None
+        if not row:
+            return None
+
+        result = json.loads(row[0])
+        cache_set(key, result, CACHE_CONFIG["TTL"]["geocode"])
+        return result
+
+    def set(self, query, result: Dict):
+        norm = normalize_query(query)
+        if not norm or not result:
+            return
+
+        cache_set(cache_key("geocode", norm), result, CACHE_CONFIG["TTL"]["geocode"])
+        if self.conn is None:
+            return
+        try:
+            with self.lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO geocode (query, result, updated_at) VALUES (?, ?, ?)",
+                    (norm, json.dumps(result, ensure_ascii=False), time.time())
+                )
+                self.conn.commit()
+        except Exception as e:
+            logger.warning(f"⚠️ Geocode cache write error: {e}")
+
+
+# ==================== GLOBAL INSTANCES ====================
+
+geocode_cache = GeocodeCache()
+nominatim_limiter = SharedRateLimiter("nominatim", GEOCODE_CONFIG["RATE_PER_SEC"], GEOCODE_CONFIG["BURST"])
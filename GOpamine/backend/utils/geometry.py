@@ -0,0 +1,300 @@
+"""
+GEOMETRY UTILS - Nén dữ liệu đường vẽ trả về cho Frontend
+Features:
+  - Google Encoded Polyline (precision 5, chuẩn Google Maps / Leaflet plugin)
+  - Bảng geometry dùng chung: mỗi path chỉ serialize 1 lần, segments tham chiếu theo index
+  - Douglas-Peucker (NumPy) + tolerance theo zoom level
+"""
+
+import math
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+POLYLINE_FORMAT = "polyline5"
+POLYLINE_PRECISION = 5
+
+
+# ==================== ENCODED POLYLINE ====================
+
+def _encode_value(value: int, out: List[str]):
+    value = ~(value << 1) if value < 0 else (value << 1)
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(points, precision: int = POLYLINE_PRECISION) -> str:
+    """
+    Encode danh sách [[lat, lng], ...] thành chuỗi Google Encoded Polyline
+    """
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lng = 0
+
+    for point in points or []:
+        lat = int(round(float(point[0]) * factor))
+        lng = int(round(float(point[1]) * factor))
+        _encode_value(lat - prev_lat, out)
+        _encode_value(lng - prev_lng, out)
+        prev_lat, prev_lng = lat, lng
+
+    return "".join(out)
+
+
+def decode_polyline(encoded: str, precision: int = POLYLINE_PRECISION) -> List[List[float]]:
+    """Decode chuỗi polyline về [[lat, lng], ...] (dùng cho debug/test)"""
+    factor = 10 ** precision
+    points = []
+    index = lat = lng = 0
+    length = len(encoded or "")
+
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                b = ord(encoded[index]) - 63
+                index += 1
+                result |= (b & 0x1f) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else (result >> 1))
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append([lat / factor, lng / factor])
+
+    return points
+
+
+def lonlat_to_latlng(coords) -> List[List[float]]:
+    """GeoJSON/OSRM trả [lon, lat] -> đổi về [lat, lng]"""
+    return [[c[1], c[0]] for c in coords or []]
+
+
+# ==================== BẢNG GEOMETRY DÙNG CHUNG ====================
+
+class GeometryTable:
+    """
+    Bảng geometry của 1 response: path giống nhau chỉ encode 1 lần,
+    các chỗ dùng path đó chỉ giữ index.
+    """
+
+    def __init__(self, precision: int = POLYLINE_PRECISION):
+        self.precision = precision
+        self.geometries: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def add(self, points) -> int:
+        encoded = encode_polyline(points, self.precision)
+        idx = self._index.get(encoded)
+        if idx is None:
+            idx = len(self.geometries)
+            self.geometries.append(encoded)
+            self._index[encoded] = idx
+        return idx
+
+
+def _compact_route(route: Dict, table: GeometryTable) -> Dict:
+    """
+    Đổi 1 option bus sang dạng nén:
+      - segments[].path        -> segments[].path_ref
+      - route_coordinates      -> route_refs (nối các path theo thứ tự)
+    """
+    route = dict(route)
+    segment_paths = []
+
+    if isinstance(route.get('segments'), list):
+        new_segments = []
+        for seg in route['segments']:
+            if isinstance(seg, dict) and isinstance(seg.get('path'), list):
+                seg = dict(seg)
+                path = seg.pop('path')
+                seg['path_ref'] = table.add(path)
+                segment_paths.append((seg['path_ref'], path))
+            new_segments.append(seg)
+        route['segments'] = new_segments
+
+    if isinstance(route.get('route_coordinates'), list):
+        coords = route.pop('route_coordinates')
+        joined = [p for _, path in segment_paths for p in path]
+        if segment_paths and joined == coords:
+            # route_coordinates chính là các path segment nối lại -> không gửi lại lần 2
+            route['route_refs'] = [idx for idx, _ in segment_paths]
+        else:
+            route['route_refs'] = [table.add(coords)]
+
+    return route
+
+
+def compact_bus_result(result: Dict, precision: int = POLYLINE_PRECISION) -> Dict:
+    """
+    Nén kết quả find_smart_bus_route (key 'routes') sang wire format polyline.
+    Giữ nguyên các field khác; thêm 'geometry_format' và 'geometries'.
+    """
+    if not isinstance(result, dict) or not isinstance(result.get('routes'), list):
+        return result
+
+    table = GeometryTable(precision)
+    compacted = dict(result)
+    compacted['routes'] = [
+        _compact_route(r, table) if isinstance(r, dict) else r
+        for r in result['routes']
+    ]
+    compacted['geometry_format'] = POLYLINE_FORMAT
+    compacted['geometries'] = table.geometries
+    return compacted
+
+
+def wants_polyline(data: Optional[Dict]) -> bool:
+    """Client opt-in: {"geometry_format": "polyline"}"""
+    if not data:
+        return False
+    fmt = str(data.get('geometry_format') or '').lower()
+    return fmt in ('polyline', POLYLINE_FORMAT)
+
+
+# ==================== DOUGLAS-PEUCKER ====================
+
+# Mét trên 1 pixel ở zoom 0 tại xích đạo (Web Mercator, tile 256px)
+METERS_PER_PIXEL_Z0 = 156543.03392
+DEFAULT_LAT = 10.7769                   # Trung tâm TP.HCM
+TOLERANCE_PIXELS = 1.0                  # Sai số cho phép: 1 pixel trên màn hình
+MIN_TOLERANCE_M = 1.0
+MAX_TOLERANCE_M = 1024.0
+
+
+def zoom_to_tolerance_m(zoom: float, lat: float = DEFAULT_LAT) -> float:
+    """Đổi zoom level của bản đồ thành sai số (mét) tương ứng ~1 pixel"""
+    meters_per_pixel = METERS_PER_PIXEL_Z0 * math.cos(math.radians(lat)) / (2 ** float(zoom))
+    return meters_per_pixel * TOLERANCE_PIXELS
+
+
+def tolerance_bucket(tolerance_m) -> Optional[int]:
+    """
+    Làm tròn XUỐNG về lũy thừa của 2 (1, 2, 4, ... 1024 m) để cache theo bucket.
+    Trả về None nếu không cần đơn giản hóa.
+    """
+    try:
+        tolerance_m = float(tolerance_m)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(tolerance_m) or tolerance_m < MIN_TOLERANCE_M:
+        return None
+    tolerance_m = min(tolerance_m, MAX_TOLERANCE_M)
+    return 2 ** int(math.floor(math.log2(tolerance_m)))
+
+
+def resolve_tolerance(data: Optional[Dict]) -> Optional[int]:
+    """
+    Lấy tolerance bucket từ request: ưu tiên 'tolerance_m', sau đó 'zoom'.
+    """
+    if not data:
+        return None
+    if data.get('tolerance_m') not in (None, ''):
+        return tolerance_bucket(data.get('tolerance_m'))
+    if data.get('zoom') not in (None, ''):
+        try:
+            return tolerance_bucket(zoom_to_tolerance_m(float(data.get('zoom'))))
+        except (TypeError, ValueError, OverflowError):
+            return None
+    return None
+
+
+def _project_xy(points):
+    """Chiếu [lat, lng] sang mặt phẳng mét (equirectangular, đủ chính xác trong 1 thành phố)"""
+    lat0 = math.radians(sum(p[0] for p in points) / len(points))
+    kx = 111320.0 * math.cos(lat0)
+    ky = 110540.0
+    return [(float(p[1]) * kx, float(p[0]) * ky) for p in points]
+
+
+def _dp_keep_numpy(xy, tolerance_m):
+    pts = np.asarray(xy, dtype=np.float64)
+    n = len(pts)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        a = pts[i]
+        d = pts[j] - a
+        seg = pts[i + 1:j] - a
+        length_sq = float(d @ d)
+        if length_sq > 0:
+            # Khoảng cách tới ĐOẠN thẳng [a, b] (t kẹp trong [0, 1]), tính cả vector 1 lần
+            t = np.clip((seg @ d) / length_sq, 0.0, 1.0)
+            diff = seg - t[:, None] * d
+        else:
+            diff = seg
+        dist_sq = np.einsum('ij,ij->i', diff, diff)
+        k = int(np.argmax(dist_sq))
+        if dist_sq[k] > tolerance_m * tolerance_m:
+            mid = i + 1 + k
+            keep[mid] = True
+            stack.append((i, mid))
+            stack.append((mid, j))
+
+    return keep.tolist()
+
+
+def _dp_keep_python(xy, tolerance_m):
+    """Fallback khi không có NumPy (cùng thuật toán)"""
+    n = len(xy)
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    tol_sq = tolerance_m * tolerance_m
+
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        ax, ay = xy[i]
+        dx, dy = xy[j][0] - ax, xy[j][1] - ay
+        length_sq = dx * dx + dy * dy
+        best_k, best_d = -1, -1.0
+        for k in range(i + 1, j):
+            px, py = xy[k][0] - ax, xy[k][1] - ay
+            if length_sq > 0:
+                t = max(0.0, min(1.0, (px * dx + py * dy) / length_sq))
+                px, py = px - t * dx, py - t * dy
+            d = px * px + py * py
+            if d > best_d:
+                best_k, best_d = k, d
+        if best_d > tol_sq:
+            keep[best_k] = True
+            stack.append((i, best_k))
+            stack.append((best_k, j))
+
+    return keep
+
+
+def simplify_path(points, tolerance_m) -> List:
+    """
+    Douglas-Peucker cho path [[lat, lng], ...] với sai số tolerance_m (mét).
+    Luôn giữ điểm đầu và điểm cuối.
+    """
+    if not points or len(points) < 3 or not tolerance_m or tolerance_m <= 0:
+        return points
+
+    xy = _project_xy(points)
+    keep = _dp_keep_numpy(xy, tolerance_m) if NUMPY_AVAILABLE else _dp_keep_python(xy, tolerance_m)
+    return [p for p, k in zip(points, keep) if k]
+
+
+def simplify_lonlat_path(coords, tolerance_m) -> List:
+    """Như simplify_path nhưng cho tọa độ GeoJSON/OSRM [lon, lat]"""
+    if not coords or len(coords) < 3 or not tolerance_m:
+        return coords
+    simplified = simplify_path(lonlat_to_latlng(coords), tolerance_m)
+    return lonlat_to_latlng(simplified)
@@ -0,0 +1,275 @@
+"""
+HTTP CLIENT - Client dùng chung cho mọi request ra ngoài (OSRM, Nominatim, OpenWeather, TomTom)
+Features:
+  - requests.Session riêng cho mỗi host -> giữ kết nối keep-alive (không bắt tay TCP/TLS lại)
+  - Giới hạn số request đồng thời mỗi host (semaphore)
+  - Timeout mặc định (connect, read)
+  - Circuit breaker: host lỗi liên tục -> ngắt tạm thời, trả lỗi ngay thay vì chờ timeout
+  - Bản async: httpx.AsyncClient (nếu có), fallback asyncio.to_thread; cùng giới hạn / host
+    (asyncio.Semaphore), client + semaphore gắn theo event loop (WeakKeyDictionary, loop mất thì tự bỏ)
+"""
+
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+from backend.utils.config import HTTP_CLIENT_CONFIG
+
+logger = logging.getLogger('http_client')
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Host đang bị ngắt (circuit open). Là ConnectionError nên code cũ bắt RequestException vẫn chạy"""
+
+
+# ==================== CIRCUIT BREAKER ====================
+
+class CircuitBreaker:
+    """
+    closed    : bình thường, đếm lỗi liên tiếp
+    open      : lỗi >= threshold -> chặn mọi request trong reset_seconds
+    half-open : hết thời gian chặn -> cho 1 request thử, thành công thì đóng lại
+    """
+
+    def __init__(self, name: str, threshold: int, reset_seconds: float):
+        self.name = name
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"✅ Circuit closed: {self.name}")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                logger.warning(f"⚠️ Circuit OPEN: {self.name} ({self.failures} lỗi liên tiếp)")
+
+    def release_trial(self):
+        """Request không có kết quả (bị hủy, lỗi phía mình) -> trả lượt thử, không tính lỗi host"""
+        with self.lock:
+            if self.opened_at is not None:
+                self.trial_in_flight = False
+
+
+# ==================== HOST POOL ====================
+
+class HostClient:
+    """Session + semaphore + breaker cho 1 host"""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=HTTP_CLIENT_CONFIG["POOL_SIZE"],
+            max_retries=0  # Retry do call site quyết định
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.semaphore = threading.BoundedSemaphore(HTTP_CLIENT_CONFIG["MAX_CONCURRENCY_PER_HOST"])
+        self.breaker = CircuitBreaker(
+            host,
+            HTTP_CLIENT_CONFIG["BREAKER_FAILURE_THRESHOLD"],
+            HTTP_CLIENT_CONFIG["BREAKER_RESET_SECONDS"]
+        )
+
+
+class HttpClient:
+    """
+    Dùng thay requests.get/post:
+        resp = http_get(url, params=..., timeout=5)
+    """
+
+    def __init__(self):
+        self.hosts: Dict[str, HostClient] = {}
+        self.lock = threading.Lock()
+        # event loop -> {'client': httpx.AsyncClient, 'semaphores': {host: asyncio.Semaphore}}
+        self._async_state = weakref.WeakKeyDictionary()
+
+    def _host(self, url: str) -> HostClient:
+        host = urlsplit(url).netloc.lower()
+        client = self.hosts.get(host)
+        if client is None:
+            with self.lock:
+                client = self.hosts.get(host)
+                if client is None:
+                    client = self.hosts[host] = HostClient(host)
+        return client
+
+    @staticmethod
+    def _is_failure(resp) -> bool:
+        # 5xx / 429 = host đang có vấn đề; 4xx khác là lỗi của request
+        return resp.status_code >= 500 or resp.status_code == 429
+
+    def _record(self, breaker: CircuitBreaker, resp):
+        if self._is_failure(resp):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def request(self, method: str, url: str, **kwargs):
+        client = self._host(url)
+        if not client.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {client.host}")
+
+        kwargs.setdefault("timeout", (HTTP_CLIENT_CONFIG["CONNECT_TIMEOUT"], HTTP_CLIENT_CONFIG["READ_TIMEOUT"]))
+        recorded = False
+        try:
+            with client.semaphore:
+                try:
+                    resp = client.session.request(method, url, **kwargs)
+                except requests.exceptions.RequestException:
+                    recorded = True
+                    client.breaker.record_failure()
+                    raise
+            recorded = True
+            self._record(client.breaker, resp)
+            return resp
+        finally:
+            # Lỗi khác (URL sai, ValueError...) -> không để kẹt lượt thử half-open
+            if not recorded:
+                client.breaker.release_trial()
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    # ==================== ASYNC ====================
+
+    def _loop_state(self) -> Dict:
+        """Client + semaphore cho event loop hiện tại (không dùng chéo loop được)"""
+        loop = asyncio.get_running_loop()
+        state = self._async_state.get(loop)
+        if state is None:
+            state = {
+                "client": httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=HTTP_CLIENT_CONFIG["POOL_SIZE"] * 4,
+                        max_keepalive_connections=HTTP_CLIENT_CONFIG["POOL_SIZE"]
+                    ),
+                    timeout=httpx.Timeout(HTTP_CLIENT_CONFIG["READ_TIMEOUT"], connect=HTTP_CLIENT_CONFIG["CONNECT_TIMEOUT"])
+                ),
+                "semaphores": {},
+            }
+            self._async_state[loop] = state
+        return state
+
+    def _async_semaphore(self, state: Dict, host: str) -> asyncio.Semaphore:
+        semaphore = state["semaphores"].get(host)
+        if semaphore is None:
+            semaphore = state["semaphores"][host] = asyncio.Semaphore(HTTP_CLIENT_CONFIG["MAX_CONCURRENCY_PER_HOST"])
+        return semaphore
+
+    async def aclose(self):
+        """Đóng client async của loop hiện tại (gọi khi app ASGI shutdown)"""
+        state = self._async_state.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state["client"].aclose()
+
+    async def arequest(self, method: str, url: str, **kwargs):
+        if not HTTPX_AVAILABLE:
+            return await asyncio.to_thread(self.request, method, url, **kwargs)
+
+        host = self._host(url)
+        if not host.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {host.host}")
+
+        timeout = kwargs.pop("timeout", None)
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        recorded = False
+        try:
+            state = self._loop_state()
+            async with self._async_semaphore(state, host.host):
+                try:
+                    resp = await state["client"].request(method, url, **kwargs)
+                except httpx.HTTPError as e:
+                    recorded = True
+                    host.breaker.record_failure()
+                    # Giữ đúng loại lỗi của requests để call site phân biệt timeout / mất kết nối
+                    if isinstance(e, httpx.ConnectTimeout):
+                        raise requests.exceptions.ConnectTimeout(str(e)) from e
+                    if isinstance(e, httpx.TimeoutException):
+                        raise requests.exceptions.Timeout(str(e)) from e
+                    raise requests.exceptions.ConnectionError(str(e)) from e
+            recorded = True
+            self._record(host.breaker, resp)
+            return resp
+        finally:
+            # Bị hủy (client ASGI ngắt), URL sai... -> không để kẹt lượt thử half-open
+            if not recorded:
+                host.breaker.release_trial()
+
+    async def aget(self, url: str, **kwargs):
+        return await self.arequest("GET", url, **kwargs)
+
+    def get_stats(self) -> Dict:
+        return {
+            host: {"state": c.breaker.state, "failures": c.breaker.failures}
+            for host, c in list(self.hosts.items())
+        }
+
+
+# ==================== GLOBAL INSTANCE ====================
+
+http = HttpClient()
+
+
+def http_get(url: str, **kwargs):
+    return http.get(url, **kwargs)
+
+
+def http_post(url: str, **kwargs):
+    return http.post(url, **kwargs)
+
+
+async def async_http_get(url: str, **kwargs):
+    return await http.aget(url, **kwargs)
@@ -0,0 +1,353 @@
+"""
+JOB QUEUE - Chạy tác vụ chậm (lập lộ trình, tìm bus đa điểm) trong nền, client poll kết quả
+Features:
+  - register_task(name, func): khai báo tác vụ; func(payload: dict) -> kết quả JSON được
+  - submit() trả job_id ngay; trạng thái queued -> running -> done | failed
+  - Chống trùng: cùng task + cùng input (hash) đang chờ/chạy -> trả lại job_id cũ
+  - Memory: ThreadPoolExecutor trong process
+  - Redis (JOB_QUEUE_BACKEND=redis): hàng đợi + trạng thái trên Redis, worker nào cũng
+    nhận job và trả trạng thái được (Redis lỗi -> tự về memory); job đã nhận nằm trong list
+    processing + có lease được worker gia hạn liên tục, worker chết (lease hết hạn) thì job được
+    thu hồi chạy lại; consumer chạy ngay khi app khởi động (start()), không chờ submit đầu tiên
+"""
+
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+from backend.utils.config import JOB_QUEUE_CONFIG
+
+logger = logging.getLogger('job_queue')
+
+TASKS: Dict[str, Callable] = {}
+
+# Field trả cho client (bỏ payload / hash nội bộ)
+PUBLIC_FIELDS = ("job_id", "task", "status", "result", "error", "created_at", "started_at", "finished_at")
+
+
+def register_task(name: str, func: Callable):
+    """Đăng ký tác vụ chạy nền (gọi lúc import module route)"""
+    TASKS[name] = func
+
+
+def input_hash(task: str, payload) -> str:
+    raw = json.dumps([task, payload], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def public_view(job: Optional[Dict]) -> Optional[Dict]:
+    if job is None:
+        return None
+    return {k: job.get(k) for k in PUBLIC_FIELDS}
+
+
+def _execute(job: Dict) -> Dict:
+    """Chạy 1 job, cập nhật status/result/error trên chính dict job"""
+    job["status"] = "running"
+    job["started_at"] = time.time()
+    try:
+        job["result"] = TASKS[job["task"]](job["payload"])
+        job["status"] = "done"
+    except Exception as e:
+        logger.error(f"❌ Job {job['job_id']} ({job['task']}) failed: {e}", exc_info=True)
+        job["error"] = str(e)
+        job["status"] = "failed"
+    job["finished_at"] = time.time()
+    return job
+
+
+# ==================== MEMORY ====================
+
+class JobQueue:
+    """Pool thread trong process; job giữ RESULT_TTL giây sau khi xong"""
+
+    def __init__(self, workers: int = None, result_ttl: int = None):
+        self.workers = workers or JOB_QUEUE_CONFIG["WORKERS"]
+        self.result_ttl = result_ttl or JOB_QUEUE_CONFIG["RESULT_TTL"]
+        self._jobs: Dict[str, Dict] = {}
+        self._inflight: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @staticmethod
+    def _new_job(task: str, payload, digest: str) -> Dict:
+        if task not in TASKS:
+            raise ValueError(f"Unknown task: {task}")
+        return {
+            "job_id": uuid.uuid4().hex,
+            "task": task,
+            "payload": payload,
+            "hash": digest,
+            "status": "queued",
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+
+    def _purge_expired(self):
+        now = time.time()
+        for job_id in [j for j, job in self._jobs.items()
+                       if job["finished_at"] and now - job["finished_at"] > self.result_ttl]:
+            del self._jobs[job_id]
+
+    def _run(self, job: Dict):
+        _execute(job)
+        with self._lock:
+            if self._inflight.get(job["hash"]) == job["job_id"]:
+                del self._inflight[job["hash"]]
+
+    def submit(self, task: str, payload) -> Tuple[str, bool]:
+        """Trả về (job_id, deduplicated)"""
+        digest = input_hash(task, payload)
+        with self._lock:
+            self._purge_expired()
+            existing = self._inflight.get(digest)
+            if existing is not None:
+                return existing, True
+
+            job = self._new_job(task, payload, digest)
+            self._jobs[job["job_id"]] = job
+            self._inflight[digest] = job["job_id"]
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+
+        self._executor.submit(self._run, job)
+        return job["job_id"], False
+
+    def start(self):
+        """Gọi lúc app khởi động (sau khi đã register_task); memory không có gì để chạy trước"""
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            return public_view(self._jobs.get(job_id))
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {"backend": "memory", "workers": self.workers, "jobs": counts}
+
+
+# ==================== REDIS ====================
+
+class RedisJobQueue(JobQueue):
+    """
+    job:<id>            JSON job; chỉ đặt TTL RESULT_TTL khi job xong (queued/running không hết hạn)
+    job:inflight:<hash> job_id đang chờ/chạy (SET NX -> chống trùng giữa các worker), xóa khi xong
+    jobs:queue          list job_id chờ chạy (LPUSH / BLMOVE)
+    jobs:processing     list job_id đã nhận (BLMOVE từ jobs:queue)
+    job:lease:<id>      worker đang giữ job (EX LEASE_SECONDS, gia hạn mỗi LEASE_SECONDS/3 khi còn chạy);
+                        job trong processing mà mất lease qua 2 lần quét -> đẩy lại vào jobs:queue
+    """
+
+    QUEUE_KEY = "jobs:queue"
+    PROCESSING_KEY = "jobs:processing"
+    FINISHED = ("done", "failed")
+
+    def __init__(self, redis_url: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.redis_client = None
+        self.lease_seconds = JOB_QUEUE_CONFIG["LEASE_SECONDS"]
+        self._consumers_started = False
+        self._suspects = set()
+        try:
+            self.redis_client = redis.from_url(
+                redis_url or JOB_QUEUE_CONFIG["REDIS_URL"],
+                decode_responses=True,
+                socket_connect_timeout=5
+            )
+            self.redis_client.ping()
+            logger.info("✅ Job queue on Redis")
+        except Exception as e:
+            logger.warning(f"⚠️ Redis job queue unavailable: {e}. Falling back to memory.")
+            self.redis_client = None
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    @staticmethod
+    def _inflight_key(digest: str) -> str:
+        return f"job:inflight:{digest}"
+
+    @staticmethod
+    def _lease_key(job_id: str) -> str:
+        return f"job:lease:{job_id}"
+
+    def _save(self, job: Dict):
+        # Job chưa xong không được hết hạn (client đang poll); SET không EX cũng bỏ TTL cũ
+        ttl = self.result_ttl if job["status"] in self.FINISHED else None
+        self.redis_client.set(self._job_key(job["job_id"]), json.dumps(job, ensure_ascii=False, default=str), ex=ttl)
+
+    def _load(self, job_id: str) -> Optional[Dict]:
+        raw = self.redis_client.get(self._job_key(job_id))
+        return json.loads(raw) if raw else None
+
+    def start(self):
+        if self.redis_client is not None:
+            self._ensure_consumers()
+
+    def _ensure_consumers(self):
+        if self._consumers_started:
+            return
+        with self._lock:
+            if self._consumers_started:
+                return
+            for i in range(self.workers):
+                threading.Thread(target=self._consume, name=f"job-consumer-{i}", daemon=True).start()
+            threading.Thread(target=self._recover_loop, name="job-recover", daemon=True).start()
+            self._consumers_started = True
+            logger.info(f"✅ Started {self.workers} job consumers")
+
+    def _finish(self, job: Dict):
+        """Ghi kết quả (có TTL) rồi mới gỡ khỏi processing / inflight"""
+        self._save(job)
+        pipe = self.redis_client.pipeline()
+        pipe.lrem(self.PROCESSING_KEY, 0, job["job_id"])
+        pipe.delete(self._inflight_key(job["hash"]))
+        pipe.delete(self._lease_key(job["job_id"]))
+        pipe.execute()
+
+    def _heartbeat(self, job_id: str, stop: threading.Event):
+        """Gia hạn lease khi job còn chạy (job dài hơn LEASE_SECONDS không bị thu hồi nhầm)"""
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                self.redis_client.expire(self._lease_key(job_id), self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Job heartbeat error ({job_id}): {e}")
+
+    def _consume(self):
+        while True:
+            try:
+                job_id = self.redis_client.blmove(self.QUEUE_KEY, self.PROCESSING_KEY, 5, "RIGHT", "LEFT")
+                if not job_id:
+                    continue
+                self.redis_client.set(self._lease_key(job_id), threading.current_thread().name, ex=self.lease_seconds)
+                job = self._load(job_id)
+                if job is None or job["status"] in self.FINISHED:
+                    self.redis_client.lrem(self.PROCESSING_KEY, 0, job_id)
+                    continue
+                if job["task"] not in TASKS:
+                    job.update(status="failed", error=f"Unknown task: {job['task']}", finished_at=time.time())
+                    self._finish(job)
+                    continue
+
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                self._save(job)
+                stop = threading.Event()
+                threading.Thread(target=self._heartbeat, args=(job_id, stop), daemon=True).start()
+                try:
+                    _execute(job)
+                finally:
+                    stop.set()
+                self._finish(job)
+            except Exception as e:
+                logger.error(f"Job consumer error: {e}")
+                time.sleep(1)
+
+    def _recover_loop(self):
+        while True:
+            try:
+                self.recover_stale()
+            except Exception as e:
+                logger.error(f"Job recover error: {e}")
+            time.sleep(JOB_QUEUE_CONFIG["RECOVER_INTERVAL"])
+
+    def recover_stale(self) -> int:
+        """
+        Job nằm trong processing mà không còn lease (worker chết, hết hạn không ai gia hạn) ở
+        2 lần quét liên tiếp -> đưa về queued và đẩy lại vào hàng đợi. Lần đầu chỉ ghi nhận:
+        worker có thể vừa BLMOVE mà chưa kịp đặt lease. Trả về số job đã thu hồi.
+        """
+        recovered = 0
+        suspects = set()
+        for job_id in self.redis_client.lrange(self.PROCESSING_KEY, 0, -1):
+            job = self._load(job_id)
+            if job is None or job["status"] in self.FINISHED:
+                self.redis_client.lrem(self.PROCESSING_KEY, 0, job_id)
+                continue
+            if self.redis_client.exists(self._lease_key(job_id)):
+                continue
+            if job_id not in self._suspects:
+                suspects.add(job_id)
+                continue
+            # LREM thành công mới đẩy lại -> 2 worker cùng thu hồi cũng chỉ 1 lần
+            if self.redis_client.lrem(self.PROCESSING_KEY, 1, job_id):
+                job.update(status="queued", started_at=None)
+                self._save(job)
+                self.redis_client.rpush(self.QUEUE_KEY, job_id)
+                recovered += 1
+                logger.warning(f"⚠️ Re-queued stale job {job_id} ({job['task']})")
+        self._suspects = suspects
+        return recovered
+
+    def submit(self, task: str, payload) -> Tuple[str, bool]:
+        if self.redis_client is None:
+            return super().submit(task, payload)
+
+        self._ensure_consumers()
+        digest = input_hash(task, payload)
+        job = self._new_job(task, payload, digest)
+
+        # Chỉ 1 worker giành được khóa inflight cho cùng input (không TTL, xóa khi job xong)
+        if not self.redis_client.set(self._inflight_key(digest), job["job_id"], nx=True):
+            existing = self.redis_client.get(self._inflight_key(digest))
+            existing_job = self._load(existing) if existing else None
+            if existing_job and existing_job["status"] not in self.FINISHED:
+                return existing, True
+            self.redis_client.set(self._inflight_key(digest), job["job_id"])
+
+        self._save(job)
+        self.redis_client.lpush(self.QUEUE_KEY, job["job_id"])
+        return job["job_id"], False
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        if self.redis_client is None:
+            return super().get(job_id)
+        return public_view(self._load(job_id))
+
+    def get_stats(self) -> Dict:
+        if self.redis_client is None:
+            return super().get_stats()
+        return {
+            "backend": "redis",
+            "workers": self.workers,
+            "queued": self.redis_client.llen(self.QUEUE_KEY),
+            "processing": self.redis_client.llen(self.PROCESSING_KEY),
+        }
+
+
+# ==================== GLOBAL INSTANCE ====================
+
+def _create_job_queue() -> JobQueue:
+    if JOB_QUEUE_CONFIG["BACKEND"] == "redis":
+        if REDIS_AVAILABLE:
+            return RedisJobQueue()
+        logger.warning("⚠️ JOB_QUEUE_BACKEND=redis nhưng chưa cài redis -> dùng memory")
+    return JobQueue()
+
+
+job_queue = _create_job_queue()
+
+
+def submit_job(task: str, payload) -> Tuple[str, bool]:
+    return job_queue.submit(task, payload)
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    return job_queue.get(job_id)
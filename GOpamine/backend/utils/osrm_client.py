@@ -0,0 +1,50 @@
+"""
+OSRM CLIENT - Gọi tìm đường (/route) có cache, qua routing backend đang chọn (OSRM HTTP / local)
+Features:
+  - Cache key: backend + profile + tọa độ làm tròn + options -> cùng cặp điểm không gọi lại
+  - TTL dài cho kết quả Ok, TTL ngắn cho lỗi (negative cache, tránh dội request vào host đang lỗi)
+  - Single-flight: nhiều request giống nhau cùng lúc chỉ tốn 1 lần gọi
+"""
+
+from typing import Dict, Optional, Sequence, Tuple
+
+from backend.utils.cache_layer import cache_key, cache_single_flight
+from backend.utils.config import API_CONFIG, CACHE_CONFIG
+from backend.utils.routing_backend import get_routing_backend
+
+
+def _coord_str(lon, lat) -> str:
+    precision = API_CONFIG["OSRM_KEY_PRECISION"]
+    return f"{round(float(lon), precision)},{round(float(lat), precision)}"
+
+
+def _ttl(result: Dict) -> int:
+    ttl = CACHE_CONFIG["TTL"]
+    return ttl["osrm_negative"] if result.get('_negative') else ttl["osrm_route"]
+
+
+def fetch_osrm_route(points: Sequence[Tuple[float, float]], profile: str = 'driving',
+                     params: Optional[Dict] = None, timeout: float = 10,
+                     retries: Optional[int] = None) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    points: [(lon, lat), ...] theo thứ tự đi
+    Output: (osrm_json, None) nếu thành công, (None, error) nếu lỗi
+            error: 'timeout' | 'unavailable' | 'http_xxx' | mã lỗi OSRM ('NoRoute', ...)
+    """
+    backend = get_routing_backend()
+    params = dict(params or {})
+    coords = ";".join(_coord_str(lon, lat) for lon, lat in points)
+    options = "&".join(f"{k}={params[k]}" for k in sorted(params))
+    key = cache_key("osrm_route", backend.name, profile, coords, options)
+
+    if retries is None:
+        retries = API_CONFIG["OSRM_RETRIES"]
+
+    result = cache_single_flight(
+        key,
+        lambda: backend.route(points, profile=profile, params=params, timeout=timeout, retries=max(1, retries)),
+        ttl=_ttl
+    )
+    if not result or result.get('_negative'):
+        return None, (result or {}).get('error', 'unavailable')
+    return result, None
@@ -0,0 +1,188 @@
+"""
+PLACE INDEX - Gazetteer offline cho geocoding & autocomplete
+Features:
+  - Nguồn: tên trạm bus (BusDataManager) + file POI tùy chọn (PLACE_INDEX_POI_PATH)
+  - Bỏ dấu tiếng Việt khi index/tìm ("Bến Thành" == "ben thanh", đ -> d)
+  - Inverted index theo edge n-gram (tiền tố) của từng từ -> tra cứu O(số kết quả)
+  - Tự build lại khi dữ liệu bus refresh (data_version thay đổi)
+"""
+
+import os
+import csv
+import json
+import logging
+import threading
+import unicodedata
+from typing import Dict, List, Optional
+
+from backend.utils.config import PLACE_INDEX_CONFIG
+
+logger = logging.getLogger('place_index')
+
+
+def fold_text(text) -> str:
+    """'Chợ Bến Thành (Quận 1)' -> 'cho ben thanh quan 1'"""
+    text = str(text or '').replace('đ', 'd').replace('Đ', 'D')
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+    text = ''.join(ch if ch.isalnum() else ' ' for ch in text.lower())
+    return ' '.join(text.split())
+
+
+class PlaceIndex:
+    """
+    Index tên địa điểm -> tọa độ.
+    entries[i] = {'name', 'lat', 'lon', 'source', 'weight'}
+    postings[prefix] = set(index entry) với mọi tiền tố (<= MAX_PREFIX ký tự) của mọi từ
+    """
+
+    def __init__(self, max_prefix: int = None):
+        self.max_prefix = max_prefix or PLACE_INDEX_CONFIG["MAX_PREFIX"]
+        self.entries: List[Dict] = []
+        self.folded: List[str] = []
+        self.tokens: List[List[str]] = []
+        self.postings: Dict[str, set] = {}
+        self._by_name: Dict[str, int] = {}
+
+    def add(self, name, lat, lon, source='poi', weight=1.0):
+        folded = fold_text(name)
+        if not folded:
+            return
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            return
+
+        # Trạm cùng tên (nhiều tuyến / 2 chiều) chỉ giữ 1 entry, tăng độ phổ biến
+        idx = self._by_name.get(folded)
+        if idx is not None:
+            self.entries[idx]['weight'] += weight
+            return
+
+        idx = len(self.entries)
+        self._by_name[folded] = idx
+        self.entries.append({'name': str(name).strip(), 'lat': lat, 'lon': lon, 'source': source, 'weight': weight})
+        self.folded.append(folded)
+        words = folded.split()
+        self.tokens.append(words)
+        for word in words:
+            for k in range(1, min(len(word), self.max_prefix) + 1):
+                self.postings.setdefault(word[:k], set()).add(idx)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _candidates(self, words: List[str]):
+        result = None
+        for word in words:
+            ids = self.postings.get(word[:self.max_prefix])
+            if not ids:
+                return set()
+            result = set(ids) if result is None else result & ids
+            if not result:
+                return result
+        return result or set()
+
+    def search(self, query, limit: int = 10, exact_words: bool = False) -> List[Dict]:
+        """
+        Autocomplete: mọi từ trong query phải là tiền tố của 1 từ trong tên.
+        exact_words=True: mọi từ phải khớp nguyên từ (dùng cho geocode).
+        """
+        folded = fold_text(query)
+        words = folded.split()
+        if not words:
+            return []
+
+        scored = []
+        for idx in self._candidates(words):
+            entry_words = self.tokens[idx]
+            if exact_words:
+                ok = all(w in entry_words for w in words)
+            else:
+                ok = all(any(ew.startswith(w) for ew in entry_words) for w in words)
+            if not ok:
+                continue
+            exact = self.folded[idx] == folded
+            starts = self.folded[idx].startswith(folded)
+            scored.append((not exact, not starts, len(entry_words) - len(words), -self.entries[idx]['weight'], idx))
+
+        scored.sort()
+        return [dict(self.entries[s[-1]]) for s in scored[:limit]]
+
+    def geocode(self, query) -> Optional[Dict]:
+        """
+        Geocode offline: chỉ trả kết quả khi tên khớp gần như trọn vẹn (query phủ >= MIN_GEOCODE_COVERAGE
+        số từ của tên); query chung chung ("Quận 1", "Bệnh viện") -> None để hỏi Nominatim
+        """
+        folded = fold_text(query)
+        if len(folded) < PLACE_INDEX_CONFIG["MIN_GEOCODE_CHARS"]:
+            return None
+        matches = self.search(query, limit=1, exact_words=True)
+        if not matches:
+            return None
+        # search xếp tên khớp hẳn / ít từ thừa nhất lên đầu -> chỉ cần xét kết quả đầu
+        entry_words = fold_text(matches[0]['name']).split()
+        if len(folded.split()) / len(entry_words) < PLACE_INDEX_CONFIG["MIN_GEOCODE_COVERAGE"]:
+            return None
+        return matches[0]
+
+
+# ==================== BUILD ====================
+
+def _load_poi_file(index: PlaceIndex, path: str):
+    """File POI: JSON [{name, lat, lon|lng}, ...] hoặc CSV có cột name,lat,lon|lng"""
+    if not path or not os.path.exists(path):
+        return 0
+    count = 0
+    try:
+        if path.lower().endswith('.csv'):
+            with open(path, encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+        else:
+            with open(path, encoding='utf-8') as f:
+                rows = json.load(f)
+        for row in rows:
+            index.add(row.get('name'), row.get('lat'), row.get('lon', row.get('lng')),
+                      source='poi', weight=float(row.get('weight') or PLACE_INDEX_CONFIG["POI_WEIGHT"]))
+            count += 1
+    except Exception as e:
+        logger.warning(f"⚠️ Không đọc được POI file {path}: {e}")
+    return count
+
+
+def build_place_index(stations=None, poi_path=None) -> PlaceIndex:
+    index = PlaceIndex()
+    poi_count = _load_poi_file(index, poi_path or PLACE_INDEX_CONFIG["POI_PATH"])
+    for s in stations or []:
+        index.add(s.get('StationName'), s.get('Lat'), s.get('Lng'), source='bus_station')
+    logger.info(f"✅ Place index built: {len(index)} places ({poi_count} POI rows)")
+    return index
+
+
+_index: Optional[PlaceIndex] = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_place_index() -> PlaceIndex:
+    """Index dùng chung; build lười, build lại khi dữ liệu bus được refresh"""
+    global _index, _index_version
+    from backend.routes.bus_manager import bus_data
+
+    version = bus_data.data_version
+    if _index is not None and _index_version == version:
+        return _index
+
+    with _index_lock:
+        if _index is None or _index_version != version:
+            _index = build_place_index(list(bus_data.stations))
+            _index_version = version
+    return _index
+
+
+def search_places(query, limit: int = 10) -> List[Dict]:
+    return get_place_index().search(query, limit=limit)
+
+
+def geocode_local(query) -> Optional[Dict]:
+    return get_place_index().geocode(query)
@@ -0,0 +1,282 @@
+"""
+REALTIME CONTEXT - Dữ liệu thời tiết/giao thông dùng chung, làm mới nền theo lịch
+Features:
+  - Thời tiết theo thành phố, giao thông theo ô khu vực (lat/lon làm tròn)
+  - Đọc: bộ nhớ trong process -> CacheLayer (Redis, chia sẻ giữa worker) -> gọi API (1 thread / key)
+  - Thread nền làm mới các ô đang được dùng khi đạt REFRESH_AHEAD_RATIO tuổi tối đa (trước khi hết hạn)
+  - Đọc không bao giờ chờ API khi đã có entry: quá hạn thì trả bản cũ (cờ stale) và xếp lịch làm mới
+    nền (stale-while-revalidate); chỉ lần đầu gặp key (cold miss) mới phải chờ
+  - Kết quả lỗi chỉ giữ ngắn (TTL realtime_error), không làm kẹt dữ liệu tốt cũ trong bộ nhớ
+  - Dữ liệu tốt cũ quá MAX_STALE_SECONDS (API lỗi kéo dài) thì coi như không có dữ liệu
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from backend.routes import real_times
+from backend.utils.cache_layer import cache_get, cache_set, cache_key
+from backend.utils.config import CACHE_CONFIG, REALTIME_CONFIG
+
+logger = logging.getLogger('realtime_context')
+
+
+def area_cell(lat: float, lon: float) -> Tuple[float, float]:
+    """(10.77691, 106.70093) -> (10.78, 106.7)"""
+    precision = REALTIME_CONFIG["CELL_PRECISION"]
+    return round(float(lat), precision), round(float(lon), precision)
+
+
+class RealtimeContextService:
+    """
+    _entries[(kind, key)] = {'data', 'fetched_at', 'attempted_at', 'last_used', 'args'}
+      kind = 'weather' (key = city) | 'traffic' (key = ô khu vực)
+      fetched_at  : lúc lấy được dữ liệu đang giữ (lỗi tạm thời không ghi đè dữ liệu tốt)
+      attempted_at: lần gọi gần nhất (kể cả lỗi) -> không gọi lại dồn dập khi API sập
+    CacheLayer giữ {'data', 'fetched_at'} để mọi worker so được độ mới.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, object], Dict] = {}
+        self._lock = threading.Lock()
+        self._fetch_locks: Dict[str, threading.Lock] = {}
+        self._worker = None
+        # Làm mới nền cho request gặp entry quá hạn (mỗi entry tối đa 1 lượt đang chờ)
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="realtime-refresh")
+        self._refreshing = set()
+
+    # ==================== FETCH ====================
+
+    @staticmethod
+    def _fetch(kind: str, args: Tuple) -> Dict:
+        if kind == 'weather':
+            return real_times.fetch_weather_realtime(real_times.WEATHER_KEY, city=args[0])
+        lat, lon = args
+        return real_times.fetch_traffic_realtime(real_times.TRAFFIC_KEY, lat=lat, lon=lon)
+
+    @classmethod
+    def _fetch_record(cls, kind: str, args: Tuple) -> Dict:
+        return {'data': cls._fetch(kind, args), 'fetched_at': time.time()}
+
+    @staticmethod
+    def _ttl(kind: str, data: Dict) -> int:
+        ttl = CACHE_CONFIG["TTL"]
+        return ttl[f"realtime_{kind}"] if data.get("success") else ttl["realtime_error"]
+
+    @staticmethod
+    def _max_age(kind: str, data: Dict) -> int:
+        if not data.get("success"):
+            return CACHE_CONFIG["TTL"]["realtime_error"]
+        return REALTIME_CONFIG["WEATHER_REFRESH_SECONDS" if kind == 'weather' else "TRAFFIC_REFRESH_SECONDS"]
+
+    def _is_fresh(self, kind: str, record: Optional[Dict], now: float, ratio: float = 1.0) -> bool:
+        return bool(record) and now - record['fetched_at'] < self._max_age(kind, record['data']) * ratio
+
+    def _store(self, kind: str, key, args: Tuple, record: Dict):
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                self._evict_if_full()
+                entry = self._entries[(kind, key)] = {'last_used': time.time(), 'args': args,
+                                                      'data': record['data'], 'fetched_at': record['fetched_at']}
+            entry['attempted_at'] = time.time()
+
+            # Lỗi tạm thời không ghi đè dữ liệu tốt đang có; bản cũ hơn cũng không ghi đè bản mới
+            if entry['data'].get("success") and not record['data'].get("success"):
+                return
+            if record['fetched_at'] >= entry['fetched_at'] or not entry['data'].get("success"):
+                entry['data'] = record['data']
+                entry['fetched_at'] = record['fetched_at']
+
+    def _evict_if_full(self):
+        if len(self._entries) < REALTIME_CONFIG["MAX_CELLS"]:
+            return
+        oldest = min(self._entries, key=lambda k: self._entries[k]['last_used'])
+        self._forget(oldest)
+
+    def _forget(self, entry_key: Tuple):
+        """Bỏ entry + lock fetch của nó (gọi khi đang giữ self._lock)"""
+        del self._entries[entry_key]
+        lock = self._fetch_locks.get(self._cache_key(*entry_key))
+        if lock is not None and not lock.locked():
+            del self._fetch_locks[self._cache_key(*entry_key)]
+
+    def _view(self, kind: str, entry: Dict, now: float) -> Dict:
+        """Dữ liệu trả ra: quá hạn làm mới thì gắn cờ stale, quá MAX_STALE_SECONDS thì coi như không có"""
+        data = entry['data']
+        if not data.get("success"):
+            return data
+        age = now - entry['fetched_at']
+        if age > REALTIME_CONFIG["MAX_STALE_SECONDS"]:
+            return {"success": False, "error": "stale"}
+        if age >= self._max_age(kind, data):
+            return dict(data, stale=True, fetched_at=entry['fetched_at'])
+        return data
+
+    def _needs_refresh(self, kind: str, entry: Dict, now: float, ratio: float = 1.0) -> bool:
+        """Đạt ratio * tuổi tối đa và không vừa thử lại (tránh dội API đang lỗi)"""
+        return (now - entry['fetched_at'] >= self._max_age(kind, entry['data']) * ratio
+                and now - entry['attempted_at'] >= CACHE_CONFIG["TTL"]["realtime_error"])
+
+    def _get(self, kind: str, key, args: Tuple) -> Dict:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is not None:
+                entry['last_used'] = now
+                # Đã có entry -> trả luôn (quá hạn thì kèm cờ stale), làm mới để nền lo
+                if self._needs_refresh(kind, entry, now):
+                    self._schedule_refresh(kind, key, args)
+                return self._view(kind, entry, now)
+
+        # Cold miss: chưa có gì để trả -> phải chờ (CacheLayer của worker khác hoặc API)
+        self._load(kind, key, args)
+        self._ensure_worker()
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            return self._view(kind, entry, time.time()) if entry else {"success": False, "error": "unavailable"}
+
+    @staticmethod
+    def _cache_key(kind: str, key) -> str:
+        # Namespace riêng: giá trị là {'data', 'fetched_at'} (khác định dạng data trần trước đây)
+        return cache_key("realtime_record", kind, key)
+
+    def _key_lock(self, ckey: str) -> threading.Lock:
+        with self._lock:
+            return self._fetch_locks.setdefault(ckey, threading.Lock())
+
+    def _load(self, kind: str, key, args: Tuple, ratio: float = 1.0) -> Dict:
+        """
+        Bản trong CacheLayer còn mới (tuổi < ratio * tuổi tối đa, worker khác vừa lấy) -> dùng luôn;
+        ngược lại gọi API (mỗi key 1 thread, thread khác chờ rồi dùng kết quả) và ghi CacheLayer.
+        """
+        ckey = self._cache_key(kind, key)
+        with self._key_lock(ckey):
+            shared = cache_get(ckey)
+            if self._is_fresh(kind, shared, time.time(), ratio):
+                record = shared
+            else:
+                record = self._fetch_record(kind, args)
+                # Lỗi không đè bản tốt (còn TTL) của worker khác trong CacheLayer
+                if record['data'].get("success") or not (shared and shared['data'].get("success")):
+                    cache_set(ckey, record, self._ttl(kind, record['data']))
+            self._store(kind, key, args, record)
+        return record
+
+    def refresh(self, kind: str, key, args: Tuple) -> Dict:
+        """Làm mới 1 entry (thread nền); bỏ qua API nếu worker khác vừa làm mới"""
+        return self._load(kind, key, args, REALTIME_CONFIG["REFRESH_AHEAD_RATIO"])['data']
+
+    def _schedule_refresh(self, kind: str, key, args: Tuple):
+        """Xếp lịch làm mới nền (gọi khi đang giữ self._lock); entry đang chờ làm mới thì bỏ qua"""
+        if (kind, key) in self._refreshing:
+            return
+        self._refreshing.add((kind, key))
+        self._refresher.submit(self._run_refresh, kind, key, args)
+
+    def _run_refresh(self, kind: str, key, args: Tuple):
+        try:
+            self.refresh(kind, key, args)
+        except Exception as e:
+            logger.error(f"Realtime refresh error ({kind}:{key}): {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard((kind, key))
+
+    # ==================== READ API ====================
+
+    def get_weather(self, city: Optional[str] = None) -> Dict:
+        city = city or REALTIME_CONFIG["DEFAULT_CITY"]
+        return self._get('weather', city, (city,))
+
+    def get_traffic(self, lat: Optional[float] = None, lon: Optional[float] = None) -> Dict:
+        if lat is None or lon is None:
+            lat, lon = REALTIME_CONFIG["DEFAULT_LAT"], REALTIME_CONFIG["DEFAULT_LON"]
+        cell = area_cell(lat, lon)
+        return self._get('traffic', cell, cell)
+
+    def get_snapshot(self, city: Optional[str] = None, lat: Optional[float] = None,
+                     lon: Optional[float] = None) -> Dict:
+        """
+        Giống real_times.build_realtime_snapshot nhưng đọc từ cache.
+        Cold miss: gọi 2 nguồn song song với hạn chót chung; nguồn trễ vẫn chạy nốt
+        trong nền và được ghi vào cache cho lần sau.
+        """
+        city = city or REALTIME_CONFIG["DEFAULT_CITY"]
+        if lat is None or lon is None:
+            lat, lon = REALTIME_CONFIG["DEFAULT_LAT"], REALTIME_CONFIG["DEFAULT_LON"]
+
+        with self._lock:
+            cached = all(
+                (kind, key) in self._entries
+                for kind, key in (('weather', city), ('traffic', area_cell(lat, lon)))
+            )
+        if cached:
+            return real_times.compose_realtime_snapshot(self.get_weather(city), self.get_traffic(lat, lon))
+
+        results = real_times.run_with_deadline({
+            "weather": lambda: self.get_weather(city),
+            "traffic": lambda: self.get_traffic(lat, lon),
+        })
+        return real_times.compose_realtime_snapshot(results["weather"], results["traffic"])
+
+    # ==================== BACKGROUND REFRESH ====================
+
+    def _ensure_worker(self):
+        if self._worker is not None or not REALTIME_CONFIG["AUTO_REFRESH"]:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._refresh_worker, daemon=True)
+                self._worker.start()
+                logger.info("✅ Realtime refresh worker started")
+
+    def _refresh_worker(self):
+        while True:
+            time.sleep(REALTIME_CONFIG["TICK_SECONDS"])
+            try:
+                self._refresh_due()
+            except Exception as e:
+                logger.error(f"Realtime refresh error: {e}")
+
+    def _refresh_due(self):
+        now = time.time()
+        with self._lock:
+            # Bỏ ô lâu không ai dùng, còn lại ô nào sắp hết hạn thì làm mới trước
+            for k in [k for k, e in self._entries.items() if now - e['last_used'] > REALTIME_CONFIG["CELL_IDLE_SECONDS"]]:
+                self._forget(k)
+            due = [(kind, key, e['args']) for (kind, key), e in self._entries.items()
+                   if self._needs_refresh(kind, e, now, REALTIME_CONFIG["REFRESH_AHEAD_RATIO"])]
+            for kind, key, args in due:
+                self._schedule_refresh(kind, key, args)
+
+        if due:
+            logger.info(f"🔄 Realtime refresh scheduled for {len(due)} entries")
+
+    def get_stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            return {
+                f"{kind}:{key}": {
+                    "age_seconds": round(now - e['fetched_at'], 1),
+                    "last_attempt_seconds": round(now - e['attempted_at'], 1),
+                    "success": bool(e['data'].get("success")),
+                    "stale": now - e['fetched_at'] >= self._max_age(kind, e['data']),
+                }
+                for (kind, key), e in self._entries.items()
+            }
+
+
+# ==================== GLOBAL INSTANCE ====================
+
+realtime_context = RealtimeContextService()
+
+
+def get_realtime_snapshot(city=None, lat=None, lon=None) -> Dict:
+    return realtime_context.get_snapshot(city, lat, lon)
+
+
+def get_realtime_weather(city=None) -> Dict:
+    return realtime_context.get_weather(city)
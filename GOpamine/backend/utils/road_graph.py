@@ -0,0 +1,481 @@
+"""
+ROAD GRAPH - Đồ thị đường phố TP.HCM dạng CSR lưu trên đĩa (memory-mapped)
+Features:
+  - Mảng .npy mở bằng mmap_mode='r' -> load tức thì, nhiều worker dùng chung page cache
+  - Snap tọa độ vào node gần nhất (cKDTree nếu có scipy, fallback NumPy); có profile thì chỉ snap
+    vào node phương tiện đó đi được (ô tô không snap vào lối đi bộ)
+  - Trọng số riêng cho từng phương tiện: car / moto / bike / walk
+  - A* theo thời gian di chuyển; heuristic = max(đường chim bay / tốc độ tối đa, ALT)
+  - ALT: khoảng cách tới/từ các landmark + bất đẳng thức tam giác -> cận dưới chặt hơn nhiều
+  - Dijkstra 1 nguồn -> nhiều đích cho ma trận khoảng cách
+  - Geometry chi tiết từng cạnh (điểm uốn) để đường vẽ giống OSRM
+
+File build bằng backend/build_road_graph.py (osmnx).
+"""
+
+import os
+import json
+import math
+import heapq
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from scipy.spatial import cKDTree
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+from backend.utils.config import ROUTING_CONFIG
+
+logger = logging.getLogger('road_graph')
+
+# Mảng của đồ thị (mỗi mảng 1 file <name>.npy)
+#   node_lat, node_lon           : tọa độ node (float64)
+#   indptr (n+1), indices (m)    : CSR cạnh đi ra của mỗi node
+#   length_m, speed_kph (m)      : chiều dài & tốc độ ước lượng của cạnh
+#   road_class (m)               : index trong HIGHWAY_CLASSES
+#   flags (m)                    : FLAG_REVERSE_ONLY = cạnh ngược chiều đường 1 chiều (chỉ đi bộ)
+#   geom_indptr (m+1), geom_lat, geom_lon : điểm uốn bên trong mỗi cạnh
+GRAPH_ARRAYS = (
+    'node_lat', 'node_lon', 'indptr', 'indices', 'length_m', 'speed_kph',
+    'road_class', 'flags', 'geom_indptr', 'geom_lat', 'geom_lon',
+)
+
+HIGHWAY_CLASSES = [
+    'motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'unclassified',
+    'residential', 'living_street', 'service', 'track', 'path', 'footway',
+    'pedestrian', 'cycleway', 'steps', 'other',
+]
+FLAG_REVERSE_ONLY = 1
+
+# Loại đường xe cơ giới không được đi / người đi bộ không được đi
+NO_MOTOR_CLASSES = ('path', 'footway', 'pedestrian', 'cycleway', 'steps')
+NO_FOOT_CLASSES = ('motorway', 'trunk')
+
+# Profile -> tốc độ trần (km/h, None = theo dữ liệu), tốc độ cố định, loại đường cấm, cho phép cạnh ngược chiều
+#   moto: không được vào cao tốc (motorway), chạy chậm hơn ô tô trên đường lớn
+PROFILE_RULES = {
+    'car': {'cap': None, 'fixed': None, 'banned': NO_MOTOR_CLASSES, 'reverse': False},
+    'moto': {'cap': 45.0, 'fixed': None, 'banned': NO_MOTOR_CLASSES + ('motorway',), 'reverse': False},
+    'bike': {'cap': None, 'fixed': 15.0, 'banned': ('motorway', 'trunk', 'footway', 'steps'), 'reverse': False},
+    'walk': {'cap': None, 'fixed': 5.0, 'banned': NO_FOOT_CLASSES, 'reverse': True},
+}
+GRAPH_PROFILES = tuple(PROFILE_RULES)
+
+# Tên profile OSRM -> profile đồ thị
+PROFILE_ALIASES = {
+    'driving': 'car',
+    'car': 'car',
+    'moto': 'moto',
+    'motorbike': 'moto',
+    'bike': 'bike',
+    'cycling': 'bike',
+    'foot': 'walk',
+    'walking': 'walk',
+    'walk': 'walk',
+}
+
+
+def resolve_profile(profile: str) -> str:
+    return PROFILE_ALIASES.get(str(profile or '').lower(), 'car')
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> float:
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 6371000.0 * 2 * math.asin(math.sqrt(min(1.0, a)))
+
+
+class RoadGraph:
+    """Đồ thị CSR (chỉ đọc) + truy vấn A* / Dijkstra"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        for name in GRAPH_ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+
+        self.n_nodes = len(self.node_lat)
+        self.n_edges = len(self.indices)
+        self._weights: Dict[str, 'np.ndarray'] = {}
+        self._max_speed: Dict[str, float] = {}
+        self._landmarks: Dict[str, 'np.ndarray'] = {}
+        self._reverse = None
+        self._snap_indexes: Dict[str, Tuple] = {}
+        self._lock = threading.Lock()
+        self._build_snap_index()
+        self._load_landmarks()
+        logger.info(f"✅ Road graph loaded: {self.n_nodes} nodes, {self.n_edges} edges ({path})")
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> Optional['RoadGraph']:
+        path = path or ROUTING_CONFIG["GRAPH_PATH"]
+        if not NUMPY_AVAILABLE:
+            logger.warning("⚠️ NumPy not available, local routing disabled")
+            return None
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            logger.warning(f"⚠️ Road graph not found at {path}")
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            logger.error(f"Error loading road graph: {e}")
+            return None
+
+    # ==================== SNAP ====================
+
+    def _project(self, lat, lon):
+        """Equirectangular quanh tâm đồ thị (mét) cho KDTree"""
+        return np.column_stack((np.asarray(lat) * 110540.0, np.asarray(lon) * self._kx))
+
+    def _build_snap_index(self):
+        lat0 = float(self.meta.get('center_lat', np.mean(self.node_lat)))
+        self._kx = 111320.0 * math.cos(math.radians(lat0))
+        self._xy = self._project(self.node_lat, self.node_lon)
+        self._kdtree = cKDTree(self._xy) if SCIPY_AVAILABLE else None
+
+    def _profile_snap_index(self, profile: str):
+        """
+        (node_ids, xy, kdtree) chỉ gồm node có cả cạnh vào lẫn cạnh ra đi được với profile
+        -> điểm snap luôn xuất phát / kết thúc được
+        """
+        index = self._snap_indexes.get(profile)
+        if index is not None:
+            return index
+
+        usable = np.isfinite(self.weights(profile))
+        sources = np.repeat(np.arange(self.n_nodes), np.diff(np.asarray(self.indptr)))
+        has_out = np.zeros(self.n_nodes, dtype=bool)
+        has_in = np.zeros(self.n_nodes, dtype=bool)
+        has_out[sources[usable]] = True
+        has_in[np.asarray(self.indices)[usable]] = True
+        node_ids = np.flatnonzero(has_out & has_in)
+
+        xy = self._xy[node_ids]
+        index = (node_ids, xy, cKDTree(xy) if SCIPY_AVAILABLE and len(node_ids) else None)
+        with self._lock:
+            self._snap_indexes[profile] = index
+        return index
+
+    def nearest_node(self, lat: float, lon: float, profile: Optional[str] = None) -> Tuple[int, float]:
+        """(node gần nhất, khoảng cách mét); profile -> chỉ xét node profile đó đi được"""
+        q = self._project([lat], [lon])[0]
+        if profile is None:
+            node_ids, xy, kdtree = None, self._xy, self._kdtree
+        else:
+            node_ids, xy, kdtree = self._profile_snap_index(resolve_profile(profile))
+            if not len(node_ids):
+                return -1, math.inf
+
+        if kdtree is not None:
+            dist, idx = kdtree.query(q)
+        else:
+            d2 = ((xy - q) ** 2).sum(axis=1)
+            idx = int(np.argmin(d2))
+            dist = math.sqrt(d2[idx])
+        node = int(idx) if node_ids is None else int(node_ids[idx])
+        return node, float(dist)
+
+    # ==================== TRỌNG SỐ THEO PROFILE ====================
+
+    def weights(self, profile: str) -> 'np.ndarray':
+        """Thời gian đi qua mỗi cạnh (giây) cho profile; inf = không được đi cạnh đó"""
+        profile = resolve_profile(profile)
+        w = self._weights.get(profile)
+        if w is not None:
+            return w
+
+        with self._lock:
+            w = self._weights.get(profile)
+            if w is not None:
+                return w
+
+            rule = PROFILE_RULES[profile]
+            speed = np.asarray(self.speed_kph, dtype=np.float64)
+            if rule['fixed'] is not None:
+                speed = np.full_like(speed, rule['fixed'])
+            elif rule['cap'] is not None:
+                speed = np.minimum(speed, rule['cap'])
+            speed = np.maximum(speed, 1.0)
+
+            w = np.asarray(self.length_m, dtype=np.float64) / (speed / 3.6)
+            banned_codes = [HIGHWAY_CLASSES.index(c) for c in rule['banned']]
+            mask = np.isin(np.asarray(self.road_class), banned_codes)
+            if not rule['reverse']:
+                mask |= (np.asarray(self.flags) & FLAG_REVERSE_ONLY) != 0
+            w[mask] = np.inf
+
+            allowed_speed = speed[~mask]
+            self._max_speed[profile] = float(allowed_speed.max()) / 3.6 if len(allowed_speed) else 1.0
+            self._weights[profile] = w
+            return w
+
+    def _reverse_csr(self):
+        """CSR của đồ thị đảo chiều: (indptr, indices, edge_id gốc)"""
+        if self._reverse is None:
+            with self._lock:
+                if self._reverse is None:
+                    indices = np.asarray(self.indices)
+                    sources = np.repeat(np.arange(self.n_nodes), np.diff(np.asarray(self.indptr)))
+                    order = np.argsort(indices, kind='stable')
+                    indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+                    np.cumsum(np.bincount(indices, minlength=self.n_nodes), out=indptr[1:])
+                    self._reverse = (indptr, sources[order], order)
+        return self._reverse
+
+    # ==================== ALT LANDMARKS ====================
+
+    def _landmark_file(self, profile: str) -> str:
+        return os.path.join(self.path, f'landmarks_{profile}.npy')
+
+    def _load_landmarks(self):
+        for profile in GRAPH_PROFILES:
+            path = self._landmark_file(profile)
+            if os.path.exists(path):
+                self._landmarks[profile] = np.load(path, mmap_mode='r')
+        if self._landmarks:
+            logger.info(f"✅ ALT landmarks: {', '.join(self._landmarks)}")
+
+    def has_landmarks(self, profile: str) -> bool:
+        return resolve_profile(profile) in self._landmarks
+
+    def _all_distances(self, sources: Sequence[int], profile: str, reverse: bool = False) -> 'np.ndarray':
+        """Khoảng cách (giây) từ mỗi nguồn tới mọi node (reverse=True: từ mọi node tới nguồn)"""
+        w = self.weights(profile)
+        if SCIPY_AVAILABLE:
+            finite = np.isfinite(w)
+            rows = np.repeat(np.arange(self.n_nodes), np.diff(np.asarray(self.indptr)))
+            graph = csr_matrix(
+                (w[finite], (rows[finite], np.asarray(self.indices)[finite])),
+                shape=(self.n_nodes, self.n_nodes)
+            )
+            if reverse:
+                graph = graph.T.tocsr()
+            return csgraph_dijkstra(graph, directed=True, indices=list(sources))
+
+        if reverse:
+            indptr, indices, edge_ids = self._reverse_csr()
+            w = w[edge_ids]
+        else:
+            indptr, indices = np.asarray(self.indptr), np.asarray(self.indices)
+
+        result = np.full((len(sources), self.n_nodes), np.inf)
+        for row, src in enumerate(sources):
+            dist = result[row]
+            dist[src] = 0.0
+            heap = [(0.0, src)]
+            while heap:
+                du, u = heapq.heappop(heap)
+                if du > dist[u]:
+                    continue
+                a, b = int(indptr[u]), int(indptr[u + 1])
+                for v, we in zip(indices[a:b].tolist(), w[a:b].tolist()):
+                    nd = du + we
+                    if nd < dist[v]:
+                        dist[v] = nd
+                        heapq.heappush(heap, (nd, v))
+        return result
+
+    def build_landmarks(self, profile: str, count: int = None) -> 'np.ndarray':
+        """
+        Chọn landmark kiểu "xa nhất" (farthest selection) rồi tính trước khoảng cách.
+        Output: mảng (n_nodes, 2*count) float32: [d(L_i, v)..., d(v, L_i)...]
+        """
+        profile = resolve_profile(profile)
+        count = count or ROUTING_CONFIG["ALT_LANDMARKS"]
+
+        # Node gần tâm đồ thị làm gốc, landmark đầu = node xa gốc nhất
+        center, _ = self.nearest_node(float(self.meta.get('center_lat', np.mean(self.node_lat))),
+                                      float(self.meta.get('center_lon', np.mean(self.node_lon))))
+        forward_rows = []
+        landmarks = []
+        min_dist = self._all_distances([center], profile)[0]
+
+        for _ in range(count):
+            candidates = np.where(np.isfinite(min_dist), min_dist, -1.0)
+            if landmarks:
+                candidates[landmarks] = -1.0
+            node = int(np.argmax(candidates))
+            if candidates[node] <= 0:
+                break
+            landmarks.append(node)
+            row = self._all_distances([node], profile)[0]
+            forward_rows.append(row)
+            min_dist = row if len(landmarks) == 1 else np.minimum(min_dist, row)
+
+        backward = self._all_distances(landmarks, profile, reverse=True)
+        table = np.vstack(forward_rows + list(backward)).T.astype(np.float32)
+        logger.info(f"✅ Built {len(landmarks)} landmarks for '{profile}'")
+        return table
+
+    def save_landmarks(self, profile: str, table: 'np.ndarray'):
+        profile = resolve_profile(profile)
+        np.save(self._landmark_file(profile), table)
+        self._landmarks[profile] = np.load(self._landmark_file(profile), mmap_mode='r')
+
+    def _alt_heuristic(self, profile: str, dst: int):
+        """h(v) = max_i max(d(L_i,t) - d(L_i,v), d(v,L_i) - d(t,L_i)) (bất đẳng thức tam giác)"""
+        table = self._landmarks.get(profile)
+        if table is None:
+            return None
+        k = table.shape[1] // 2
+        target = table[dst].tolist()
+        fwd_t, bwd_t = target[:k], target[k:]
+
+        def h(v):
+            row = table[v].tolist()
+            best = 0.0
+            for i in range(k):
+                a = fwd_t[i] - row[i]
+                b = row[k + i] - bwd_t[i]
+                if a > best:
+                    best = a
+                if b > best:
+                    best = b
+            # inf - inf = nan -> so sánh False, bỏ qua; float32 -> trừ hao chút cho chắc admissible
+            return best * 0.9999
+        return h
+
+    # ==================== TÌM ĐƯỜNG ====================
+
+    def shortest_path(self, src: int, dst: int, profile: str = 'car', use_landmarks: bool = True) -> Optional[Dict]:
+        """
+        A* từ src -> dst theo thời gian.
+        Output: {'nodes': [...], 'edges': [...], 'duration': s, 'distance': m, 'settled': số node đã chốt}
+                hoặc None nếu không có đường
+        """
+        profile = resolve_profile(profile)
+        if src == dst:
+            return {'nodes': [src], 'edges': [], 'duration': 0.0, 'distance': 0.0, 'settled': 0}
+
+        w = self.weights(profile)
+        inv_speed = 1.0 / self._max_speed[profile]
+        indptr, indices = self.indptr, self.indices
+        lat_t, lon_t = float(self.node_lat[dst]), float(self.node_lon[dst])
+        alt = self._alt_heuristic(profile, dst) if use_landmarks else None
+
+        def h(v):
+            geo = haversine_m(float(self.node_lat[v]), float(self.node_lon[v]), lat_t, lon_t) * inv_speed
+            if alt is None:
+                return geo
+            lower = alt(v)
+            return lower if lower > geo else geo
+
+        g = {src: 0.0}
+        parent = {src: (-1, -1)}
+        heap = [(h(src), 0.0, src)]
+        closed = set()
+
+        while heap:
+            _, gu, u = heapq.heappop(heap)
+            if u == dst:
+                break
+            if u in closed:
+                continue
+            closed.add(u)
+
+            a, b = int(indptr[u]), int(indptr[u + 1])
+            for e, v, we in zip(range(a, b), indices[a:b].tolist(), w[a:b].tolist()):
+                if we == math.inf or v in closed:
+                    continue
+                ng = gu + we
+                if ng < g.get(v, math.inf):
+                    g[v] = ng
+                    parent[v] = (u, e)
+                    heapq.heappush(heap, (ng + h(v), ng, v))
+        else:
+            return None
+
+        nodes, edges = [dst], []
+        node = dst
+        while parent[node][0] != -1:
+            prev, e = parent[node]
+            edges.append(e)
+            nodes.append(prev)
+            node = prev
+        nodes.reverse()
+        edges.reverse()
+
+        return {
+            'nodes': nodes,
+            'edges': edges,
+            'duration': g[dst],
+            'distance': float(np.asarray(self.length_m)[edges].sum()) if edges else 0.0,
+            'settled': len(closed),
+        }
+
+    def one_to_many(self, src: int, targets: Sequence[int], profile: str = 'car') -> Tuple[List[float], List[float]]:
+        """
+        Dijkstra từ src, dừng khi đã chốt hết targets.
+        Output: (durations s, distances m) theo thứ tự targets (inf = không tới được)
+        """
+        w = self.weights(profile)
+        length = self.length_m
+        indptr, indices = self.indptr, self.indices
+
+        remaining = set(targets)
+        g = {src: 0.0}
+        dist = {src: 0.0}
+        heap = [(0.0, src)]
+        closed = set()
+
+        while heap and remaining:
+            gu, u = heapq.heappop(heap)
+            if u in closed:
+                continue
+            closed.add(u)
+            remaining.discard(u)
+
+            a, b = int(indptr[u]), int(indptr[u + 1])
+            for v, we, le in zip(indices[a:b].tolist(), w[a:b].tolist(), length[a:b].tolist()):
+                if we == math.inf or v in closed:
+                    continue
+                ng = gu + we
+                if ng < g.get(v, math.inf):
+                    g[v] = ng
+                    dist[v] = dist[u] + le
+                    heapq.heappush(heap, (ng, v))
+
+        return (
+            [g.get(t, math.inf) if t in closed else math.inf for t in targets],
+            [dist.get(t, math.inf) if t in closed else math.inf for t in targets],
+        )
+
+    def path_coordinates(self, nodes: List[int], edges: List[int]) -> List[List[float]]:
+        """[[lon, lat], ...] theo đường đi, gồm cả điểm uốn của từng cạnh"""
+        coords = [[float(self.node_lon[nodes[0]]), float(self.node_lat[nodes[0]])]]
+        for e, v in zip(edges, nodes[1:]):
+            a, b = int(self.geom_indptr[e]), int(self.geom_indptr[e + 1])
+            if b > a:
+                coords.extend([lon, lat] for lat, lon in zip(self.geom_lat[a:b].tolist(), self.geom_lon[a:b].tolist()))
+            coords.append([float(self.node_lon[v]), float(self.node_lat[v])])
+        return coords
+
+
+_graph = None
+_graph_loaded = False
+_graph_lock = threading.Lock()
+
+
+def get_road_graph() -> Optional[RoadGraph]:
+    """Đồ thị dùng chung (load 1 lần, lười)"""
+    global _graph, _graph_loaded
+    if not _graph_loaded:
+        with _graph_lock:
+            if not _graph_loaded:
+                _graph = RoadGraph.load()
+                _graph_loaded = True
+    return _graph
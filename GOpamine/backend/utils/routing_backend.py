@@ -0,0 +1,230 @@
+"""
+ROUTING BACKEND - Lớp trừu tượng cho engine tìm đường bằng đường bộ
+Features:
+  - OSRMBackend : gọi server OSRM qua HTTP (mặc định, như trước)
+  - LocalGraphBackend : tìm đường ngay trong process trên đồ thị memmap (road_graph.py)
+  - Cùng 1 hợp đồng: trả JSON giống OSRM (/route: code, routes[geometry, distance, duration, legs],
+    /table: code, distances, durations) -> code gọi không cần biết backend nào
+  - Chọn backend qua env ROUTING_BACKEND=osrm|local (local tự fallback OSRM nếu thiếu đồ thị)
+"""
+
+import time
+import math
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from backend.utils.config import API_CONFIG, ROUTING_CONFIG
+from backend.utils.geometry import encode_polyline, lonlat_to_latlng
+from backend.utils.http_client import http_get
+
+logger = logging.getLogger('routing_backend')
+
+OSRM_ROUTE_BASE = "http://router.project-osrm.org/route/v1"
+OSRM_TABLE_BASE = "http://router.project-osrm.org/table/v1"
+
+
+def negative(error: str) -> Dict:
+    """Kết quả lỗi chuẩn của backend (được cache ngắn ở osrm_client)"""
+    return {'_negative': True, 'error': error}
+
+
+def _coord_str(lon, lat) -> str:
+    precision = API_CONFIG["OSRM_KEY_PRECISION"]
+    return f"{round(float(lon), precision)},{round(float(lat), precision)}"
+
+
+class RoutingBackend(ABC):
+    """
+    Interface chung. points: [(lon, lat), ...]
+      - route(): JSON OSRM /route hoặc negative(error)
+      - table(): JSON OSRM /table (mét, giây; null = không tới được) hoặc negative(error)
+    Backend thiếu 1 trong 2 hàm -> lỗi ngay lúc khởi tạo (TypeError), không đợi request đầu tiên
+    """
+    name = 'base'
+
+    @abstractmethod
+    def route(self, points: Sequence[Tuple[float, float]], profile: str = 'driving',
+              params: Optional[Dict] = None, timeout: float = 10, retries: int = 1) -> Dict:
+        ...
+
+    @abstractmethod
+    def table(self, points: Sequence[Tuple[float, float]], profile: str = 'driving',
+              timeout: float = 10, retries: int = 1) -> Dict:
+        ...
+
+
+# ==================== OSRM (HTTP) ====================
+
+class OSRMBackend(RoutingBackend):
+    name = 'osrm'
+
+    def __init__(self, route_base: str = OSRM_ROUTE_BASE, table_base: str = OSRM_TABLE_BASE):
+        self.route_base = route_base
+        self.table_base = table_base
+
+    def _get(self, url: str, params: Dict, timeout: float, retries: int, required_key: str) -> Dict:
+        """Gọi OSRM có retry + backoff"""
+        error = 'unavailable'
+        for attempt in range(max(1, retries)):
+            try:
+                resp = http_get(url, params=params, timeout=timeout)
+                if resp.status_code == 200:
+                    data = resp.json()
+                    if data.get('code') == 'Ok' and data.get(required_key):
+                        return data
+                    # NoRoute / InvalidInput...: hỏi lại cũng ra kết quả đó
+                    return negative(data.get('code') or 'NoRoute')
+                error = f"http_{resp.status_code}"
+                if resp.status_code < 500 and resp.status_code != 429:
+                    break
+            except requests.exceptions.Timeout:
+                error = 'timeout'
+            except requests.exceptions.RequestException as e:
+                error = 'unavailable'
+                logger.warning(f"⚠️ OSRM request error: {e}")
+
+            if attempt < retries - 1:
+                time.sleep(0.5 * (2 ** attempt))
+
+        return negative(error)
+
+    def route(self, points, profile='driving', params=None, timeout=10, retries=1):
+        coords = ";".join(_coord_str(lon, lat) for lon, lat in points)
+        return self._get(f"{self.route_base}/{profile}/{coords}", dict(params or {}), timeout, retries, 'routes')
+
+    def table(self, points, profile='driving', timeout=10, retries=1):
+        coords = ";".join(_coord_str(lon, lat) for lon, lat in points)
+        params = {'annotations': 'distance,duration'}
+        return self._get(f"{self.table_base}/{profile}/{coords}", params, timeout, retries, 'distances')
+
+
+# ==================== LOCAL GRAPH ====================
+
+class LocalGraphBackend(RoutingBackend):
+    """
+    Tìm đường trong process trên đồ thị memmap (A*).
+    Thiếu đồ thị / điểm nằm quá xa mạng đường / đồ thị không có đường giữa các điểm
+    -> chuyển sang fallback (OSRM), không trả NoRoute (bị cache âm) vì đồ thị có thể thiếu cạnh.
+    """
+    name = 'local'
+
+    def __init__(self, graph=None, fallback: Optional[RoutingBackend] = None):
+        if graph is None:
+            from backend.utils.road_graph import get_road_graph
+            graph = get_road_graph()
+        self.graph = graph
+        self.fallback = fallback
+
+    def _snap(self, points, profile: str) -> Optional[List[Tuple[int, float]]]:
+        snapped = []
+        for lon, lat in points:
+            node, dist_m = self.graph.nearest_node(float(lat), float(lon), profile)
+            if dist_m > ROUTING_CONFIG["MAX_SNAP_DISTANCE_M"]:
+                return None
+            snapped.append((node, dist_m))
+        return snapped
+
+    def _fallback(self, method: str, *args, **kwargs) -> Dict:
+        if self.fallback is None:
+            return negative('NoSegment')
+        return getattr(self.fallback, method)(*args, **kwargs)
+
+    def route(self, points, profile='driving', params=None, timeout=10, retries=1):
+        if self.graph is None:
+            return self._fallback('route', points, profile, params, timeout, retries)
+
+        params = params or {}
+        snapped = self._snap(points, profile)
+        if snapped is None:
+            return self._fallback('route', points, profile, params, timeout, retries)
+
+        legs, geometry = [], []
+        total_distance = total_duration = 0.0
+        want_steps = str(params.get('steps', 'false')).lower() == 'true'
+
+        for (src, _), (dst, _) in zip(snapped, snapped[1:]):
+            path = self.graph.shortest_path(src, dst, profile)
+            if path is None:
+                return self._fallback('route', points, profile, params, timeout, retries)
+
+            leg_coords = self.graph.path_coordinates(path['nodes'], path['edges'])
+            geometry.extend(leg_coords[1:] if geometry else leg_coords)
+            total_distance += path['distance']
+            total_duration += path['duration']
+
+            leg = {'distance': path['distance'], 'duration': path['duration'], 'summary': '', 'steps': []}
+            if want_steps:
+                # 1 step / leg (không có hướng dẫn rẽ) - đủ cho split_route_legs
+                leg['steps'] = [{
+                    'distance': path['distance'],
+                    'duration': path['duration'],
+                    'geometry': {'type': 'LineString', 'coordinates': leg_coords},
+                    'name': '',
+                    'mode': profile,
+                }]
+            legs.append(leg)
+
+        route = {
+            'distance': total_distance,
+            'duration': total_duration,
+            'weight': total_duration,
+            'weight_name': 'duration',
+            'legs': legs,
+        }
+        if params.get('overview', 'simplified') != 'false':
+            if params.get('geometries') == 'polyline':
+                route['geometry'] = encode_polyline(lonlat_to_latlng(geometry))
+            else:
+                route['geometry'] = {'type': 'LineString', 'coordinates': geometry}
+
+        waypoints = [
+            {'location': [float(self.graph.node_lon[n]), float(self.graph.node_lat[n])], 'distance': d, 'name': ''}
+            for n, d in snapped
+        ]
+        return {'code': 'Ok', 'routes': [route], 'waypoints': waypoints}
+
+    def table(self, points, profile='driving', timeout=10, retries=1):
+        if self.graph is None:
+            return self._fallback('table', points, profile, timeout, retries)
+
+        snapped = self._snap(points, profile)
+        if snapped is None:
+            return self._fallback('table', points, profile, timeout, retries)
+
+        nodes = [n for n, _ in snapped]
+        durations, distances = [], []
+        for i, src in enumerate(nodes):
+            dur, dist = self.graph.one_to_many(src, nodes, profile)
+            if any(not math.isfinite(v) for j, v in enumerate(dur) if j != i):
+                return self._fallback('table', points, profile, timeout, retries)
+            durations.append([v if math.isfinite(v) else None for v in dur])
+            distances.append([v if math.isfinite(v) else None for v in dist])
+
+        return {'code': 'Ok', 'durations': durations, 'distances': distances}
+
+
+# ==================== CHỌN BACKEND ====================
+
+_backend: Optional[RoutingBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_routing_backend() -> RoutingBackend:
+    """Backend dùng chung theo ROUTING_BACKEND (osrm | local)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                osrm = OSRMBackend()
+                if ROUTING_CONFIG["BACKEND"] == 'local':
+                    _backend = LocalGraphBackend(fallback=osrm)
+                    if _backend.graph is None:
+                        logger.warning("⚠️ ROUTING_BACKEND=local nhưng chưa có đồ thị -> dùng OSRM")
+                else:
+                    _backend = osrm
+                logger.info(f"✅ Routing backend: {_backend.name}")
+    return _backend
@@ -0,0 +1,302 @@
+"""
+SESSION STORE - Lưu session chat (bot, lịch sử, form) có giới hạn và hết hạn
+Features:
+  - MemorySessionStore: LRU trong process, hết hạn khi không hoạt động (IDLE_TTL),
+    vượt MAX_SESSIONS thì bỏ session ít dùng nhất, lịch sử giữ tối đa HISTORY_LIMIT lượt
+  - RedisSessionStore: lịch sử + form lưu Redis (sống qua restart, dùng chung giữa worker);
+    version do Redis cấp, lịch sử ghi thêm bằng RPUSH + LTRIM -> 2 worker ghi cùng lúc không mất lượt;
+    bot Gemini không serialize được -> giữ LRU trong process, worker khác thì dựng lại từ lịch sử
+  - Chọn qua env CHAT_SESSION_BACKEND=memory|redis (Redis lỗi -> tự về memory)
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+from backend.utils.config import CHAT_SESSION_CONFIG
+
+logger = logging.getLogger('session_store')
+
+
+class MemorySessionStore:
+    """
+    session = {"bot", "history", "form_data", "session_started", "version"}
+    OrderedDict theo thứ tự dùng gần nhất -> evict từ đầu.
+    """
+
+    def __init__(self, bot_factory: Callable, max_sessions: int = None,
+                 idle_ttl: int = None, history_limit: int = None):
+        self.bot_factory = bot_factory
+        self.max_sessions = max_sessions or CHAT_SESSION_CONFIG["MAX_SESSIONS"]
+        self.idle_ttl = idle_ttl or CHAT_SESSION_CONFIG["IDLE_TTL"]
+        self.history_limit = history_limit or CHAT_SESSION_CONFIG["HISTORY_LIMIT"]
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def _new_session(self, history=None, form_data=None, version=0) -> Dict:
+        return {
+            "bot": self.bot_factory(),
+            "history": list(history or []),
+            "form_data": form_data,
+            # Có lịch sử cũ -> bot phải được dựng lại (start_session) trước lượt chat kế
+            "session_started": False,
+            "version": version,
+        }
+
+    # ==================== LRU NỘI BỘ ====================
+
+    def _local_get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.time() - self._last_used[session_id] > self.idle_ttl:
+                self._local_delete(session_id)
+                return None
+            self._sessions.move_to_end(session_id)
+            self._last_used[session_id] = time.time()
+            return session
+
+    def _local_put(self, session_id: str, session: Dict):
+        with self._lock:
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            self._last_used[session_id] = time.time()
+            while len(self._sessions) > self.max_sessions:
+                oldest, _ = self._sessions.popitem(last=False)
+                self._last_used.pop(oldest, None)
+
+    def _local_delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._last_used.pop(session_id, None)
+
+    def purge_expired(self) -> int:
+        """Xóa session quá IDLE_TTL (LRU -> dừng ở session đầu tiên còn hạn)"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for session_id in list(self._sessions):
+                if now - self._last_used[session_id] <= self.idle_ttl:
+                    break
+                self._local_delete(session_id)
+                removed += 1
+        return removed
+
+    # ==================== API ====================
+
+    def create(self, session_id: str) -> Dict:
+        session = self._new_session()
+        self._local_put(session_id, session)
+        self.save(session_id, session)
+        return session
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        self.purge_expired()
+        return self._local_get(session_id)
+
+    def get_or_create(self, session_id: str) -> Dict:
+        return self.get(session_id) or self.create(session_id)
+
+    def save(self, session_id: str, session: Dict):
+        """Ghi lại sau khi đổi history/form_data (memory: object dùng chung nên chỉ cần tăng version)"""
+        session["version"] = session.get("version", 0) + 1
+
+    def append_turn(self, session_id: str, session: Dict, user_message: str, bot_message: str):
+        """Thêm 1 lượt chat, cắt lịch sử về HISTORY_LIMIT lượt gần nhất rồi lưu"""
+        session["history"].append({"user": user_message, "bot": bot_message})
+        if len(session["history"]) > self.history_limit:
+            del session["history"][:-self.history_limit]
+        self.save(session_id, session)
+
+    def clear_history(self, session_id: str, session: Dict):
+        """Xóa lịch sử chat (reset), giữ form_data"""
+        session["history"] = []
+        self.save(session_id, session)
+
+    def delete(self, session_id: str):
+        self._local_delete(session_id)
+
+    def __contains__(self, session_id) -> bool:
+        return self.get(session_id) is not None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl": self.idle_ttl,
+            }
+
+
+class RedisSessionStore(MemorySessionStore):
+    """
+    chat_session:<id>:state    hash {form_data (JSON), version}
+    chat_session:<id>:history  list JSON {"user", "bot"} (RPUSH + LTRIM, không ghi lại cả khối)
+    Cả 2 key TTL = IDLE_TTL (gia hạn mỗi lần dùng).
+
+    Version do Redis cấp (HINCRBY trong MULTI): mỗi lần ghi nhận version mới; khác version cũ + 1
+    nghĩa là worker khác vừa ghi xen vào -> bản local đã lệch, đánh dấu để lần get sau dựng lại
+    từ Redis (không mất lượt của worker nào). LRU trong process chỉ giữ bot + bản sao.
+    """
+
+    KEY_PREFIX = "chat_session:"
+
+    def __init__(self, bot_factory: Callable, redis_url: str = None, **kwargs):
+        super().__init__(bot_factory, **kwargs)
+        self.redis_client = None
+        try:
+            self.redis_client = redis.from_url(
+                redis_url or CHAT_SESSION_CONFIG["REDIS_URL"],
+                decode_responses=True,
+                socket_connect_timeout=5
+            )
+            self.redis_client.ping()
+            logger.info("✅ Chat sessions stored in Redis")
+        except Exception as e:
+            logger.warning(f"⚠️ Redis session store unavailable: {e}. Falling back to memory.")
+            self.redis_client = None
+
+    def _state_key(self, session_id: str) -> str:
+        return f"{self.KEY_PREFIX}{session_id}:state"
+
+    def _history_key(self, session_id: str) -> str:
+        return f"{self.KEY_PREFIX}{session_id}:history"
+
+    def _commit(self, session_id: str, session: Dict, write: Callable, check: bool = True):
+        """
+        Chạy write(pipe) + tăng version + gia hạn TTL trong 1 MULTI.
+        Version nhận về khác mong đợi -> worker khác đã ghi xen -> bỏ bản local.
+        check=False (session vừa tạo): nhận luôn version Redis cấp.
+        """
+        state_key, history_key = self._state_key(session_id), self._history_key(session_id)
+        expected = session.get("version")
+        try:
+            pipe = self.redis_client.pipeline(transaction=True)
+            write(pipe)
+            pipe.hincrby(state_key, "version", 1)
+            pipe.expire(state_key, self.idle_ttl)
+            pipe.expire(history_key, self.idle_ttl)
+            version = pipe.execute()[-3]
+        except Exception as e:
+            logger.warning(f"Redis session save error: {e}")
+            return
+
+        if not check or (expected is not None and version == expected + 1):
+            session["version"] = version
+        else:
+            session["version"] = None
+            self._local_delete(session_id)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        if self.redis_client is None:
+            return super().get(session_id)
+
+        state_key, history_key = self._state_key(session_id), self._history_key(session_id)
+        try:
+            version = self.redis_client.hget(state_key, "version")
+            if version is None:
+                self._local_delete(session_id)
+                return None
+
+            session = self._local_get(session_id)
+            if session is None or session.get("version") != int(version):
+                # Đọc state + history cùng 1 MULTI -> version khớp đúng với history đọc được
+                pipe = self.redis_client.pipeline(transaction=True)
+                pipe.hmget(state_key, "form_data", "version")
+                pipe.lrange(history_key, 0, -1)
+                (form_data, version), history = pipe.execute()
+                if version is None:
+                    self._local_delete(session_id)
+                    return None
+                session = self._new_session(
+                    [json.loads(turn) for turn in history],
+                    json.loads(form_data) if form_data else None,
+                    int(version)
+                )
+                self._local_put(session_id, session)
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.expire(state_key, self.idle_ttl)
+            pipe.expire(history_key, self.idle_ttl)
+            pipe.execute()
+            return session
+        except Exception as e:
+            logger.warning(f"Redis session get error: {e}")
+            return super().get(session_id)
+
+    def create(self, session_id: str) -> Dict:
+        if self.redis_client is None:
+            return super().create(session_id)
+
+        session = self._new_session()
+
+        def write(pipe):
+            pipe.delete(self._history_key(session_id))
+            pipe.hset(self._state_key(session_id), "form_data", json.dumps(None))
+
+        self._commit(session_id, session, write, check=False)
+        self._local_put(session_id, session)
+        return session
+
+    def save(self, session_id: str, session: Dict):
+        """Ghi form_data (history chỉ đổi qua append_turn / clear_history)"""
+        if self.redis_client is None:
+            return super().save(session_id, session)
+        self._commit(session_id, session, lambda pipe: pipe.hset(
+            self._state_key(session_id), "form_data", json.dumps(session.get("form_data"), ensure_ascii=False)
+        ))
+
+    def append_turn(self, session_id: str, session: Dict, user_message: str, bot_message: str):
+        if self.redis_client is None:
+            return super().append_turn(session_id, session, user_message, bot_message)
+
+        turn = {"user": user_message, "bot": bot_message}
+        session["history"].append(turn)
+        if len(session["history"]) > self.history_limit:
+            del session["history"][:-self.history_limit]
+
+        def write(pipe):
+            pipe.rpush(self._history_key(session_id), json.dumps(turn, ensure_ascii=False))
+            pipe.ltrim(self._history_key(session_id), -self.history_limit, -1)
+
+        self._commit(session_id, session, write)
+
+    def clear_history(self, session_id: str, session: Dict):
+        if self.redis_client is None:
+            return super().clear_history(session_id, session)
+        session["history"] = []
+        self._commit(session_id, session, lambda pipe: pipe.delete(self._history_key(session_id)))
+
+    def delete(self, session_id: str):
+        super().delete(session_id)
+        if self.redis_client is not None:
+            try:
+                self.redis_client.delete(self._state_key(session_id), self._history_key(session_id))
+            except Exception as e:
+                logger.warning(f"Redis session delete error: {e}")
+
+    def get_stats(self) -> Dict:
+        stats = super().get_stats()
+        stats["backend"] = "redis" if self.redis_client is not None else "memory"
+        return stats
+
+
+def create_session_store(bot_factory: Callable) -> MemorySessionStore:
+    """Store theo CHAT_SESSION_BACKEND (redis cần cài package redis)"""
+    if CHAT_SESSION_CONFIG["BACKEND"] == "redis":
+        if REDIS_AVAILABLE:
+            return RedisSessionStore(bot_factory)
+        logger.warning("⚠️ CHAT_SESSION_BACKEND=redis nhưng chưa cài redis -> dùng memory")
+    return MemorySessionStore(bot_factory)
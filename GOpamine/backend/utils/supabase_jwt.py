@@ -0,0 +1,124 @@
+"""
+SUPABASE JWT - Xác thực access_token Supabase ngay trong process (không gọi auth.get_user)
+Features:
+  - HS256: ký bằng SUPABASE_JWT_SECRET của project
+  - RS256/ES256 (signing key bất đối xứng): lấy khóa từ JWKS của project, giữ trong process JWKS_TTL giây
+  - Kiểm tra chữ ký, hạn (exp), audience, issuer -> trả claims (sub, email, user_metadata, ...)
+  - Không xác thực được tại chỗ (thiếu secret, JWKS lỗi, chưa cài PyJWT) -> UNAVAILABLE để caller
+    quay về gọi Supabase như cũ; token sai / hết hạn / kid không có trong JWKS -> INVALID
+    (không cần hỏi Supabase)
+"""
+
+import os
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+try:
+    import jwt
+    JWT_AVAILABLE = True
+except ImportError:
+    JWT_AVAILABLE = False
+
+from backend.utils.config import AUTH_CONFIG
+
+logger = logging.getLogger('supabase_jwt')
+
+VERIFIED = "verified"
+INVALID = "invalid"
+UNAVAILABLE = "unavailable"
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+_jwks_client = None
+_jwks_lock = threading.Lock()
+
+
+class UnknownSigningKey(Exception):
+    """kid trong header không có trong JWKS của project (kể cả sau khi refresh)"""
+
+
+def _project_url() -> str:
+    return (os.getenv("SUPABASE_URL") or "").rstrip("/")
+
+
+def _get_jwks_client():
+    """PyJWKClient dùng chung (tự cache bộ khóa); None nếu thiếu SUPABASE_URL"""
+    global _jwks_client
+    if _jwks_client is None:
+        with _jwks_lock:
+            if _jwks_client is None:
+                base_url = _project_url()
+                if not base_url:
+                    return None
+                _jwks_client = jwt.PyJWKClient(
+                    f"{base_url}/auth/v1/.well-known/jwks.json",
+                    cache_jwk_set=True,
+                    lifespan=AUTH_CONFIG["JWKS_TTL"],
+                    timeout=AUTH_CONFIG["JWKS_TIMEOUT"]
+                )
+    return _jwks_client
+
+
+def _signing_key(token: str, algorithm: str):
+    """Khóa để verify theo alg trong header; None nếu không có cách verify tại chỗ"""
+    if algorithm == "HS256":
+        return AUTH_CONFIG["JWT_SECRET"] or None
+    if algorithm in ASYMMETRIC_ALGORITHMS:
+        client = _get_jwks_client()
+        if client is None:
+            return None
+        # Không tải được JWKS (mạng / endpoint lỗi) -> exception bay lên, caller trả UNAVAILABLE
+        client.get_signing_keys()
+        kid = jwt.get_unverified_header(token).get("kid")
+        try:
+            return client.get_signing_key(kid).key
+        except jwt.exceptions.PyJWKClientConnectionError:
+            raise
+        except jwt.exceptions.PyJWKClientError as e:
+            # Bộ khóa tải được (đã refresh 1 lần) mà không có kid này -> token giả / sai project
+            raise UnknownSigningKey(str(e)) from e
+    return None
+
+
+def verify_access_token(token: str) -> Tuple[str, Optional[Dict]]:
+    """
+    Trả về (status, claims):
+      (VERIFIED, claims) | (INVALID, None) | (UNAVAILABLE, None)
+    """
+    if not JWT_AVAILABLE or not token:
+        return UNAVAILABLE, None
+
+    try:
+        algorithm = jwt.get_unverified_header(token).get("alg")
+    except jwt.InvalidTokenError:
+        return INVALID, None
+
+    try:
+        key = _signing_key(token, algorithm)
+    except UnknownSigningKey as e:
+        logger.info(f"Rejected access token: {e}")
+        return INVALID, None
+    except Exception as e:
+        # JWKS không tải được (mạng / cấu hình) -> để Supabase quyết định
+        logger.warning(f"⚠️ JWKS unavailable: {e}")
+        return UNAVAILABLE, None
+    if key is None:
+        return UNAVAILABLE, None
+
+    base_url = _project_url()
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[algorithm],
+            audience=AUTH_CONFIG["JWT_AUDIENCE"],
+            issuer=f"{base_url}/auth/v1" if base_url else None,
+            leeway=AUTH_CONFIG["JWT_LEEWAY"],
+            options={"require": ["exp", "sub"]}
+        )
+    except jwt.InvalidTokenError as e:
+        logger.info(f"Rejected access token: {e}")
+        return INVALID, None
+
+    return VERIFIED, claims
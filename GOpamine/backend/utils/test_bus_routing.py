@@ -0,0 +1,114 @@
+"""
+Test xếp hạng phương án bus (chạy: python -m pytest backend/utils/test_bus_routing.py)
+So rank_bus_options (branch & bound) với cách cũ: chấm điểm toàn bộ rồi sort + lọc.
+Dữ liệu tuyến / trạm giao nhau sinh ngẫu nhiên, không gọi Supabase.
+"""
+
+import random
+import sys
+import types
+
+# bus_routing import supabase_client (kết nối Supabase ngay lúc import) và bus_manager (tải dữ liệu
+# trạm) -> thay bằng module rỗng trước khi import để test chạy offline
+if 'backend.routes.bus_manager' not in sys.modules:
+    _supabase_stub = types.ModuleType('backend.database.supabase_client')
+    _supabase_stub.supabase = None
+    _bus_manager_stub = types.ModuleType('backend.routes.bus_manager')
+    _bus_manager_stub.find_nearby_stations = _bus_manager_stub.get_stations_by_route = None
+    _bus_manager_stub.get_transfer_stations = None
+    _bus_manager_stub.bus_data = types.SimpleNamespace(get_transfer_stations=None)
+    sys.modules.setdefault('backend.database.supabase_client', _supabase_stub)
+    sys.modules['backend.routes.bus_manager'] = _bus_manager_stub
+
+from backend.utils import bus_routing  # noqa: E402
+from backend.utils.config import BUS_SEARCH_CONFIG
+
+WEIGHT_WALK = 100.0
+WEIGHT_STOP = 0.5
+TRANSFER_PENALTY = 50.0
+
+
+def make_stop(route_id, direction, order, dist):
+    return {'StationId': f"{route_id}-{order}", 'StationName': f"Trạm {route_id}-{order}",
+            'Lat': 10.7, 'Lng': 106.7, 'RouteId': route_id, 'StationOrder': order,
+            'StationDirection': direction, 'dist': dist}
+
+
+def make_case(rng):
+    routes = [str(r) for r in range(rng.randint(3, 12))]
+    s_close, e_close = {}, {}
+    for rid in routes:
+        if rng.random() < 0.8:
+            s_close[(rid, '0')] = make_stop(rid, '0', rng.randint(0, 30), round(rng.uniform(0.05, 2.5), 3))
+        if rng.random() < 0.8:
+            e_close[(rid, '0')] = make_stop(rid, '0', rng.randint(0, 60), round(rng.uniform(0.05, 2.5), 3))
+
+    # Trạm giao nhau: Order2 có thể lớn hơn trạm xuống (dữ liệu thật cũng vậy)
+    transfers = {}
+    for a in routes:
+        for b in routes:
+            if a != b and rng.random() < 0.7:
+                transfers[(a, b)] = [{'StationName': f"Giao {a}/{b}", 'Lat': 10.7, 'Lng': 106.7,
+                                      'Order1': rng.randint(0, 60), 'Order2': rng.randint(0, 60),
+                                      'StationId': f"{a}/{b}"}]
+    return s_close, e_close, transfers
+
+
+def exhaustive_rank(s_close, e_close, limit=3):
+    """Chấm điểm mọi ứng viên, sort ổn định, lọc như bộ lọc thông minh"""
+    solutions = []
+    for key, s in s_close.items():
+        e = e_close.get(key)
+        if e and s['StationOrder'] < e['StationOrder']:
+            walk = s['dist'] + e['dist']
+            bonus = -200.0
+            if walk > 1.5: bonus = 0
+            if walk > 2.0: bonus = 200
+            stops = e['StationOrder'] - s['StationOrder']
+            solutions.append({'type': 'direct', 'score': walk * WEIGHT_WALK + stops * WEIGHT_STOP + bonus, 'walk': walk})
+
+    if not solutions or min(solutions, key=lambda x: x['score'])['walk'] >= 0.5:
+        top_s = sorted(s_close.values(), key=lambda x: x['dist'])[:BUS_SEARCH_CONFIG["TRANSFER_CANDIDATES"]]
+        top_e = sorted(e_close.values(), key=lambda x: x['dist'])[:BUS_SEARCH_CONFIG["TRANSFER_CANDIDATES"]]
+        for s in top_s:
+            for e in top_e:
+                if s['RouteId'] == e['RouteId']:
+                    continue
+                trans = bus_routing.find_transfer_point(s['RouteId'], s['StationDirection'], e['RouteId'],
+                                                        e['StationDirection'], s['StationOrder'], e['StationOrder'])
+                if not trans:
+                    continue
+                walk = s['dist'] + e['dist']
+                stops = (trans['Order1'] - s['StationOrder']) + (e['StationOrder'] - trans['Order2'])
+                score = walk * WEIGHT_WALK + stops * WEIGHT_STOP + TRANSFER_PENALTY + (500 if stops > 70 else 0)
+                solutions.append({'type': 'transfer', 'score': score, 'walk': walk})
+
+    solutions.sort(key=lambda x: x['score'])
+    picks = []
+    for sol in solutions:
+        if len(picks) >= limit:
+            break
+        if picks:
+            best = picks[0]
+            if sol['walk'] > 1.5 or sol['walk'] > best['walk'] + 0.8 or sol['score'] > best['score'] + 200:
+                continue
+        picks.append(sol)
+    return [(p['type'], round(p['score'], 6)) for p in picks]
+
+
+def test_rank_matches_exhaustive(monkeypatch):
+    rng = random.Random(2024)
+    monkeypatch.setattr(bus_routing, 'is_backbone', lambda rid, cache=None: False)
+
+    for _ in range(300):
+        s_close, e_close, transfers = make_case(rng)
+        monkeypatch.setattr(bus_routing.bus_data, 'get_transfer_stations',
+                            lambda r1, d1, r2, d2: transfers.get((r1, r2), []))
+
+        picks = bus_routing.rank_bus_options(s_close, e_close, limit=3)
+        assert [(p['type'], round(p['score'], 6)) for p in picks] == exhaustive_rank(s_close, e_close, 3)
+        # Chặng 2 không bao giờ đi ngược chiều tuyến
+        for p in picks:
+            if p['type'] == 'transfer':
+                _, e, trans = p['data']
+                assert trans['Order2'] <= e['StationOrder']
@@ -0,0 +1,55 @@
+"""
+Test solver TSP (chạy: python -m pytest backend/utils/test_tsp.py hoặc python -m backend.utils.test_tsp)
+"""
+
+import itertools
+import math
+
+from backend.utils.tsp import solve_route_order
+
+INF = math.inf
+
+
+def brute_force(matrix, start, end):
+    """Thử mọi hoán vị điểm giữa, bỏ qua thứ tự có cạnh không đi được"""
+    middle = [i for i in range(len(matrix)) if i not in (start, end)]
+    best = (None, INF)
+    for perm in itertools.permutations(middle):
+        order = [start, *perm, end]
+        cost = sum(matrix[a][b] for a, b in zip(order, order[1:]))
+        if cost < best[1]:
+            best = (order, cost)
+    return best
+
+
+def test_negative_costs_with_unreachable_pairs():
+    # Score bus âm: thứ tự 0-1-2-3 "rẻ" hơn nhiều nhưng cạnh 1->2 không đi được
+    matrix = [
+        [0, -100, -1, INF],
+        [INF, 0, INF, -1],
+        [INF, -1, 0, -100],
+        [INF, INF, INF, 0],
+    ]
+    order, cost = solve_route_order(matrix, start=0, end=3)
+    assert order == [0, 2, 1, 3]
+    assert cost == -3
+
+
+def test_negative_costs_match_brute_force():
+    matrix = [
+        [0, -5, -3, -8, -1, INF],
+        [-2, 0, -9, INF, -4, -6],
+        [-7, -1, 0, -3, INF, -2],
+        [INF, -6, -2, 0, -5, -9],
+        [-3, INF, -8, -4, 0, -1],
+        [-1, -2, -3, -4, -5, 0],
+    ]
+    order, cost = solve_route_order(matrix, start=0, end=5)
+    assert cost == brute_force(matrix, 0, 5)[1]
+    assert order[0] == 0 and order[-1] == 5
+
+
+if __name__ == "__main__":
+    test_negative_costs_with_unreachable_pairs()
+    test_negative_costs_match_brute_force()
+    print("✅ TSP tests passed")
@@ -0,0 +1,252 @@
+"""
+TSP SOLVER - Sắp xếp thứ tự điểm dừng cho hành trình nhiều điểm
+Features:
+  - Ma trận khoảng cách haversine tính 1 lần (NumPy, fallback Python)
+  - Held-Karp (quy hoạch động trên bitmask) cho lời giải CHÍNH XÁC khi ít điểm
+  - Nearest Neighbour + 2-opt + Or-opt khi nhiều điểm
+  - 3 kiểu kết thúc: tự do (open) / cố định điểm cuối / quay về điểm xuất phát
+"""
+
+import math
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from backend.utils.config import TSP_CONFIG
+
+EARTH_RADIUS_KM = 6371.0
+
+
+# ==================== MA TRẬN KHOẢNG CÁCH ====================
+
+def haversine_matrix(points: Sequence[dict]):
+    """
+    Ma trận khoảng cách đường chim bay (km) giữa các điểm {lat, lon}.
+    Trả về list[list[float]] (n x n).
+    """
+    lats = [float(p['lat']) for p in points]
+    lons = [float(p.get('lon', p.get('lng'))) for p in points]
+
+    if NUMPY_AVAILABLE:
+        lat = np.radians(np.asarray(lats))
+        lon = np.radians(np.asarray(lons))
+        dlat = lat[:, None] - lat[None, :]
+        dlon = lon[:, None] - lon[None, :]
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+        dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+        return dist.tolist()
+
+    n = len(points)
+    matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            dlat = math.radians(lats[j] - lats[i])
+            dlon = math.radians(lons[j] - lons[i])
+            a = (math.sin(dlat / 2) ** 2
+                 + math.cos(math.radians(lats[i])) * math.cos(math.radians(lats[j])) * math.sin(dlon / 2) ** 2)
+            matrix[i][j] = matrix[j][i] = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+    return matrix
+
+
+def _finite_matrix(matrix) -> List[List[float]]:
+    """
+    Thay inf/NaN (cặp không đi được) bằng 1 số rất lớn để solver vẫn chạy được.
+    Phạt tính theo độ trải (max - min) chứ không theo max: ma trận score bus có thể âm,
+    vẫn phải đảm bảo 1 cạnh phạt đắt hơn mọi lộ trình toàn cạnh đi được.
+    """
+    finite = [v for row in matrix for v in row if v is not None and math.isfinite(v)]
+    lo, hi = (min(finite), max(finite)) if finite else (0.0, 1.0)
+    big = abs(hi) + (hi - lo + 1) * (len(matrix) + 1) * 10
+    return [[float(v) if v is not None and math.isfinite(v) else big for v in row] for row in matrix]
+
+
+# ==================== HELD-KARP (CHÍNH XÁC) ====================
+
+def _held_karp(matrix, start: int, nodes: List[int], close: List[float]) -> List[int]:
+    """
+    dp[mask][j] = chi phí nhỏ nhất đi từ start, qua tập mask, kết thúc tại nodes[j].
+    close[j] = chi phí "đóng" hành trình từ nodes[j] (0 / tới điểm cuối / về start).
+    """
+    if NUMPY_AVAILABLE:
+        return _held_karp_numpy(matrix, start, nodes, close)
+
+    k = len(nodes)
+    size = 1 << k
+    dp = [[math.inf] * k for _ in range(size)]
+    parent = [[-1] * k for _ in range(size)]
+    for j in range(k):
+        dp[1 << j][j] = matrix[start][nodes[j]]
+
+    for mask in range(1, size):
+        row = dp[mask]
+        for j in range(k):
+            if not (mask >> j) & 1 or row[j] == math.inf:
+                continue
+            base = row[j]
+            for t in range(k):
+                if (mask >> t) & 1:
+                    continue
+                nxt = mask | (1 << t)
+                cost = base + matrix[nodes[j]][nodes[t]]
+                if cost < dp[nxt][t]:
+                    dp[nxt][t] = cost
+                    parent[nxt][t] = j
+
+    full = size - 1
+    last = min(range(k), key=lambda j: dp[full][j] + close[j])
+    return _rebuild(parent, full, last, nodes)
+
+
+def _held_karp_numpy(matrix, start: int, nodes: List[int], close: List[float]) -> List[int]:
+    """Held-Karp vector hóa: mỗi lớp popcount xử lý toàn bộ mask cùng lúc"""
+    k = len(nodes)
+    size = 1 << k
+    d = np.asarray(matrix, dtype=np.float64)[np.ix_(nodes, nodes)]
+
+    dp = np.full((size, k), np.inf)
+    parent = np.full((size, k), -1, dtype=np.int64)
+    for j in range(k):
+        dp[1 << j, j] = matrix[start][nodes[j]]
+
+    masks = np.arange(size)
+    popcount = np.zeros(size, dtype=np.int64)
+    for j in range(k):
+        popcount += (masks >> j) & 1
+
+    for layer in range(2, k + 1):
+        layer_masks = masks[popcount == layer]
+        for j in range(k):
+            sel = layer_masks[(layer_masks >> j) & 1 == 1]
+            prev = sel ^ (1 << j)
+            cand = dp[prev] + d[:, j]          # node trước (i) không thuộc prev -> inf
+            best = np.argmin(cand, axis=1)
+            dp[sel, j] = cand[np.arange(len(sel)), best]
+            parent[sel, j] = best
+
+    full = size - 1
+    last = int(np.argmin(dp[full] + np.asarray(close)))
+    return _rebuild(parent.tolist(), full, last, nodes)
+
+
+def _rebuild(parent, mask: int, last: int, nodes: List[int]) -> List[int]:
+    order = []
+    while last != -1:
+        order.append(nodes[last])
+        prev = parent[mask][last]
+        mask ^= 1 << last
+        last = prev
+    return order[::-1]
+
+
+# ==================== HEURISTIC (NHIỀU ĐIỂM) ====================
+
+def _path_cost(matrix, start: int, seq: List[int], close_of) -> float:
+    cost = matrix[start][seq[0]]
+    for a, b in zip(seq, seq[1:]):
+        cost += matrix[a][b]
+    return cost + close_of(seq[-1])
+
+
+def _nearest_neighbour(matrix, start: int, nodes: List[int]) -> List[int]:
+    seq, current, remaining = [], start, set(nodes)
+    while remaining:
+        nxt = min(remaining, key=lambda t: matrix[current][t])
+        seq.append(nxt)
+        remaining.remove(nxt)
+        current = nxt
+    return seq
+
+
+def _improve(matrix, start: int, seq: List[int], close_of, max_rounds: int) -> List[int]:
+    """
+    2-opt (đảo đoạn) + Or-opt (dời đoạn 1-3 điểm) tới khi không cải thiện được nữa.
+    Tính lại cả path cho mỗi bước thử -> đúng cả với ma trận bất đối xứng (OSRM).
+    """
+    best_cost = _path_cost(matrix, start, seq, close_of)
+    n = len(seq)
+
+    for _ in range(max_rounds):
+        improved = False
+
+        # 2-opt
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                cand = seq[:i] + seq[i:j + 1][::-1] + seq[j + 1:]
+                cost = _path_cost(matrix, start, cand, close_of)
+                if cost < best_cost - 1e-9:
+                    seq, best_cost, improved = cand, cost, True
+
+        # Or-opt
+        for length in (1, 2, 3):
+            for i in range(n - length + 1):
+                chunk = seq[i:i + length]
+                rest = seq[:i] + seq[i + length:]
+                for pos in range(len(rest) + 1):
+                    if pos == i:
+                        continue
+                    cand = rest[:pos] + chunk + rest[pos:]
+                    cost = _path_cost(matrix, start, cand, close_of)
+                    if cost < best_cost - 1e-9:
+                        seq, best_cost, improved = cand, cost, True
+                        break
+
+        if not improved:
+            break
+
+    return seq
+
+
+# ==================== API CHÍNH ====================
+
+def solve_route_order(matrix, start: int = 0, end: Optional[int] = None,
+                      return_to_start: bool = False, nodes: Optional[List[int]] = None) -> Tuple[List[int], float]:
+    """
+    Tìm thứ tự đi qua các điểm với tổng chi phí nhỏ nhất.
+
+    Input:
+      - matrix: ma trận chi phí n x n (km, phút, score... inf = không đi được)
+      - start: index điểm xuất phát
+      - end: index điểm kết thúc cố định (None = kết thúc tự do)
+      - return_to_start: True = quay về start (bỏ qua end)
+      - nodes: các index cần ghé (mặc định: tất cả trừ start/end)
+    Output: (order, cost)
+      - order bắt đầu bằng start, kết thúc bằng end nếu có
+        (round trip KHÔNG lặp lại start ở cuối; cost đã gồm chặng về)
+    """
+    n = len(matrix)
+    if return_to_start:
+        end = None
+    if nodes is None:
+        nodes = [i for i in range(n) if i != start and i != end]
+    nodes = list(nodes)
+
+    safe = _finite_matrix(matrix)
+
+    if return_to_start:
+        close_of = lambda j: safe[j][start]
+    elif end is not None:
+        close_of = lambda j: safe[j][end]
+    else:
+        close_of = lambda j: 0.0
+
+    if not nodes:
+        seq = []
+    elif len(nodes) <= TSP_CONFIG["HELD_KARP_MAX_STOPS"]:
+        seq = _held_karp(safe, start, nodes, [close_of(j) for j in nodes])
+    else:
+        seq = _nearest_neighbour(safe, start, nodes)
+        seq = _improve(safe, start, seq, close_of, TSP_CONFIG["LOCAL_SEARCH_ROUNDS"])
+
+    order = [start] + seq + ([end] if end is not None else [])
+
+    cost = 0.0
+    for a, b in zip(order, order[1:]):
+        cost += matrix[a][b]
+    if return_to_start and len(order) > 1:
+        cost += matrix[order[-1]][start]
+
+    return order, cost
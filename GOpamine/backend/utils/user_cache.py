@@ -0,0 +1,38 @@
+"""
+USER CACHE - Cache ngắn hạn dòng bảng `users` theo user_id (cho Flask-Login load_user)
+Features:
+  - Qua CacheLayer (memory + Redis nếu bật), TTL "user_profile" (ngắn)
+  - Single-flight: nhiều request cùng user lúc cache miss chỉ query Supabase 1 lần
+  - invalidate_user() gọi ở mọi chỗ upsert bảng users (đăng ký, guest, sync session...)
+    Memory cache của worker khác tự hết hạn sau TTL
+  - peek_user_row() / set_user_row(): đọc cache không query, ghi lại dòng vừa upsert
+    (sync session so sánh với cache để bỏ qua upsert trùng)
+"""
+
+from typing import Callable, Dict, Optional
+
+from backend.utils.cache_layer import cache_delete, cache_get, cache_key, cache_set, cache_single_flight
+from backend.utils.config import CACHE_CONFIG
+
+
+def _key(user_id) -> str:
+    return cache_key("user_profile", user_id)
+
+
+def get_user_row(user_id, fetch_func: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+    """fetch_func(): query Supabase, trả dict user hoặc None (None không được cache)"""
+    return cache_single_flight(_key(user_id), fetch_func, ttl=CACHE_CONFIG["TTL"]["user_profile"])
+
+
+def invalidate_user(user_id):
+    cache_delete(_key(user_id))
+
+
+def peek_user_row(user_id) -> Optional[Dict]:
+    """Chỉ đọc cache (không query Supabase); None nếu chưa có"""
+    return cache_get(_key(user_id))
+
+
+def set_user_row(user_id, row: Dict):
+    """Ghi dòng users vừa upsert (dữ liệu DB trả về) vào cache"""
+    cache_set(_key(user_id), row, CACHE_CONFIG["TTL"]["user_profile"])
@@ -238,15 +238,14 @@ async function sendMessageToBackend(message, allowRetry = true) {
     chatContainer.scrollTop = chatContainer.scrollHeight;
     
     try {
-        const response = await fetch('http://localhost:5000/api/chat', {
+        const response = await fetch('http://localhost:5000/api/chat/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ session_id: sessionId, message: message })
         });
         
-        typingIndicator.remove();
-        
         if (!response.ok) {
+            typingIndicator.remove();
             let errorDetails = null;
             try { errorDetails = await response.json(); } catch (_) {}
 
@@ -257,8 +256,7 @@ async function sendMessageToBackend(message, allowRetry = true) {
             throw new Error(`Server error: ${response.status}`);
         }
         
-        const data = await response.json();
-        appendBotMessage(data.response);
+        await readChatStream(response, typingIndicator);
         
     } catch (error) {
         typingIndicator.remove();
@@ -273,6 +271,52 @@ async function sendMessageToBackend(message, allowRetry = true) {
     }
 }
 
+// Đọc SSE từ /api/chat/stream: hiện dần từng đoạn text vào 1 bong bóng chat
+async function readChatStream(response, typingIndicator) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let fullText = '';
+    let bubble = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Mỗi sự kiện SSE kết thúc bằng 1 dòng trống
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+
+        for (const evt of events) {
+            const dataLine = evt.split('\n').find(line => line.startsWith('data: '));
+            if (!dataLine || evt.startsWith('event: done')) continue;
+
+            const payload = JSON.parse(dataLine.slice(6));
+            if (!payload.token) continue;
+
+            if (!bubble) {
+                typingIndicator.remove();
+                const botMessage = document.createElement('div');
+                botMessage.className = 'bot-message';
+                botMessage.innerHTML = `
+                    <div class="bot-avatar"><img src="../static/image/logo.jpg" alt="bot-avatar"></div>
+                    <div class="message-bubble"></div>
+                `;
+                chatContainer.appendChild(botMessage);
+                bubble = botMessage.querySelector('.message-bubble');
+            }
+            fullText += payload.token;
+            bubble.innerHTML = formatBotResponse(fullText);
+            scrollChatToBottom();
+        }
+    }
+
+    typingIndicator.remove();
+    if (!bubble) throw new Error('Empty response');
+    persistMessage('bot', fullText);
+}
+
 // Khởi tạo
 initSession().then(() => {
     sendAutoPrompt();